@@ -0,0 +1,889 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+In process stand-in for the docker engine api, served on a unix socket.
+
+Implements the endpoints dockerobject uses (version, images, pull, commit, create, start, wait,
+inspect, logs, attach, exec, stop, kill, remove, list, events) with injected latency. containers do not
+run anything: a container with a command exits run_time seconds after it starts (postgres,
+mysql and nginx servers run until they are stopped), and every port
+binding of a running container gets a real tcp listener on localhost that answers like the image
+would (a postgres authentication request, a mysql handshake or an http 200), ready_delay seconds
+after the start. like docker, removing an image that a container uses is a conflict (409).
+
+execs emulate the commands the dump paths run: mysql and psql (and pg_restore) with a dump on
+stdin append it to the container's database, mysqldump and pg_dump write it out, files copied in
+with cat or tar are kept until rm removes them. a committed image keeps the database and files.
+like docker, an exec is still running for a moment after its output ended. exec_handler(container,
+command, stdin) can emulate other commands, returning (exit code, stdout, stderr) or None.
+
+    daemon = FakeDaemon(latency=0.002).start()
+    set_client(PooledClient(base_url=daemon.base_url))
+"""
+
+from collections import defaultdict
+import json
+import os
+import re
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import urlsplit, parse_qs, unquote
+    from queue import Queue, Empty
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import urlsplit, parse_qs
+    from urllib import unquote
+    from Queue import Queue, Empty
+
+API_VERSION = '1.24'
+
+# exposed ports of the images the fake daemon knows about
+EXPOSED_PORTS = {
+    'postgres' : ['5432/tcp'],
+    'mysql' : ['3306/tcp'],
+    'nginx' : ['80/tcp', '443/tcp'],
+}
+
+def _postgres(conn):
+    # AuthenticationOk, whatever the startup message was
+    conn.recv(1024)
+    conn.sendall(b'R' + struct.pack('!ii', 8, 0))
+
+def _mysql(conn):
+    payload = b'\x0a' + b'5.7.0-fake\0' + struct.pack('<I', 1) + b'\0' * 24
+    conn.sendall(struct.pack('<I', len(payload))[:3] + b'\0' + payload)
+
+def _http(conn):
+    body = b'fake'
+    response = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\nContent-Type: text/plain\r\n\r\n' % len(body) + body
+    data = b''
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return
+        data += chunk
+        # keep-alive, one response per request head
+        while b'\r\n\r\n' in data:
+            head, data = data.split(b'\r\n\r\n', 1)
+            conn.sendall(response)
+
+# image -> the server command, containers that run anything else exit
+SERVERS = {
+    'postgres' : 'postgres',
+    'mysql' : 'mysqld',
+    'nginx' : 'nginx',
+}
+
+# container port -> how the listener answers
+PROTOCOLS = {
+    '5432/tcp' : _postgres,
+    '3306/tcp' : _mysql,
+    '80/tcp' : _http,
+}
+
+def _frame(stream, data):
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+def _port_key(port):
+    port = str(port)
+    return port if '/' in port else port + '/tcp'
+
+class FakeListener(object):
+    """
+    Tcp listener standing in for a published container port.
+    """
+
+    def __init__(self, protocol, ready_delay = 0):
+        self.protocol = protocol
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # bound right away so the port can be reported, but connections are refused until ready
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.__closed = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, args=(ready_delay,))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __run(self, ready_delay):
+        if self.__closed.wait(ready_delay):
+            return
+        try:
+            self.sock.listen(128)
+        except socket.error:
+            # closed meanwhile
+            return
+        while not self.__closed.is_set():
+            try:
+                conn, address = self.sock.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self.__serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def __serve(self, conn):
+        try:
+            if self.protocol is not None:
+                self.protocol(conn)
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.__closed.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+class FakeContainer(object):
+
+    def __init__(self, container_id, name, config, base_repo = None):
+        self.id = container_id
+        # the repo of the image a committed image came from
+        self.base_repo = base_repo
+        self.name = name
+        self.config = config
+        self.host_config = config.get('HostConfig') or {}
+        self.created = time.time()
+        self.running = False
+        self.exit_code = 0
+        self.started_at = None
+        self.ip = None
+        self.listeners = {}
+        self.exited = threading.Event()
+        self.timer = None
+        # what execs loaded into the database, and files copied into the container
+        self.database = b''
+        self.files = {}
+
+    def image(self):
+        return self.config.get('Image', '')
+
+    def repo(self):
+        if self.base_repo:
+            return self.base_repo
+        return self.image().rsplit(':', 1)[0].split('/')[-1]
+
+    def is_server(self):
+        # runs the image's server, with the default command or with settings
+        command = self.config.get('Cmd')
+        return not command or command[0] == SERVERS.get(self.repo())
+
+    def ports(self):
+        ports = {}
+        for key in self.config.get('ExposedPorts') or {}:
+            ports[key] = None
+        for key, listener in self.listeners.items():
+            ports[key] = [{'HostIp' : '0.0.0.0', 'HostPort' : str(listener.port)}]
+        return ports
+
+    def inspect(self):
+        status = 'running' if self.running else ('exited' if self.started_at else 'created')
+        return {
+            'Id' : self.id,
+            'Name' : '/' + self.name,
+            'Image' : self.image(),
+            'Created' : self.created,
+            'Config' : {
+                'Hostname' : self.config.get('Hostname') or self.id[:12],
+                'Image' : self.image(),
+                'Env' : self.config.get('Env') or [],
+                'Cmd' : self.config.get('Cmd'),
+                'Labels' : self.config.get('Labels') or {},
+                'ExposedPorts' : self.config.get('ExposedPorts') or {},
+            },
+            'State' : {
+                'Status' : status,
+                'Running' : self.running,
+                'ExitCode' : self.exit_code,
+                'OOMKilled' : False,
+            },
+            'HostConfig' : self.host_config,
+            'NetworkSettings' : {
+                'IPAddress' : self.ip or '',
+                'Ports' : self.ports(),
+            },
+        }
+
+    def summary(self):
+        return {
+            'Id' : self.id,
+            'Names' : ['/' + self.name],
+            'Image' : self.image(),
+            'Command' : ' '.join(self.config.get('Cmd') or []),
+            'Created' : int(self.created),
+            'Labels' : self.config.get('Labels') or {},
+            'State' : 'running' if self.running else 'exited',
+            'Status' : 'Up' if self.running else 'Exited (%d)' % self.exit_code,
+        }
+
+    def sql_option(self, command):
+        # the statement of mysql -e or psql -c
+        for option in ('-e', '-c'):
+            if option in command[1:-1]:
+                return command[command.index(option) + 1]
+        return None
+
+    def output(self):
+        # what the container "printed"
+        command = ' '.join(self.config.get('Cmd') or [self.image()])
+        return _frame(1, ('fake output of %s\n' % command).encode('utf-8'))
+
+class FakeExec(object):
+
+    def __init__(self, exec_id, container, config):
+        self.id = exec_id
+        self.container = container
+        self.config = config
+        self.running = False
+        self.exit_code = None
+
+    def inspect(self):
+        return {
+            'ID' : self.id,
+            'ContainerID' : self.container.id,
+            'Running' : self.running,
+            'ExitCode' : self.exit_code,
+            'ProcessConfig' : {'entrypoint' : self.config['Cmd'][0], 'arguments' : self.config['Cmd'][1:]},
+        }
+
+class _Server(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+class FakeDaemon(object):
+    """
+    latency is added to every api call, pull_time to every pull. a container with a command exits
+    with exit_code run_time seconds after it starts, unless it is a server; the ports of a container accept connections
+    ready_delay seconds after it starts.
+    """
+
+    def __init__(self, latency = 0.0, pull_time = 0.0, ready_delay = 0.0, run_time = 0.0, exit_code = 0, images = (), path = None, exec_handler = None):
+        self.latency = latency
+        self.exec_handler = exec_handler
+        self.pull_time = pull_time
+        self.ready_delay = ready_delay
+        self.run_time = run_time
+        self.exit_code = exit_code
+        self.__tmpdir = None
+        if path is None:
+            self.__tmpdir = tempfile.mkdtemp(prefix='dockerobject-fake-')
+            path = os.path.join(self.__tmpdir, 'docker.sock')
+        self.path = path
+        self.base_url = 'unix://' + path
+        self.lock = threading.Lock()
+        self.images = {}
+        # committed image id -> repo of the container it was committed from
+        self.bases = {}
+        # committed image id -> (database, files) of the container it was committed from
+        self.layers = {}
+        self.containers = {}
+        self.execs = {}
+        self.events = []
+        self.subscribers = []
+        self.closed = threading.Event()
+        # (method, route) -> number of requests
+        self.requests = defaultdict(int)
+        self.__next_ip = 2
+        for image in images:
+            self.add_image(image)
+        self.__server = None
+        self.__thread = None
+
+    def start(self):
+        daemon = self
+
+        class Handler(_Handler):
+            pass
+        Handler.daemon = daemon
+        self.__server = _Server(self.path, Handler)
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='fake-docker-daemon')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.closed.set()
+        with self.lock:
+            containers = list(self.containers.values())
+        for container in containers:
+            self.__exit(container, 137, publish=False)
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+        if self.__tmpdir is not None:
+            shutil.rmtree(self.__tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type_, value_, tb):
+        self.stop()
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests.clear()
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    # images
+
+    def add_image(self, image):
+        if ':' not in image.split('/')[-1]:
+            image += ':latest'
+        with self.lock:
+            if image not in self.images:
+                self.images[image] = 'sha256:' + uuid.uuid4().hex + uuid.uuid4().hex
+            return self.images[image]
+
+    def find_image(self, name):
+        with self.lock:
+            if name in self.images:
+                return name, self.images[name]
+            if name + ':latest' in self.images:
+                return name + ':latest', self.images[name + ':latest']
+            for repo_tag, image_id in self.images.items():
+                if image_id == name or image_id.startswith('sha256:' + name) or image_id.startswith(name):
+                    return repo_tag, image_id
+        return None, None
+
+    def image_users(self, image_id):
+        """
+        the containers created from image_id.
+        """
+        with self.lock:
+            containers = list(self.containers.values())
+        return [c for c in containers if self.find_image(c.image())[1] == image_id]
+
+    def inspect_image(self, name):
+        repo_tag, image_id = self.find_image(name)
+        if image_id is None:
+            return None
+        repo = repo_tag.rsplit(':', 1)[0].split('/')[-1]
+        return {
+            'Id' : image_id,
+            'RepoTags' : [repo_tag],
+            'Config' : {'ExposedPorts' : dict((p, {}) for p in EXPOSED_PORTS.get(repo, []))},
+        }
+
+    # containers
+
+    def find_container(self, name):
+        with self.lock:
+            if name in self.containers:
+                return self.containers[name]
+            for container in self.containers.values():
+                if container.id.startswith(name) or container.name == name.lstrip('/'):
+                    return container
+        return None
+
+    def create(self, config, name = None):
+        repo_tag, image_id = self.find_image(config.get('Image', ''))
+        if image_id is None:
+            return None
+        container_id = uuid.uuid4().hex + uuid.uuid4().hex
+        with self.lock:
+            base_repo = self.bases.get(image_id)
+            layer = self.layers.get(image_id)
+        container = FakeContainer(container_id, name or 'fake_%s' % container_id[:8], config, base_repo)
+        if layer is not None:
+            container.database, container.files = layer[0], dict(layer[1])
+        with self.lock:
+            self.containers[container_id] = container
+        self.publish(container, 'create')
+        return container
+
+    def start_container(self, container, host_config):
+        if container.running:
+            return
+        if host_config:
+            container.host_config.update(host_config)
+        with self.lock:
+            container.ip = '172.17.%d.%d' % (self.__next_ip // 250, self.__next_ip % 250 + 2)
+            self.__next_ip += 1
+        for key in container.host_config.get('PortBindings') or {}:
+            key = _port_key(key)
+            if key in container.listeners:
+                continue
+            protocol = PROTOCOLS.get(key) if container.repo() in EXPOSED_PORTS else None
+            container.listeners[key] = FakeListener(protocol, self.ready_delay)
+        container.running = True
+        container.exit_code = 0
+        container.started_at = time.time()
+        container.exited.clear()
+        self.publish(container, 'start')
+        if not container.is_server():
+            container.timer = threading.Timer(self.run_time, self.__exit, (container, self.exit_code))
+            container.timer.daemon = True
+            container.timer.start()
+
+    def __exit(self, container, exit_code, publish = True):
+        with self.lock:
+            if not container.running:
+                return
+            container.running = False
+        if container.timer is not None:
+            container.timer.cancel()
+            container.timer = None
+        for listener in container.listeners.values():
+            listener.close()
+        container.listeners = {}
+        container.exit_code = exit_code
+        if publish:
+            self.publish(container, 'die', {'exitCode' : str(exit_code)})
+        container.exited.set()
+
+    def stop_container(self, container, exit_code = 0):
+        self.__exit(container, exit_code)
+        self.publish(container, 'stop')
+
+    def remove_container(self, container):
+        self.__exit(container, 137)
+        with self.lock:
+            self.containers.pop(container.id, None)
+        self.publish(container, 'destroy')
+
+    def commit(self, container, repo, tag):
+        image = '%s:%s' % (repo, tag or 'latest')
+        with self.lock:
+            image_id = self.images[image] = 'sha256:' + uuid.uuid4().hex + uuid.uuid4().hex
+            self.bases[image_id] = container.repo()
+            self.layers[image_id] = (container.database, dict(container.files))
+        return image_id
+
+    # execs
+
+    def create_exec(self, container, config):
+        execution = FakeExec(uuid.uuid4().hex + uuid.uuid4().hex, container, config)
+        with self.lock:
+            self.execs[execution.id] = execution
+        return execution
+
+    def run_exec(self, execution, stdin):
+        """
+        run the command of execution. returns (exit code, stdout, stderr).
+        """
+        container = execution.container
+        command = execution.config['Cmd']
+        if self.exec_handler is not None:
+            result = self.exec_handler(container, command, stdin)
+            if result is not None:
+                return result
+        name = command[0].rsplit('/', 1)[-1]
+        if name in ('sh', 'bash') and command[1:2] == ['-c']:
+            match = re.match(r'^(?:mkdir -p "[^"]+" && exec tar -C|exec cat >) "([^"]+)"', command[2])
+            if match is None:
+                return 127, b'', ('%s: unsupported script: %s\n' % (name, command[2])).encode('utf-8')
+            container.files[match.group(1)] = stdin
+            return 0, b'', b''
+        if name == 'true':
+            return 0, b'', b''
+        if name == 'false':
+            return 1, b'', b''
+        if name == 'echo':
+            return 0, (' '.join(command[1:]) + '\n').encode('utf-8'), b''
+        if name == 'nproc':
+            return 0, b'4\n', b''
+        if name == 'rm':
+            for path in command[1:]:
+                container.files.pop(path, None)
+            return 0, b'', b''
+        if name in ('mysql', 'psql'):
+            sql = container.sql_option(command)
+            if sql is None:
+                container.database += stdin
+                return 0, b'', b''
+            if 'secure_file_priv' in sql:
+                return 0, b'/var/lib/mysql-files/\n', b''
+            return 0, b'', b''
+        if name == 'pg_restore':
+            path = command[-1]
+            if not stdin and path not in container.files:
+                return 1, b'', ('pg_restore: could not open input file "%s"\n' % path).encode('utf-8')
+            container.database += stdin or container.files[path]
+            return 0, b'', b''
+        if name in ('mysqldump', 'pg_dump'):
+            return 0, container.database, b''
+        return 127, b'', ('exec: "%s": executable file not found in $PATH\n' % name).encode('utf-8')
+
+    def finish_exec(self, execution, exit_code):
+        # docker reports the exit code a moment after the output ended
+        def finish():
+            execution.exit_code = exit_code
+            execution.running = False
+        timer = threading.Timer(0.01, finish)
+        timer.daemon = True
+        timer.start()
+
+    # events
+
+    def publish(self, container, status, attributes = None):
+        now = time.time()
+        event = {
+            'status' : status, 'id' : container.id, 'from' : container.image(),
+            'Type' : 'container', 'Action' : status,
+            'Actor' : {'ID' : container.id, 'Attributes' : attributes or {}},
+            'time' : int(now), 'timeNano' : int(now * 1e9),
+        }
+        with self.lock:
+            self.events.append(event)
+            subscribers = list(self.subscribers)
+        for queue in subscribers:
+            queue.put(event)
+
+    def subscribe(self, since = None):
+        queue = Queue()
+        with self.lock:
+            if since is not None:
+                for event in self.events:
+                    if event['time'] >= since:
+                        queue.put(event)
+            self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            if queue in self.subscribers:
+                self.subscribers.remove(queue)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    daemon = None
+
+    ROUTES = [
+        ('GET', r'/version$', 'version'),
+        ('GET', r'/_ping$', 'ping'),
+        ('GET', r'/images/json$', 'images'),
+        ('POST', r'/images/create$', 'pull'),
+        ('GET', r'/images/(?P<name>.+)/json$', 'inspect_image'),
+        ('DELETE', r'/images/(?P<name>.+)$', 'remove_image'),
+        ('POST', r'/commit$', 'commit'),
+        ('GET', r'/containers/json$', 'containers'),
+        ('POST', r'/containers/create$', 'create'),
+        ('POST', r'/containers/(?P<id>[^/]+)/start$', 'start'),
+        ('POST', r'/containers/(?P<id>[^/]+)/wait$', 'wait'),
+        ('GET', r'/containers/(?P<id>[^/]+)/json$', 'inspect'),
+        ('GET', r'/containers/(?P<id>[^/]+)/logs$', 'logs'),
+        ('POST', r'/containers/(?P<id>[^/]+)/attach$', 'attach'),
+        ('POST', r'/containers/(?P<id>[^/]+)/exec$', 'exec_create'),
+        ('POST', r'/exec/(?P<id>[^/]+)/start$', 'exec_start'),
+        ('GET', r'/exec/(?P<id>[^/]+)/json$', 'exec_inspect'),
+        ('POST', r'/containers/(?P<id>[^/]+)/stop$', 'stop'),
+        ('POST', r'/containers/(?P<id>[^/]+)/kill$', 'kill'),
+        ('DELETE', r'/containers/(?P<id>[^/]+)$', 'remove'),
+        ('GET', r'/events$', 'events'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        self.query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.body = json.loads(body.decode('utf-8')) if body else None
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                with self.daemon.lock:
+                    self.daemon.requests[(method, name)] += 1
+                if self.daemon.latency:
+                    time.sleep(self.daemon.latency)
+                args = dict((k, unquote(v)) for k, v in match.groupdict().items())
+                return getattr(self, 'handle_' + name)(**args)
+        self.send_json({'message' : 'page not found'}, 404)
+
+    def send_json(self, data, status = 200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status = 204):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_raw(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self, what):
+        self.send_json({'message' : 'No such %s' % what}, 404)
+
+    def container(self, container_id):
+        container = self.daemon.find_container(container_id)
+        if container is None:
+            self.not_found('container: %s' % container_id)
+        return container
+
+    def handle_version(self):
+        self.send_json({'ApiVersion' : API_VERSION, 'Version' : '1.12.0-fake', 'Os' : 'linux', 'Arch' : 'amd64'})
+
+    def handle_ping(self):
+        body = b'OK'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_images(self):
+        with self.daemon.lock:
+            images = defaultdict(list)
+            for repo_tag, image_id in self.daemon.images.items():
+                images[image_id].append(repo_tag)
+        self.send_json([{'Id' : image_id, 'RepoTags' : tags} for image_id, tags in images.items()])
+
+    def handle_pull(self):
+        image = self.query.get('fromImage', '')
+        tag = self.query.get('tag') or 'latest'
+        if self.daemon.pull_time:
+            time.sleep(self.daemon.pull_time)
+        self.daemon.add_image('%s:%s' % (image, tag))
+        status = [{'status' : 'Pulling from %s' % image, 'id' : tag},
+                  {'status' : 'Status: Downloaded newer image for %s:%s' % (image, tag)}]
+        body = ''.join(json.dumps(s) + '\r\n' for s in status).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_inspect_image(self, name):
+        image = self.daemon.inspect_image(name)
+        if image is None:
+            return self.not_found('image: %s' % name)
+        self.send_json(image)
+
+    def handle_remove_image(self, name):
+        repo_tag, image_id = self.daemon.find_image(name)
+        if image_id is None:
+            return self.not_found('image: %s' % name)
+        # like docker, an image that a running container uses is kept even with force
+        users = self.daemon.image_users(image_id)
+        running = [c for c in users if c.running]
+        if running or (users and self.query.get('force') not in ('1', 'True', 'true')):
+            user = (running or users)[0]
+            return self.send_json({'message' : 'conflict: unable to delete %s - image is being used by %s container %s' % (
+                image_id[len('sha256:'):][:12], 'running' if running else 'stopped', user.id[:12])}, 409)
+        with self.daemon.lock:
+            for key in [k for k, v in self.daemon.images.items() if v == image_id]:
+                del self.daemon.images[key]
+        self.send_json([{'Deleted' : image_id}])
+
+    def handle_commit(self):
+        container = self.container(self.query.get('container', ''))
+        if container is None:
+            return
+        image_id = self.daemon.commit(container, self.query.get('repo'), self.query.get('tag'))
+        self.send_json({'Id' : image_id}, 201)
+
+    def handle_containers(self):
+        show_all = self.query.get('all') in ('1', 'True', 'true')
+        filters = json.loads(self.query.get('filters') or '{}')
+        labels = filters.get('label') or []
+        with self.daemon.lock:
+            containers = list(self.daemon.containers.values())
+        result = []
+        for container in containers:
+            if not show_all and not container.running:
+                continue
+            container_labels = container.config.get('Labels') or {}
+            matches = True
+            for label in labels:
+                key, sep, value = label.partition('=')
+                if key not in container_labels or (sep and container_labels[key] != value):
+                    matches = False
+            if matches:
+                result.append(container.summary())
+        self.send_json(result)
+
+    def handle_create(self):
+        container = self.daemon.create(self.body or {}, self.query.get('name'))
+        if container is None:
+            return self.not_found('image: %s' % (self.body or {}).get('Image'))
+        self.send_json({'Id' : container.id, 'Warnings' : None}, 201)
+
+    def handle_start(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        if container.running:
+            return self.send_empty(304)
+        self.daemon.start_container(container, self.body)
+        self.send_empty()
+
+    def handle_wait(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        while not container.exited.wait(1):
+            if self.daemon.closed.is_set():
+                break
+        self.send_json({'StatusCode' : container.exit_code})
+
+    def handle_inspect(self, id):
+        container = self.container(id)
+        if container is not None:
+            self.send_json(container.inspect())
+
+    def handle_logs(self, id):
+        container = self.container(id)
+        if container is not None:
+            self.send_raw(container.output() if container.started_at else b'')
+
+    def handle_attach(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        # docker-py reads attach output from the raw socket, so the body goes out after the headers
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+        self.end_headers()
+        self.wfile.flush()
+        time.sleep(0.05)
+        if self.query.get('logs') in ('1', 'True', 'true') and container.started_at:
+            self.wfile.write(container.output())
+        self.close_connection = True
+
+    def handle_exec_create(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        if not container.running:
+            return self.send_json({'message' : 'Container %s is not running' % id}, 409)
+        execution = self.daemon.create_exec(container, self.body or {})
+        self.send_json({'Id' : execution.id}, 201)
+
+    def handle_exec_start(self, id):
+        execution = self.daemon.execs.get(id)
+        if execution is None:
+            return self.not_found('exec instance: %s' % id)
+        execution.running = True
+        # like attach, docker-py reads the output from the raw socket after the headers
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+        self.end_headers()
+        self.wfile.flush()
+        stdin = b''
+        if execution.config.get('AttachStdin'):
+            # until the client shuts down its side
+            stdin = self.rfile.read()
+        else:
+            time.sleep(0.05)
+        exit_code, stdout, stderr = self.daemon.run_exec(execution, stdin)
+        try:
+            if stdout:
+                self.wfile.write(_frame(1, stdout))
+            if stderr:
+                self.wfile.write(_frame(2, stderr))
+            self.wfile.flush()
+        except socket.error:
+            pass
+        finally:
+            self.daemon.finish_exec(execution, exit_code)
+        self.close_connection = True
+
+    def handle_exec_inspect(self, id):
+        execution = self.daemon.execs.get(id)
+        if execution is None:
+            return self.not_found('exec instance: %s' % id)
+        self.send_json(execution.inspect())
+
+    def handle_stop(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        if not container.running:
+            return self.send_empty(304)
+        self.daemon.stop_container(container, 0)
+        self.send_empty()
+
+    def handle_kill(self, id):
+        container = self.container(id)
+        if container is not None:
+            self.daemon.stop_container(container, 137)
+            self.send_empty()
+
+    def handle_remove(self, id):
+        container = self.container(id)
+        if container is None:
+            return
+        if container.running and self.query.get('force') not in ('1', 'True', 'true'):
+            return self.send_json({'message' : 'container is running'}, 409)
+        self.daemon.remove_container(container)
+        self.send_empty()
+
+    def handle_events(self):
+        since = self.query.get('since')
+        until = self.query.get('until')
+        until = float(until) if until else None
+        queue = self.daemon.subscribe(int(float(since)) if since else None)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            # like docker, the stream ends at until
+            while not self.daemon.closed.is_set() and (until is None or time.time() < until):
+                try:
+                    event = queue.get(timeout=0.5 if until is None else max(0, min(0.5, until - time.time())))
+                except Empty:
+                    continue
+                if until is not None and event['time'] > until:
+                    break
+                data = (json.dumps(event) + '\n').encode('utf-8')
+                self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+            if not self.daemon.closed.is_set():
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+        except socket.error:
+            pass
+        finally:
+            self.daemon.unsubscribe(queue)
+        self.close_connection = True
@@ -0,0 +1,175 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Container lifecycle benchmarks against the fake docker daemon.
+
+Every operation creates, starts, waits for and destroys one object. reports throughput,
+latency percentiles and docker api calls per operation for every scenario and concurrency.
+
+    python -m benchmarks.lifecycle
+    python -m benchmarks.lifecycle --latency 0.005 --concurrency 1,8,32 --scenario postgres
+    python -m benchmarks.lifecycle --json results.json
+"""
+
+from dockerobject import DockerObject, RunCommandHelper, PooledClient, set_client
+from dockerobject.db import Postgres, MySql, PostgresHelper
+from dockerobject.web import Nginx
+from dockerobject.metrics import get_metrics
+from multiprocessing.pool import ThreadPool
+from .fakedaemon import FakeDaemon
+import argparse
+import json
+import time
+
+def run_container():
+    obj = DockerObject('busybox')
+    obj.set_command(['true'])
+    obj.start(wait=False)
+    obj.wait(60)
+    obj.destroy()
+
+def run_postgres():
+    obj = Postgres()
+    obj.start()
+    obj.get_connection_params()
+    obj.destroy()
+
+def run_mysql():
+    obj = MySql()
+    obj.start()
+    obj.get_connection_params()
+    obj.destroy()
+
+def run_nginx():
+    obj = Nginx()
+    obj.start()
+    obj.get_url()
+    obj.destroy()
+
+def run_linked():
+    # an internal container that must be ready before the one linking to it starts
+    obj = Nginx()
+    obj.add_link('backend', Nginx(), internal=True)
+    obj.start()
+    obj.get_url()
+    obj.destroy()
+
+def run_helper():
+    helper = RunCommandHelper(['true'])
+    helper.start()
+    helper.wait(60)
+    helper.destroy()
+
+def run_postgres_helper():
+    postgres = Postgres()
+    postgres.start()
+    helper = PostgresHelper(postgres, ['psql', '-c', 'select 1'])
+    helper.start()
+    helper.wait(60)
+    helper.destroy()
+    postgres.destroy()
+
+SCENARIOS = [
+    ('container', run_container),
+    ('postgres', run_postgres),
+    ('mysql', run_mysql),
+    ('nginx', run_nginx),
+    ('linked', run_linked),
+    ('helper', run_helper),
+    ('postgres-helper', run_postgres_helper),
+]
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+def api_calls():
+    return sum(item['count'] for item in get_metrics().to_dict()['api_calls'])
+
+def measure(operation, concurrency, iterations, daemon):
+    """
+    run concurrency * iterations operations on concurrency threads.
+    """
+    def timed(i):
+        start = time.time()
+        operation()
+        return time.time() - start
+
+    # warm up: pull the images and connect the events monitor
+    operation()
+    get_metrics().reset()
+    daemon.reset_counts()
+    count = concurrency * iterations
+    pool = ThreadPool(concurrency)
+    start = time.time()
+    try:
+        latencies = pool.map(timed, range(count))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+    return {
+        'operations' : count,
+        'seconds' : elapsed,
+        'throughput' : count / elapsed,
+        'p50' : percentile(latencies, 50),
+        'p95' : percentile(latencies, 95),
+        'p99' : percentile(latencies, 99),
+        'max' : max(latencies),
+        'api_calls_per_op' : float(api_calls()) / count,
+        'requests_per_op' : float(daemon.request_count()) / count,
+    }
+
+def report(results):
+    print('%-16s %5s %8s %9s %9s %9s %9s %9s %9s' % ('scenario', 'conc', 'ops', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'api/op', 'req/op'))
+    for r in results:
+        print('%-16s %5d %8d %9.1f %9.2f %9.2f %9.2f %9.1f %9.1f' % (
+            r['scenario'], r['concurrency'], r['operations'], r['throughput'],
+            r['p50'] * 1000, r['p95'] * 1000, r['p99'] * 1000, r['api_calls_per_op'], r['requests_per_op']))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.lifecycle', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenario', action='append', choices=[name for name, _ in SCENARIOS], help='scenario to run (default: all)')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated concurrency levels (default: 1,4,16)')
+    parser.add_argument('--iterations', type=int, default=10, help='operations per thread (default: 10)')
+    parser.add_argument('--latency', type=float, default=0.001, help='seconds added to every api call (default: 0.001)')
+    parser.add_argument('--pull-time', type=float, default=0.0, help='seconds every image pull takes')
+    parser.add_argument('--ready-delay', type=float, default=0.0, help='seconds until the ports of a started container accept connections')
+    parser.add_argument('--run-time', type=float, default=0.0, help='seconds a container with a command runs')
+    parser.add_argument('--pool-size', type=int, default=32, help='docker client connection pool size (default: 32)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    scenarios = [(name, op) for name, op in SCENARIOS if not args.scenario or name in args.scenario]
+    levels = [int(c) for c in args.concurrency.split(',')]
+    results = []
+    with FakeDaemon(latency=args.latency, pull_time=args.pull_time, ready_delay=args.ready_delay, run_time=args.run_time) as daemon:
+        set_client(PooledClient(base_url=daemon.base_url, pool_size=args.pool_size))
+        for name, operation in scenarios:
+            for concurrency in levels:
+                result = measure(operation, concurrency, args.iterations, daemon)
+                result.update({'scenario' : name, 'concurrency' : concurrency})
+                results.append(result)
+        set_client(None)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args' : vars(args), 'results' : results}, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
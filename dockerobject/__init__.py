@@ -11,3 +11,4 @@
 # limitations under the License.
 
 from .dockerobject import DockerObject, LOGGER, RunCommandHelper
+from .client import PooledClient, get_client, set_client
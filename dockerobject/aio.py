@@ -0,0 +1,277 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+asyncio counterparts of the DockerObject classes (python 3 only).
+
+Docker api calls are short and run on a small shared executor; readiness checks, which take
+most of the time, run on the event loop with non-blocking sockets. one event loop can drive
+hundreds of containers without a thread per container.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+import asyncio
+import threading
+import time
+
+from .dockerobject import DockerObject
+from .db import DbObject, MySql, Postgres
+from .web import WebObject, Nginx
+from .events import get_monitor
+from .probes import TcpProbe, HttpProbe, DEFAULT_TIMEOUT, INITIAL_DELAY, MAX_DELAY
+from .scheduler import collect, dependencies, needs_readiness
+
+DEFAULT_WORKERS = 16
+
+_lock = threading.Lock()
+_executor = None
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS, thread_name_prefix='dockerobject-aio')
+        return _executor
+
+async def run_blocking(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), partial(func, *args, **kwargs))
+
+async def _check_tcp(probe):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(probe.host, probe.port), probe.timeout)
+    try:
+        if probe.payload is not None:
+            writer.write(probe.payload)
+            await writer.drain()
+        data = None
+        if probe.expects_response:
+            data = await asyncio.wait_for(reader.read(1024), probe.timeout)
+            if not data:
+                return False
+        return probe.accept(data)
+    finally:
+        writer.close()
+
+async def _check_http(probe):
+    url = urlsplit(probe.url)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(url.hostname, url.port or 80), probe.timeout)
+    try:
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        request = 'GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n' % (path, url.netloc)
+        writer.write(request.encode('ascii'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), probe.timeout)
+        return int(status_line.split()[1]) == probe.status
+    finally:
+        writer.close()
+
+async def check(probe):
+    """
+    non-blocking probe.check(). probes without an async implementation run on the executor.
+    """
+    try:
+        if isinstance(probe, TcpProbe):
+            return await _check_tcp(probe)
+        if isinstance(probe, HttpProbe):
+            return await _check_http(probe)
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        return False
+    return await run_blocking(probe.check)
+
+async def wait_until_ready(probe, timeout = DEFAULT_TIMEOUT, initial_delay = INITIAL_DELAY, max_delay = MAX_DELAY, stopped = None):
+    """
+    async probes.wait_until_ready.
+    """
+    start = time.time()
+    deadline = start + timeout
+    delay = initial_delay
+    while True:
+        if await check(probe):
+            return time.time() - start
+        if stopped is not None and stopped.is_set():
+            raise RuntimeError('Container stopped while waiting for %s' % probe)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise RuntimeError('Timeout waiting for %s' % probe)
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+# wait_for_container implementations that only wait on get_readiness_probe()
+_PROBE_WAITS = (DockerObject.wait_for_container, WebObject.wait_for_container)
+
+async def wait_for_container(obj, timeout = None):
+    """
+    async obj.wait_for_container(). objects that override it (e.g. helpers) run it on the executor.
+    """
+    if type(obj).wait_for_container not in _PROBE_WAITS:
+        return await run_blocking(obj.wait_for_container)
+    if timeout is None:
+        timeout = obj.readiness_timeout
+    probe = await run_blocking(obj.get_readiness_probe)
+    monitor = get_monitor(obj.client)
+    stopped = monitor.waiter(obj.get_container(), ('die', 'oom'))
+    try:
+        # recorded like the sync wait_for_probe
+        with obj.phase('readiness'):
+            obj.ready_time = await wait_until_ready(probe, timeout, stopped=stopped)
+    finally:
+        monitor.cancel(obj.get_container(), stopped)
+    obj.logger.debug('Container %s ready after %.3f seconds', obj.repo, obj.ready_time)
+    await run_blocking(obj.on_ready)
+
+def _blocking(name):
+    async def method(self, *args, **kwargs):
+        return await run_blocking(getattr(self.obj, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = 'async %s, runs on the executor.' % name
+    return method
+
+class AsyncDockerObject(object):
+    """
+    Async wrapper of a DockerObject. configuration and accessors are forwarded to the wrapped
+    object (self.obj), lifecycle methods are awaitable.
+    """
+    sync_class = DockerObject
+
+    def __init__(self, *args, **kwargs):
+        self.obj = self.sync_class(*args, **kwargs)
+
+    @classmethod
+    def wrap(cls, obj):
+        self = cls.__new__(cls)
+        self.obj = obj
+        return self
+
+    def __getattr__(self, name):
+        if name == 'obj':
+            raise AttributeError(name)
+        return getattr(self.obj, name)
+
+    create = _blocking('create')
+    destroy = _blocking('destroy')
+    stop = _blocking('stop')
+    refresh = _blocking('refresh')
+    execute = _blocking('execute')
+    snapshot = _blocking('snapshot')
+    restore = _blocking('restore')
+
+    async def wait_for_container(self, timeout = None):
+        await wait_for_container(self.obj, timeout)
+
+    async def start(self, wait = True):
+        """
+        create and start the container and its internal containers, concurrently where links allow.
+        """
+        nodes = collect([self.obj])
+        needs_ready = needs_readiness(nodes, wait)
+        created = dict((id(n), asyncio.Event()) for n in nodes)
+        started = dict((id(n), asyncio.Event()) for n in nodes)
+        ready = dict((id(n), asyncio.Event()) for n in nodes)
+
+        async def run(node):
+            deps = dependencies(node, nodes)
+            # links are set at create time
+            for dep, needs in deps:
+                await created[id(dep)].wait()
+            if node.should_create():
+                await run_blocking(node.create_container)
+            created[id(node)].set()
+            for dep, needs in deps:
+                await (ready if needs else started)[id(dep)].wait()
+            await run_blocking(node.start_container)
+            node.exit_code = None
+            started[id(node)].set()
+            if id(node) in needs_ready and not node.reused:
+                await wait_for_container(node)
+            ready[id(node)].set()
+
+        tasks = [asyncio.ensure_future(run(n)) for n in nodes]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def wait(self, timeout = None):
+        """
+        wait for the container to end and return its exit code, without blocking a thread.
+        """
+        obj = self.obj
+        if obj.exit_code is not None:
+            return obj.exit_code
+        monitor = get_monitor(obj.client)
+        if not await run_blocking(monitor.is_connected):
+            return await run_blocking(obj.wait, timeout)
+        loop = asyncio.get_running_loop()
+        died = loop.create_future()
+
+        def fire(event):
+            loop.call_soon_threadsafe(lambda: died.done() or died.set_result(event))
+        waiter = obj.exit_waiter()
+        waiter.add_callback(fire)
+        try:
+            state = await run_blocking(obj.refresh)
+            if state['State']['Running']:
+                try:
+                    await asyncio.wait_for(died, timeout)
+                except asyncio.TimeoutError:
+                    raise RuntimeError('Timeout waiting for container %s to end' % obj.get_container())
+        finally:
+            monitor.cancel(obj.get_container(), waiter)
+        obj.exit_code = (await run_blocking(obj.refresh))['State']['ExitCode']
+        return obj.exit_code
+
+    async def __aenter__(self):
+        await self.create()
+        return self
+
+    async def __aexit__(self, type_, value_, tb):
+        await self.destroy()
+
+class AsyncDbObject(AsyncDockerObject):
+    sync_class = DbObject
+
+    upload_dump = _blocking('upload_dump')
+    download_dump = _blocking('download_dump')
+    run_sql = _blocking('run_sql')
+    reset = _blocking('reset')
+
+    async def get_connection_params(self):
+        if self.obj.should_start():
+            await self.start()
+        return await run_blocking(self.obj.get_connection_params)
+
+class AsyncMySql(AsyncDbObject):
+    sync_class = MySql
+
+class AsyncPostgres(AsyncDbObject):
+    sync_class = Postgres
+
+class AsyncWebObject(AsyncDockerObject):
+    sync_class = WebObject
+
+    async def get_url(self):
+        if self.obj.should_start():
+            await self.start(wait=False)
+        return await run_blocking(self.obj.get_url)
+
+    async def wait_for_sever(self, timeout = None):
+        await wait_for_container(self.obj, timeout)
+
+class AsyncNginx(AsyncWebObject):
+    sync_class = Nginx
@@ -0,0 +1,127 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .events import close_monitor
+from docker import Client
+from contextlib import contextmanager
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+DEFAULT_BASE_URL = 'unix://var/run/docker.sock'
+DEFAULT_POOL_SIZE = 10
+# calls that return a stream (or socket) that is read after they return
+STREAM_CALLS = ('events', 'attach_socket', 'export', 'get_archive', 'copy', 'get_image')
+
+def is_stream_call(name, kwargs):
+    # stream and socket are only seen when passed by keyword
+    if name == 'stats':
+        return kwargs.get('stream', True)
+    return name in STREAM_CALLS or kwargs.get('stream') or kwargs.get('socket')
+
+class PooledClient(object):
+    """
+    Thread safe stand-in for docker.Client.
+    Holds up to pool_size clients that share one negotiated api version. each api call
+    checks out a client (and its keep-alive connection) for the duration of the call.
+    calls that return a stream (events, logs(stream=True), exec_start(socket=True)...) get a
+    client of their own instead, as the stream is still read after the call returned.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, version='auto', pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.__lock = threading.Lock()
+        self.__idle = Queue()
+        # the first client negotiates the version, the rest reuse it.
+        client = self.new_client(version)
+        self.api_version = client.api_version
+        self.__created = 1
+        self.__idle.put(client)
+
+    def new_client(self, version=None):
+        """
+        create a client that is not part of the pool. useful for long lived streams (events, logs).
+        """
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        return Client(base_url=self.base_url, version=version or self.api_version, **kwargs)
+
+    def checkout(self):
+        try:
+            return self.__idle.get_nowait()
+        except Empty:
+            pass
+        with self.__lock:
+            create = self.__created < self.pool_size
+            if create:
+                self.__created += 1
+        if create:
+            return self.new_client()
+        return self.__idle.get()
+
+    def checkin(self, client):
+        self.__idle.put(client)
+
+    @contextmanager
+    def client(self):
+        client = self.checkout()
+        try:
+            yield client
+        finally:
+            self.checkin(client)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if not callable(getattr(Client, name, None)):
+            with self.client() as client:
+                return getattr(client, name)
+
+        def call(*args, **kwargs):
+            if is_stream_call(name, kwargs):
+                return getattr(self.new_client(), name)(*args, **kwargs)
+            with self.client() as client:
+                return getattr(client, name)(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+_lock = threading.Lock()
+_client = None
+
+def get_client():
+    """
+    return the process wide client, creating it on first use.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = PooledClient()
+        return _client
+
+def set_client(client):
+    """
+    replace the process wide client. client can be anything that implements the docker.Client api.
+    the events monitor of the replaced client is closed.
+    """
+    global _client
+    with _lock:
+        old, _client = _client, client
+    if old is not None and old is not client:
+        close_monitor(old)
@@ -0,0 +1,95 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Spreads the containers of all the processes of this host over disjoint sets of cpus.
+
+Allocations are kept in a json file guarded by a file lock. every allocation takes the cpus
+with the fewest allocations, so containers share cpus only once all the cpus are taken.
+allocations of processes that died are dropped. the docker daemon is assumed to run on this host.
+"""
+
+from .dockerobject import LOGGER
+from .locks import FileLock, state_path, read_json, write_json, pid_alive
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+
+def host_cpus():
+    """
+    the cpus containers can be pinned to.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+class CpusetAllocator(object):
+
+    def __init__(self, path = None, cpus = None):
+        self.path = path or state_path('cpusets.json')
+        self.cpus = cpus if cpus is not None else host_cpus()
+        self.lock = FileLock(self.path + '.lock')
+        self.logger = logging.getLogger(LOGGER).getChild('cpusets')
+
+    def __load(self):
+        allocations = read_json(self.path, {})
+        return dict((token, a) for token, a in allocations.items() if pid_alive(a['pid']))
+
+    def allocate(self, count):
+        """
+        allocate count cpus. returns (token, cpus), the token releases them.
+        """
+        count = max(1, min(count, len(self.cpus)))
+        with self.lock:
+            allocations = self.__load()
+            load = dict((cpu, 0) for cpu in self.cpus)
+            for allocation in allocations.values():
+                for cpu in allocation['cpus']:
+                    if cpu in load:
+                        load[cpu] += 1
+            # least loaded first, neighbours together
+            cpus = sorted(sorted(self.cpus, key=lambda cpu: load[cpu])[:count])
+            token = uuid.uuid4().hex
+            allocations[token] = {'pid' : os.getpid(), 'cpus' : cpus}
+            write_json(self.path, allocations)
+        self.logger.debug('Allocated cpus %s', cpus)
+        return token, cpus
+
+    def release(self, token):
+        with self.lock:
+            allocations = self.__load()
+            allocations.pop(token, None)
+            write_json(self.path, allocations)
+
+    def allocations(self):
+        """
+        return {token : {'pid', 'cpus'}} of the live allocations.
+        """
+        with self.lock:
+            return self.__load()
+
+def format_cpuset(cpus):
+    return ','.join(str(cpu) for cpu in cpus)
+
+_lock = threading.Lock()
+_allocator = None
+
+def get_cpuset_allocator():
+    global _allocator
+    with _lock:
+        if _allocator is None:
+            _allocator = CpusetAllocator()
+        return _allocator
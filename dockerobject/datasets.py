@@ -0,0 +1,268 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Content addressed cache of database images with a dump already loaded.
+
+The first Postgres(dataset=dump) loads the dump once the server is ready and commits the container
+to a local image, keyed by the sha256 of the dump, the base image and the server config. later
+objects with the same key are created from that image and skip the restore. the least recently
+used images are removed once the cache takes more than max_size bytes.
+
+    python -m dockerobject.datasets list
+    python -m dockerobject.datasets prune [--max-size BYTES | --all]
+"""
+
+from .client import get_client
+from .dockerobject import LOGGER
+from .locks import FileLock, state_path, read_json, write_json
+from .metrics import unwrap
+from docker.errors import APIError
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+DATASET_REPO = 'dockerobject-dataset'
+DEFAULT_MAX_SIZE = 20 * 1024 ** 3
+# seconds the server gets to shut down cleanly before the container is committed
+STOP_TIMEOUT = 60
+HASH_CHUNK = 1024 * 1024
+
+def _files(path):
+    if not os.path.isdir(path):
+        return [(os.path.basename(path), path)]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            files.append((os.path.relpath(full, path), full))
+    return files
+
+def content_hash(path):
+    """
+    sha256 of a dump file, or of the names and contents of the files of a dump directory.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.isdir(path)
+    for name, full in _files(path):
+        if directory:
+            digest.update(name.encode('utf-8') + b'\0')
+        with open(full, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def _signature(path):
+    return [[name, os.stat(full).st_size, os.stat(full).st_mtime] for name, full in _files(path)]
+
+def _daemon(client):
+    return getattr(unwrap(client), 'base_url', None) or 'default'
+
+def _not_found(e):
+    return e.response is not None and e.response.status_code == 404
+
+class DatasetCache(object):
+    """
+    Index of the dataset images (a json file shared by the processes of this host) with lru eviction.
+    """
+
+    def __init__(self, index_path = None, max_size = DEFAULT_MAX_SIZE):
+        self.index_path = index_path or state_path('datasets.json')
+        self.max_size = max_size
+        self.lock = FileLock(self.index_path + '.lock')
+        self.logger = logging.getLogger(LOGGER).getChild('datasets')
+
+    def __load(self):
+        index = read_json(self.index_path, {})
+        index.setdefault('daemons', {})
+        index.setdefault('hashes', {})
+        return index
+
+    def dump_hash(self, path):
+        """
+        return the content hash of the dump at path. hashes are kept by path, size and modification time.
+        """
+        path = os.path.abspath(path)
+        signature = _signature(path)
+        with self.lock:
+            cached = self.__load()['hashes'].get(path)
+        if cached is not None and cached['signature'] == signature:
+            return cached['sha256']
+        digest = content_hash(path)
+        with self.lock:
+            index = self.__load()
+            index['hashes'][path] = {'signature' : signature, 'sha256' : digest}
+            write_json(self.index_path, index)
+        return digest
+
+    def key(self, obj, digest):
+        """
+        return the cache key of loading a dump with content hash digest into obj.
+        """
+        config = {
+            'dump' : digest,
+            'image' : obj.client.inspect_image(obj.image)['Id'],
+            'class' : obj.__class__.__name__,
+            'config' : obj.dataset_config(),
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def lookup(self, client, key):
+        """
+        return the entry of key ({'image', 'state', 'size', ...}), or None.
+        """
+        daemon = _daemon(client)
+        with self.lock:
+            entry = self.__load()['daemons'].get(daemon, {}).get(key)
+        if entry is None:
+            return None
+        try:
+            client.inspect_image(entry['image'])
+        except APIError as e:
+            if not _not_found(e):
+                raise
+            # removed behind our back
+            self.logger.debug('Dataset image %s is gone', entry['image'])
+            self.__drop(daemon, [key])
+            return None
+        with self.lock:
+            index = self.__load()
+            entries = index['daemons'].get(daemon, {})
+            if key in entries:
+                entries[key]['last_used'] = time.time()
+                write_json(self.index_path, index)
+        return entry
+
+    def add_container(self, obj, key):
+        """
+        commit the container of obj, with its dataset loaded, as the image of key.
+        the server is stopped for the commit and started again.
+        """
+        client = obj.client
+        obj.stop(timeout=STOP_TIMEOUT)
+        image = client.commit(container=obj.get_container(), repository=DATASET_REPO, tag=key[:32]).get('Id')
+        obj.start_container()
+        size = client.inspect_image(image).get('Size', 0) - client.inspect_image(obj.image).get('Size', 0)
+        entry = {
+            'image' : image,
+            'size' : max(0, size),
+            'state' : obj.dataset_state(),
+            'source' : os.path.abspath(obj.dataset),
+            'class' : obj.__class__.__name__,
+            'created' : time.time(),
+            'last_used' : time.time(),
+        }
+        with self.lock:
+            index = self.__load()
+            index['daemons'].setdefault(_daemon(client), {})[key] = entry
+            write_json(self.index_path, index)
+        self.logger.debug('Dataset %s cached as %s', entry['source'], image)
+        self.evict(client, keep=key)
+        return entry
+
+    def entries(self, client = None):
+        """
+        return the entries of the daemon of client, most recently used first.
+        """
+        with self.lock:
+            entries = self.__load()['daemons'].get(_daemon(client or get_client()), {})
+        result = []
+        for key, entry in entries.items():
+            entry = dict(entry)
+            entry['key'] = key
+            result.append(entry)
+        return sorted(result, key=lambda e: e['last_used'], reverse=True)
+
+    def evict(self, client = None, max_size = None, keep = None):
+        """
+        remove the least recently used images until the cache takes at most max_size bytes.
+        returns the removed keys.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        total = 0
+        victims = []
+        for entry in self.entries(client):
+            total += entry['size']
+            if total > max_size and entry['key'] != keep:
+                victims.append(entry['key'])
+        return self.remove(victims, client)
+
+    def remove(self, keys, client = None):
+        client = client or get_client()
+        daemon = _daemon(client)
+        with self.lock:
+            entries = self.__load()['daemons'].get(daemon, {})
+            images = [(k, entries[k]['image']) for k in keys if k in entries]
+        removed = []
+        for key, image in images:
+            try:
+                client.remove_image(image=image, force=True)
+            except APIError as e:
+                if not _not_found(e):
+                    self.logger.warning('Failed to remove dataset image %s: %s', image, e)
+                    continue
+            removed.append(key)
+        self.__drop(daemon, removed)
+        return removed
+
+    def prune(self, client = None, max_size = None, all = False):
+        """
+        remove all the images (with all), or the least recently used ones above max_size.
+        """
+        if all:
+            return self.remove([e['key'] for e in self.entries(client)], client)
+        return self.evict(client, max_size)
+
+    def __drop(self, daemon, keys):
+        with self.lock:
+            index = self.__load()
+            entries = index['daemons'].get(daemon, {})
+            for key in keys:
+                entries.pop(key, None)
+            write_json(self.index_path, index)
+
+_lock = threading.Lock()
+_cache = None
+
+def get_dataset_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = DatasetCache()
+        return _cache
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m dockerobject.datasets', description='Manage the cached dataset images.')
+    parser.add_argument('command', choices=['list', 'prune'])
+    parser.add_argument('--max-size', type=int, help='prune the least recently used images above MAX_SIZE bytes')
+    parser.add_argument('--all', action='store_true', help='prune all the images')
+    args = parser.parse_args(argv)
+    cache = get_dataset_cache()
+
+    if args.command == 'prune':
+        removed = cache.prune(max_size=args.max_size, all=args.all)
+        print('removed %d images' % len(removed))
+        return
+    for entry in cache.entries():
+        print('%s  %s  %8.1f MB  %s  %s' % (entry['key'][:12], entry['image'][:19], entry['size'] / 1e6,
+                                           time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used'])), entry['source']))
+
+if __name__ == '__main__':
+    main()
@@ -13,9 +13,170 @@
 #   limitations under the License.
 
 from dockerobject import DockerObject, RunCommandHelper
-import time
+from .probes import TcpProbe, MySqlProbe, PostgresProbe
+from .metrics import timed
+from .datasets import get_dataset_cache
+from .dumpio import is_archive, read_archive, verify_archive, write_archive, split_sql_dump
+from .streams import iter_chunks, peek, write_chunks, tar_stream, extract_tar
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import tempfile
+
+DEFAULT_TMPFS_SIZE = '1g'
+# triggers and routines of a mysql per table dump, loaded after the data
+MYSQL_POST_DATA = 'dockerobject-post.sql'
+# session settings of parallel mysql loads
+MYSQL_BULK_SETTINGS = b"SET FOREIGN_KEY_CHECKS=0;\nSET UNIQUE_CHECKS=0;\nSET sql_log_bin=0;\nSET autocommit=0;\n"
+
+def run_parallel(func, items, jobs):
+    """
+    call func on all the items, jobs at a time. raises the first error.
+    """
+    if not items:
+        return
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def is_table_dump(path):
+    """
+    True if path is a mysql per table dump (see MySql.download_dump) or a mysqldump --tab directory.
+    """
+    if not isinstance(path, str) or not os.path.isdir(path):
+        return False
+    return any(name.endswith('.txt') or name == MYSQL_POST_DATA for name in os.listdir(path))
 
 class DbObject(DockerObject):
+    # where the server keeps its data, in the container
+    data_dir = None
+    # where it keeps it with a dataset. outside of the image's volumes, so docker commit includes it
+    dataset_dir = None
+    # environment variables that do not change the loaded data, left out of the dataset key
+    dataset_secrets = ()
+    # server settings that trade durability for speed, see set_ephemeral
+    ephemeral_settings = {}
+
+    def __init__(self, *args, **kwargs):
+        super(DbObject, self).__init__(*args, **kwargs)
+        # server settings passed on the command line, e.g. {"shared_buffers" : "256MB"}
+        self.settings = {}
+        self.ephemeral = False
+        # dump that the container starts with, see set_dataset
+        self.dataset = None
+        self.dataset_key = None
+        self.dataset_loaded = False
+
+    def set_setting(self, key, value = None):
+        """
+        pass key (with value, unless None) to the server on its command line.
+        """
+        self.settings[key] = value
+        self.set_command(self.server_command())
+
+    def server_command(self):
+        """
+        return the command that starts the server with self.settings.
+        """
+        raise NotImplementedError()
+
+    def set_ephemeral(self, tmpfs_size = DEFAULT_TMPFS_SIZE):
+        """
+        keep the data directory on a tmpfs of at most tmpfs_size and turn off durability.
+        for throwaway databases: the data is lost when the container stops or the host crashes.
+        """
+        self.ephemeral = True
+        # a tmpfs is not part of a committed dataset image
+        if self.dataset is None:
+            self.add_tmpfs(self.data_dir, 'rw,size=%s' % tmpfs_size)
+        for key, value in sorted(self.ephemeral_settings.items()):
+            self.set_setting(key, value)
+
+    def set_data_dir(self, path):
+        """
+        make the server keep its data in path.
+        """
+        raise NotImplementedError()
+
+    def set_dataset(self, dump):
+        """
+        start with dump (anything upload_dump takes by path) loaded, from an image in the dataset cache.
+        the first time, the dump is loaded once the server is ready and the container is committed
+        to the cache. see datasets.py.
+        """
+        self.dataset = dump
+        self.dataset_key = None
+        self.dataset_loaded = False
+        self.set_data_dir(self.dataset_dir)
+
+    def dataset_config(self):
+        """
+        the configuration that the loaded data depends on, part of the dataset key.
+        """
+        environment = dict((k, v) for k, v in self.environment.items() if k not in self.dataset_secrets)
+        return {'environment' : environment, 'settings' : self.settings}
+
+    def dataset_state(self):
+        """
+        what an object created from the dataset image needs to know, e.g. passwords.
+        """
+        return {}
+
+    def use_dataset_state(self, state):
+        pass
+
+    def fingerprint_config(self):
+        config = super(DbObject, self).fingerprint_config()
+        config['environment'] = dict((k, v) for k, v in self.environment.items() if k not in self.dataset_secrets)
+        if self.dataset is not None:
+            # the image is the cached dataset image once there is one
+            config['image'] = [self.repo, self.tag]
+            config['dataset'] = get_dataset_cache().dump_hash(self.dataset)
+        return config
+
+    def reuse_state(self):
+        return self.dataset_state()
+
+    def use_reuse_state(self, state):
+        self.use_dataset_state(state)
+        self.dataset_loaded = True
+
+    def find_dataset(self):
+        cache = get_dataset_cache()
+        self.pull_if_needed(repository=self.repo, tag=self.tag, insecure_registry=True)
+        self.dataset_key = cache.key(self, cache.dump_hash(self.dataset))
+        entry = cache.lookup(self.client, self.dataset_key)
+        if entry is not None:
+            self.logger.debug('Starting from cached dataset %s', entry['image'])
+            self.set_image(entry['image'])
+            self.use_dataset_state(entry['state'])
+            self.dataset_loaded = True
+
+    def create_container(self):
+        if self.dataset is not None and not self.dataset_loaded:
+            self.find_dataset()
+        super(DbObject, self).create_container()
+
+    def on_ready(self):
+        if self.dataset is not None and not self.dataset_loaded:
+            self.load_dataset()
+
+    def load_dataset(self):
+        """
+        load the dataset into the running server and add the container to the dataset cache.
+        """
+        self.dataset_loaded = True
+        cache = get_dataset_cache()
+        if self.dataset_key is None:
+            self.dataset_key = cache.key(self, cache.dump_hash(self.dataset))
+        self.upload_dump(self.dataset)
+        with self.phase('dataset_commit'):
+            cache.add_container(self, self.dataset_key)
+            # the server was restarted for the commit
+            self.wait_for_probe(self.get_readiness_probe())
 
     def get_connection_params(self):
         """
@@ -23,18 +184,114 @@ class DbObject(DockerObject):
         """
         raise NotImplementedError()
 
-    def wait_for_container(self):
+    def get_readiness_probe(self):
         host, port, database, user, password =  self.get_connection_params()
-        port = int(port)
-        # todo: add timeout
-        while not self.check_port_open(port):
-            time.sleep(1)
-        # give the db a chance to init, since this is a naive test
-        time.sleep(2)
+        return TcpProbe(host, port)
+
+    def run_sql(self, sql, database = None):
+        """
+        run sql as an admin user inside the container. returns the output.
+        """
+        raise NotImplementedError()
+
+    def reset(self):
+        """
+        drop and recreate the database, so the container can be reused by a ContainerPool.
+        """
+        raise NotImplementedError()
+
+    def add_database(self, db, user, password):
+        """
+        create database db owned by a new user, and use them from now on. see shared.py.
+        """
+        raise NotImplementedError()
+
+    def drop_database(self, db, user):
+        """
+        drop a database and user made by add_database.
+        """
+        raise NotImplementedError()
+
+    def feed_command(self, command, source, error):
+        """
+        run command in the container with source (a path, a file like object or an iterable of bytes) as its stdin.
+        """
+        stream = self.exec_stream(command, stdin=True)
+        stream.feed(source)
+        exit_code = stream.wait()
+        if exit_code != 0:
+            self.logger.error("Error running %s. output: %s", command[0], stream.stderr)
+            raise RuntimeError("%s. exitcode: %s" % (error, exit_code))
+
+    def iter_command(self, command, error):
+        """
+        run command in the container and yield its stdout.
+        """
+        stream = self.exec_stream(command)
+        for chunk in stream.stdout():
+            yield chunk
+        exit_code = stream.exit_code()
+        if exit_code != 0:
+            self.logger.error("Error running %s. output: %s", command[0], stream.stderr)
+            raise RuntimeError("%s. exitcode: %s" % (error, exit_code))
+
+    def run_command(self, command, error):
+        for chunk in self.iter_command(command, error):
+            pass
+
+    def stage_dump(self, source, directory = False, parent = "/tmp"):
+        """
+        copy source into a temporary path under parent in the container and return the path.
+        with directory, source is a tar that is extracted.
+        """
+        remote = "%s/dockerobject-dump-%s" % (parent.rstrip("/"), self.random_password())
+        if directory:
+            command = ["sh", "-c", 'mkdir -p "%s" && exec tar -C "%s" -xf -' % (remote, remote)]
+        else:
+            command = ["sh", "-c", 'exec cat > "%s"' % remote]
+        self.feed_command(command, source, "Failed to copy dump to container")
+        return remote
+
+    def iter_dump(self):
+        """
+        yield the dump of the database as byte chunks.
+        """
+        raise NotImplementedError()
+
+    @timed('download_dump')
+    def download_dump(self, dumpfile, archive = False):
+        """
+        write the dump of the database to dumpfile (a path or a file like object).
+        with archive, dumpfile is a directory that gets a compressed and checksummed archive, see dumpio.py.
+        """
+        if archive:
+            return write_archive(self.iter_dump(), dumpfile)
+        write_chunks(dumpfile, self.iter_dump())
+
+    def snapshot_db(self, name):
+        return "%s__snapshot_%s" % (self.get_db(), name)
 
 class MySql(DbObject):
-    def __init__(self):
-        super(MySql, self).__init__(repo="mysql")
+    data_dir = "/var/lib/mysql"
+    dataset_dir = "/var/lib/mysql-dataset"
+    dataset_secrets = ("MYSQL_ROOT_PASSWORD",)
+    ephemeral_settings = {
+        "innodb_flush_log_at_trx_commit" : "0",
+        "skip-innodb-doublewrite" : None,
+        "sync_binlog" : "0",
+        "skip-log-bin" : None,
+        # native aio is not supported on tmpfs
+        "innodb_use_native_aio" : "0",
+    }
+
+    def __init__(self, client=None, ephemeral = False, tmpfs_size = DEFAULT_TMPFS_SIZE, settings = None, dataset = None, reuse = None):
+        """
+        with ephemeral, the data is kept in memory and durability is off, see set_ephemeral.
+        settings are passed to mysqld, e.g. {"innodb_buffer_pool_size" : "512M"}.
+        with dataset, starts with that dump loaded, see set_dataset.
+        with reuse, adopts a running container with the same configuration, see set_reuse.
+        """
+        super(MySql, self).__init__(repo="mysql", client=client, reuse=reuse)
         self.logger = self.logger.getChild('mysql')
         self.user = "mysql"
         self.password = "password"
@@ -44,7 +301,31 @@ class MySql(DbObject):
         self.add_environment('MYSQL_USER', self.user)
         self.add_environment('MYSQL_PASSWORD', self.password)
         self.add_environment('MYSQL_DATABASE', self.db)
-        self.add_environment('MYSQL_ROOT_PASSWORD', self.random_password())
+        self.root_password = self.random_password()
+        self.add_environment('MYSQL_ROOT_PASSWORD', self.root_password)
+        if dataset is not None:
+            self.set_dataset(dataset)
+        if ephemeral:
+            self.set_ephemeral(tmpfs_size)
+        for key, value in sorted((settings or {}).items()):
+            self.set_setting(key, value)
+
+    def set_data_dir(self, path):
+        self.data_dir = path
+        self.set_setting("datadir", path)
+
+    def dataset_state(self):
+        return {"root_password" : self.root_password}
+
+    def use_dataset_state(self, state):
+        self.root_password = state["root_password"]
+        self.add_environment('MYSQL_ROOT_PASSWORD', self.root_password)
+
+    def server_command(self):
+        command = ["mysqld"]
+        for key, value in sorted(self.settings.items()):
+            command.append("--%s" % key if value is None else "--%s=%s" % (key, value))
+        return command
 
     def get_user(self):
         return self.user
@@ -55,19 +336,44 @@ class MySql(DbObject):
     def get_db(self):
         return self.db
 
-    def __check_mysql_alive(self, host, port, database, user, password):
-        if not self.check_port_open(self.port):
-            return False
-        # test that mysql can connect to the db server
-        time.sleep(2)
-        return True
-
-    def wait_for_container(self):
+    def get_readiness_probe(self):
         host, port, database, user, password =  self.get_connection_params()
-        port = int(port)
-        # todo: add timeout
-        while not self.__check_mysql_alive(host, port, database, user, password):
-            time.sleep(1)
+        return MySqlProbe(host, port)
+
+    def run_sql(self, sql, database = None):
+        command = ["mysql", "-uroot", "-p" + self.root_password, "-e", sql]
+        if database:
+            command.append(database)
+        exit_code, output = self.execute(command)
+        if exit_code != 0:
+            self.logger.error("Error running sql. output: %s", output)
+            raise RuntimeError("Failed to run sql for mysql. exitcode: %s" % exit_code)
+        return output
+
+    def reset(self):
+        # grants are kept by database name, so the user keeps its access
+        self.run_sql("DROP DATABASE IF EXISTS `{0}`; CREATE DATABASE `{0}`;".format(self.db))
+
+    def add_database(self, db, user, password):
+        self.run_sql("CREATE DATABASE `{0}`; CREATE USER '{1}'@'%' IDENTIFIED BY '{2}'; GRANT ALL ON `{0}`.* TO '{1}'@'%';".format(db, user, password))
+        self.db, self.user, self.password = db, user, password
+
+    def drop_database(self, db, user):
+        self.run_sql("DROP DATABASE IF EXISTS `{0}`; DROP USER IF EXISTS '{1}'@'%';".format(db, user))
+
+    def copy_db(self, source, target):
+        self.run_sql("DROP DATABASE IF EXISTS `{0}`; CREATE DATABASE `{0}`;".format(target))
+        copy = "set -o pipefail; mysqldump -uroot -p{0} --single-transaction --routines --triggers {1} | mysql -uroot -p{0} {2}".format(self.root_password, source, target)
+        exit_code, output = self.execute(["bash", "-c", copy])
+        if exit_code != 0:
+            self.logger.error("Error copying database. output: %s", output)
+            raise RuntimeError("Failed to copy database %s to %s. exitcode: %s" % (source, target, exit_code))
+
+    def snapshot(self, name):
+        self.copy_db(self.db, self.snapshot_db(name))
+
+    def restore(self, name):
+        self.copy_db(self.snapshot_db(name), self.db)
 
     def run_help_command(self, helper):
         if self.should_start():
@@ -76,29 +382,146 @@ class MySql(DbObject):
         with helper:
             helper.start()
             if helper.wait(5*60) != 0:
-                error = self.client.attach(container=helper.get_container(), stdout=True, stderr=True, stream=False, logs=True)
-                self.logger.error("Error running helper command. output: %s",  error)
+                self.logger.error("Error running helper command. output: %s", helper.tail_logs())
                 raise RuntimeError("Failed to run command for mysql. exitcode: %s" % helper.get_exit_code())
 
-    def upload_dump(self, dumpfile):
-        dumpfile = os.path.abspath(dumpfile)
-        # do balagan
-        binds = {dumpfile : {"ro":True, "bind" :"/tmp/dumpfile.dmp"}}
-        # based on
-        command_restore = """sh -c 'exec mysql  --protocol=tcp --port=$LINKED_PORT_3306_TCP_PORT --host=$LINKED_PORT_3306_TCP_ADDR -u"$LINKED_ENV_MYSQL_USER" -p"$LINKED_ENV_MYSQL_PASSWORD"   "$LINKED_ENV_MYSQL_DATABASE" < /tmp/dumpfile.dmp'"""
-
-        return self.run_help_command(RunCommandHelper(command_restore, self, binds))
+    def root_command(self):
+        return ["mysql", "-uroot", "-p" + self.root_password, self.db]
 
-    def download_dump(self, dumpfile):
-        dumpfile = os.path.abspath(dumpfile)
-        # make sure file existsm so docker won't create a directory
-        with open(dumpfile, 'w'):
-            pass
-        # do balagan
-        binds = {dumpfile : {"ro":False, "bind" :"/tmp/dumpfile.dmp"}}
-        # based on
-        command_dump = """sh -c 'exec mysqldump --protocol=tcp --port=$DB_PORT_3306_TCP_PORT --host=$DB_PORT_3306_TCP_ADDR -u"$LINKED_ENV_MYSQL_USER" -p"$LINKED_ENV_MYSQL_PASSWORD"   "$LINKED_ENV_MYSQL_DATABASE" > /tmp/dumpfile.dmp'"""
-        return self.run_help_command(RunCommandHelper(command_dump, self, binds))
+    def secure_file_dir(self):
+        """
+        the directory that the server may read files from with LOAD DATA INFILE (secure_file_priv).
+        """
+        exit_code, output = self.execute(["mysql", "-uroot", "-p" + self.root_password, "-N", "-B", "-e", "SELECT @@secure_file_priv"])
+        lines = [l for l in output.decode("utf-8").splitlines() if l.strip() and not l.startswith("mysql:")]
+        if exit_code != 0:
+            raise RuntimeError("Failed to get secure_file_priv for mysql. exitcode: %s" % exit_code)
+        value = lines[-1] if lines else ""
+        if value == "NULL":
+            raise RuntimeError("LOAD DATA INFILE is disabled, secure_file_priv is NULL")
+        # empty when any directory is allowed
+        return value or "/tmp"
+
+    @timed('upload_dump')
+    def upload_dump(self, dumpfile, jobs = None):
+        """
+        load dumpfile into the database. dumpfile is a per table dump (see download_dump), a dump
+        archive, or a path, file like object or iterable of bytes of an sql dump.
+        per table dumps are loaded by jobs sessions at once (the container's cpu allowance by default).
+        with jobs, an sql dump is split per table and the tables are loaded by jobs sessions at once.
+        """
+        if is_archive(dumpfile):
+            # a corrupt archive fails before anything is loaded
+            verify_archive(dumpfile)
+        if self.should_start():
+            self.start()
+        if is_table_dump(dumpfile):
+            return self.load_tables(dumpfile, jobs)
+        if is_archive(dumpfile):
+            dumpfile = read_archive(dumpfile)
+        if jobs is not None and jobs > 1:
+            return self.load_split_dump(dumpfile, jobs)
+        command = ["mysql", "-u" + self.user, "-p" + self.password, self.db]
+        self.feed_command(command, iter_chunks(dumpfile), "Failed to upload dump")
+
+    def load_split_dump(self, source, jobs):
+        """
+        split an sql dump per table and load the tables jobs at a time, with foreign key and
+        unique checks off, each in one transaction. view stubs are loaded first, views and routines last.
+        """
+        directory = tempfile.mkdtemp(prefix="dockerobject-dump-")
+        try:
+            header, views, tables, trailer = split_sql_dump(source, directory)
+            with open(header, "rb") as f:
+                prologue = f.read() + MYSQL_BULK_SETTINGS
+
+            def session(path):
+                yield prologue
+                for chunk in iter_chunks(path):
+                    yield chunk
+                yield b"COMMIT;\n"
+
+            if os.path.getsize(views):
+                self.feed_command(self.root_command(), session(views), "Failed to create views")
+            self.logger.debug("Loading %d tables, %d at a time", len(tables), jobs)
+            run_parallel(lambda table: self.feed_command(self.root_command(), session(table[1]), "Failed to load table %s" % table[0]), tables, jobs)
+            self.feed_command(self.root_command(), session(trailer), "Failed to upload dump")
+        finally:
+            shutil.rmtree(directory)
+
+    def load_tables(self, directory, jobs = None):
+        """
+        load a per table dump: create the tables and views, LOAD DATA the tables jobs at a time
+        with keys and foreign key and unique checks off, then create the triggers and routines.
+        """
+        if jobs is None:
+            jobs = self.cpu_allowance()
+        names = sorted(os.listdir(directory))
+        tables = [name[:-len(".txt")] for name in names if name.endswith(".txt")]
+        # tables first, views select from them
+        schema = [name for name in names if name.endswith(".sql") and name != MYSQL_POST_DATA]
+        schema.sort(key=lambda name: name[:-len(".sql")] not in tables)
+
+        def files(names):
+            yield MYSQL_BULK_SETTINGS
+            for name in names:
+                for chunk in iter_chunks(os.path.join(directory, name)):
+                    yield chunk
+            yield b"COMMIT;\n"
+
+        self.feed_command(self.root_command(), files(schema), "Failed to create tables")
+        # LOAD DATA INFILE reads the data on the server side
+        remote = self.stage_dump(tar_stream(directory), directory=True, parent=self.secure_file_dir())
+        try:
+            def load(table):
+                self.run_sql("SET FOREIGN_KEY_CHECKS=0; SET UNIQUE_CHECKS=0; SET sql_log_bin=0; "
+                             "ALTER TABLE `{0}` DISABLE KEYS; "
+                             "LOAD DATA INFILE '{1}/{0}.txt' INTO TABLE `{0}` CHARACTER SET utf8mb4; "
+                             "ALTER TABLE `{0}` ENABLE KEYS;".format(table, remote), self.db)
+            self.logger.debug("Loading %d tables, %d at a time", len(tables), jobs)
+            run_parallel(load, tables, jobs)
+        finally:
+            self.execute(["rm", "-rf", remote])
+        if MYSQL_POST_DATA in names:
+            self.feed_command(self.root_command(), files([MYSQL_POST_DATA]), "Failed to create triggers")
+
+    def iter_dump(self, tables = False):
+        """
+        yield the dump of the database. with tables, a tar of a per table dump: the create
+        statement (.sql) and tab separated data (.txt) of every table, and their triggers and routines.
+        """
+        if self.should_start():
+            self.start()
+        if not tables:
+            command = ["mysqldump", "-u" + self.user, "-p" + self.password, "--single-transaction", self.db]
+            for chunk in self.iter_command(command, "Failed to download dump"):
+                yield chunk
+            return
+
+        # the server writes the data files, into a directory it may write to
+        remote = "%s/dockerobject-dump-%s" % (self.secure_file_dir().rstrip("/"), self.random_password())
+        dump = "mysqldump -uroot -p%s --single-transaction" % self.root_password
+        script = ('mkdir -p "{0}" && chmod 777 "{0}" && '
+                  '{1} --skip-triggers --default-character-set=utf8mb4 --tab="{0}" {2} && '
+                  '{1} --no-create-info --no-data --routines {2} > "{0}/{3}" && '
+                  'tar -C "{0}" -cf - .; code=$?; rm -rf "{0}"; exit $code').format(remote, dump, self.db, MYSQL_POST_DATA)
+        for chunk in self.iter_command(["sh", "-c", script], "Failed to download dump"):
+            yield chunk
+
+    @timed('download_dump')
+    def download_dump(self, dumpfile, archive = False, tables = False):
+        """
+        write the dump to dumpfile (a path or a file like object). with archive, dumpfile is a
+        directory that gets a dump archive, see dumpio.py. with tables, dumpfile is a directory
+        that gets a per table dump, which upload_dump loads in parallel.
+        """
+        if tables:
+            if archive:
+                raise RuntimeError("a per table dump can't be archived")
+            return extract_tar(self.iter_dump(tables=True), dumpfile)
+        if archive:
+            return write_archive(self.iter_dump(), dumpfile)
+        write_chunks(dumpfile, self.iter_dump())
 
     def get_connection_params(self):
         if self.should_start():
@@ -118,10 +541,29 @@ class MySql(DbObject):
         env = {"MYSQL_HOST":host, "MYSQL_TCP_PORT":str(port)}
         call(["mysql", "--protocol=tcp", "-u" + user, "-p" + password, db], env=env)
 
-class Postgres(DockerObject):
-    def __init__(self, user = "pguser", password = "pgpass", db = "pgdb"):
-        super(Postgres, self).__init__(repo="postgres")
+class Postgres(DbObject):
+    data_dir = "/var/lib/postgresql/data"
+    dataset_dir = "/var/lib/postgresql/dataset"
+    ephemeral_settings = {
+        "fsync" : "off",
+        "synchronous_commit" : "off",
+        "full_page_writes" : "off",
+        # tables created and loaded in one transaction (e.g. by pg_restore) skip the wal
+        "wal_level" : "minimal",
+        "max_wal_senders" : "0",
+    }
+
+    def __init__(self, user = "pguser", password = "pgpass", db = "pgdb", client = None, ephemeral = False, tmpfs_size = DEFAULT_TMPFS_SIZE, settings = None, dataset = None, reuse = None):
+        """
+        with ephemeral, the data is kept in memory and durability is off, see set_ephemeral.
+        settings are passed to postgres, e.g. {"shared_buffers" : "256MB", "work_mem" : "16MB"}.
+        with dataset, starts with that dump loaded, see set_dataset.
+        with reuse, adopts a running container with the same configuration, see set_reuse.
+        """
+        super(Postgres, self).__init__(repo="postgres", client=client, reuse=reuse)
         self.user = user
+        # the superuser that run_sql connects as
+        self.admin_user = user
         self.password = password
         self.db = db
         self.logger = self.logger.getChild('postgres')
@@ -129,6 +571,22 @@ class Postgres(DockerObject):
         self.add_environment('POSTGRES_USER', self.user)
         self.add_environment('POSTGRES_PASSWORD', self.password)
         self.add_environment('POSTGRES_DB', self.db)
+        if dataset is not None:
+            self.set_dataset(dataset)
+        if ephemeral:
+            self.set_ephemeral(tmpfs_size)
+        for key, value in sorted((settings or {}).items()):
+            self.set_setting(key, value)
+
+    def set_data_dir(self, path):
+        self.data_dir = path
+        self.add_environment('PGDATA', path)
+
+    def server_command(self):
+        command = ["postgres"]
+        for key, value in sorted(self.settings.items()):
+            command += ["-c", "%s=%s" % (key, "on" if value is None else value)]
+        return command
 
     def get_user(self):
         return self.user
@@ -139,73 +597,128 @@ class Postgres(DockerObject):
     def get_db(self):
         return self.db
 
-    def __check_postges_alive(self, host, port, database, user, password):
-        try:
-            import psycopg2
-            try:
-                conn = psycopg2.connect(host=host, port=port, database=database, user=user, password=password)
-                conn.close()
-                return True
-            except psycopg2.OperationalError:
-                return False
-        except ImportError:
-            import socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex((host, port))
-            sock.close()
-            if result == 0:
-                # port is open, give it a second to init (lame but if you don't have psycopg2, that's the best i got.)
-                time.sleep(2)
-                return True
-        return False
-
-    def wait_for_container(self):
+    def get_readiness_probe(self):
         host, port, database, user, password =  self.get_connection_params()
-        port = int(port)
-        # todo: add timeout
-        while not self.__check_postges_alive(host, port, database, user, password):
-            time.sleep(1)
-
-    def upload_dump(self, dumpfile):
+        return PostgresProbe(host, port, user, database)
+
+    def run_sql(self, sql, database = "postgres"):
+        command = ["psql", "-U", self.admin_user, "-d", database, "-v", "ON_ERROR_STOP=1", "-c", sql]
+        exit_code, output = self.execute(command)
+        if exit_code != 0:
+            self.logger.error("Error running sql. output: %s", output)
+            raise RuntimeError("Failed to run sql for postgres. exitcode: %s" % exit_code)
+        return output
+
+    def terminate_connections(self, database):
+        self.run_sql("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '%s' AND pid <> pg_backend_pid()" % database)
+
+    def reset(self):
+        # each statement runs on its own, DROP/CREATE DATABASE can't run in a transaction block
+        self.terminate_connections(self.db)
+        self.run_sql('DROP DATABASE IF EXISTS "%s"' % self.db)
+        self.run_sql('CREATE DATABASE "%s" OWNER "%s" TEMPLATE template1' % (self.db, self.user))
+
+    def add_database(self, db, user, password):
+        self.run_sql("CREATE ROLE \"%s\" LOGIN PASSWORD '%s'" % (user, password))
+        self.run_sql('CREATE DATABASE "%s" OWNER "%s" TEMPLATE template1' % (db, user))
+        self.db, self.user, self.password = db, user, password
+
+    def drop_database(self, db, user):
+        self.terminate_connections(db)
+        self.run_sql('DROP DATABASE IF EXISTS "%s"' % db)
+        self.run_sql('DROP ROLE IF EXISTS "%s"' % user)
+
+    def snapshot(self, name):
+        # a database can only be used as a template while no one is connected to it
+        snapshot = self.snapshot_db(name)
+        self.terminate_connections(self.db)
+        self.run_sql('DROP DATABASE IF EXISTS "%s"' % snapshot)
+        self.run_sql('CREATE DATABASE "%s" TEMPLATE "%s"' % (snapshot, self.db))
+
+    def restore(self, name):
+        self.terminate_connections(self.db)
+        self.run_sql('DROP DATABASE IF EXISTS "%s"' % self.db)
+        self.run_sql('CREATE DATABASE "%s" OWNER "%s" TEMPLATE "%s"' % (self.db, self.user, self.snapshot_db(name)))
+
+    @timed('upload_dump')
+    def upload_dump(self, dumpfile, jobs = None):
+        """
+        restore dumpfile into the database. dumpfile is a directory format dump, a dump archive (see
+        dumpio.py), or a path, file like object or iterable of bytes of a custom format or plain sql dump.
+        directory dumps are restored with jobs parallel jobs (the container's cpu allowance by default).
+        custom format dumps are streamed to pg_restore, unless jobs is given.
+        """
+        if is_archive(dumpfile):
+            # a corrupt archive fails before anything is restored
+            verify_archive(dumpfile)
         if self.should_start():
             self.start()
-        dumpfile = os.path.abspath(dumpfile)
-        # do balagan
-        binds = {dumpfile : {"ro":True, "bind" :"/tmp/dumpfile.dmp"}}
-        # based on
-        # /usr/bin/pg_restore --host 192.168.1.57 --port 5432 --username "postgres" --dbname "yu" --no-password  --verbose "/home/yuval/emc/test.dump"
-        command_pg_restore = """sh -c 'exec pg_restore --host "$DB_PORT_5432_TCP_ADDR" --port "$DB_PORT_5432_TCP_PORT" --dbname "%s" /tmp/dumpfile.dmp'""" % self.get_db()
-        command_pgsql = """sh -c 'exec psql  --host "$DB_PORT_5432_TCP_ADDR" --port "$DB_PORT_5432_TCP_PORT" --dbname "%s" -f /tmp/dumpfile.dmp'""" % self.get_db()
-        binary_sig = "PGDMP"
-
-        command = command_pgsql
-        with open(dumpfile,"rb") as f:
-            if f.read(len(binary_sig)) == binary_sig:
-                command = command_pg_restore
-
-        with PostgresHelper(self, command, binds) as tmp:
-            tmp.start()
-            if tmp.wait(5*60) != 0:
-                error = self.client.attach(container=tmp.get_container(), stdout=True, stderr=True, stream=False, logs=True)
-                self.logger.error("Error running helper command. output: %s",  error)
-                raise RuntimeError("Failed to upload dump. exitcode: %s" % tmp.get_exit_code())
-
-    def download_dump(self, dumpfile):
+        if is_archive(dumpfile):
+            dumpfile = read_archive(dumpfile)
+        if isinstance(dumpfile, str) and os.path.isdir(dumpfile):
+            remote = self.stage_dump(tar_stream(dumpfile), directory=True)
+        else:
+            binary_sig = b"PGDMP"
+            signature, chunks = peek(iter_chunks(dumpfile), len(binary_sig))
+            if signature != binary_sig:
+                command = ["psql", "-U", self.user, "--dbname", self.get_db()]
+                return self.feed_command(command, chunks, "Failed to upload dump")
+            if jobs is None:
+                command = ["pg_restore", "-U", self.user, "--dbname", self.get_db()]
+                return self.feed_command(command, chunks, "Failed to upload dump")
+            # parallel restore needs a seekable file
+            remote = self.stage_dump(chunks)
+
+        if jobs is None:
+            jobs = self.cpu_allowance()
+        try:
+            command = ["pg_restore", "-U", self.user, "--dbname", self.get_db(), "--jobs", str(jobs), remote]
+            self.run_command(command, "Failed to upload dump")
+        finally:
+            self.execute(["rm", "-rf", remote])
+
+    def iter_dump(self, directory = False, jobs = None, compress = True):
+        """
+        yield the dump of the database. by default a custom format dump; with directory, a tar of
+        a directory format dump made by jobs parallel jobs (the container's cpu allowance by default).
+        without compress, the custom format dump is not compressed by pg_dump.
+        """
         if self.should_start():
             self.start()
-        dumpfile = os.path.abspath(dumpfile)
-        # do balagan
-        binds = {dumpfile : {"ro":False, "bind" :"/tmp/dumpfile.dmp"}}
         # based on
         # /usr/bin/pg_dump --host 192.168.1.57 --port 5432 --username "postgres" --no-password  --format custom --blobs --verbose --file "/tmp/t.t" "yu"
-        dump_command = """sh -c 'exec pg_dump --host "$DB_PORT_5432_TCP_ADDR" --port "$DB_PORT_5432_TCP_PORT" --dbname "%s" --format custom --blobs --verbose --file /tmp/dumpfile.dmp'""" % self.get_db()
-
-        with PostgresHelper(self, dump_command, binds) as tmp:
-            tmp.start()
-            if tmp.wait(5*60) != 0:
-                error = self.attach()
-                self.logger.error("Error running helper command. output: %s",  error)
-                raise RuntimeError("Failed to download dump. exitcode: %s" % tmp.get_exit_code())
+        command = ["pg_dump", "-U", self.user, "--dbname", self.get_db(), "--blobs"]
+        if not directory:
+            command += ["--format", "custom"]
+            if not compress:
+                command += ["--compress", "0"]
+            for chunk in self.iter_command(command, "Failed to download dump"):
+                yield chunk
+            return
+
+        if jobs is None:
+            jobs = self.cpu_allowance()
+        remote = "/tmp/dockerobject-dump-%s" % self.random_password()
+        command += ["--format", "directory", "--jobs", str(jobs), "--file", remote]
+        script = '%s && tar -C "%s" -cf - .; code=$?; rm -rf "%s"; exit $code' % (" ".join('"%s"' % arg for arg in command), remote, remote)
+        for chunk in self.iter_command(["sh", "-c", script], "Failed to download dump"):
+            yield chunk
+
+    @timed('download_dump')
+    def download_dump(self, dumpfile, directory = False, jobs = None, archive = False):
+        """
+        write the dump to dumpfile (a path or a file like object). with directory, dumpfile is a
+        directory that gets a directory format dump, made by jobs parallel jobs. with archive,
+        dumpfile is a directory that gets an archive of a custom format dump, see dumpio.py.
+        """
+        if archive:
+            if directory:
+                raise RuntimeError("a directory format dump can't be archived")
+            # compressed once, by the archive
+            return write_archive(self.iter_dump(compress=False), dumpfile)
+        if not directory:
+            return write_chunks(dumpfile, self.iter_dump())
+        extract_tar(self.iter_dump(directory=True, jobs=jobs), dumpfile)
 
     def get_connection_params(self):
         if self.should_start():
@@ -228,7 +741,7 @@ class Postgres(DockerObject):
 class PostgresHelper(Postgres):
 
     def __init__(self, postgres, command, binds = None):
-        super(PostgresHelper, self).__init__()
+        super(PostgresHelper, self).__init__(client=postgres.client, reuse=False)
         self.set_volumes(binds)
         self.add_environment("PGPASSWORD", postgres.get_password())
         self.add_environment("PGUSER", postgres.get_user())
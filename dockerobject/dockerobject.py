@@ -13,18 +13,61 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from docker import Client
+from .client import get_client
+from .events import get_monitor, event_status, STATE_EVENTS
+from .images import get_image_index
+from .metrics import CountingClient, get_metrics, unwrap
+from .probes import LogProbe, wait_until_ready, DEFAULT_TIMEOUT
+from .streams import ExecStream, exec_exit_code, iter_logs, tail_logs, forward_logs, STDERR_LIMIT
+from .readiness import wait_for_targets
+from .scheduler import create_graph, start_graph, destroy_graph
+from docker.errors import APIError
+from docker.utils import create_host_config, Ulimit
+from collections import defaultdict
+from contextlib import contextmanager
+import hashlib
+import json
 import logging
 import os
+import socket
 import string
 import random
+import threading
+import time
+import uuid
+import weakref
 
 LOGGER = 'dockeobject'
+SNAPSHOT_REPO = 'dockerobject-snapshot'
+
+# every container is labelled with the session (process) that created it, see reaper.py
+SESSION_ID = uuid.uuid4().hex
+LABEL_SESSION = 'dockerobject.session'
+LABEL_OWNER_PID = 'dockerobject.owner.pid'
+LABEL_OWNER_HOST = 'dockerobject.owner.host'
+
+# how much of the container output is kept when reporting a failure
+LOG_TAIL_LIMIT = STDERR_LIMIT
+
+# reused containers (see set_reuse) are labelled with a hash of their configuration, the id of
+# their base image and what an object adopting them needs to know
+LABEL_FINGERPRINT = 'dockerobject.fingerprint'
+LABEL_IMAGE_ID = 'dockerobject.image'
+LABEL_STATE = 'dockerobject.state'
+# DOCKEROBJECT_REUSE=1 turns reuse on for every object that does not turn it off
+REUSE = os.environ.get('DOCKEROBJECT_REUSE', '') not in ('', '0')
+REUSE_MAX_AGE = 24 * 60 * 60
 
 class DockerObject(object):
 
-    def __init__(self, repo, tag = None):
-        self.client = Client(base_url='unix://var/run/docker.sock', version='auto')
+    def __init__(self, repo, tag = None, client = None, reuse = None):
+        # all objects share the process wide client unless one is injected.
+        client = get_client() if client is None else unwrap(client)
+        # docker api calls made by this object, by method
+        self.api_calls = defaultdict(int)
+        self.client = CountingClient(client, self.__class__.__name__, self.api_calls)
+        # phase -> seconds it took the last time, see metrics.py
+        self.timings = {}
         self.logger = logging.getLogger(LOGGER)
         self.repo = repo
         self.tag  = tag
@@ -32,20 +75,63 @@ class DockerObject(object):
         self.image = self.repo
         if self.tag:
             self.image = self.image + ':' + self.tag
+        self.__repo_image = self.image
         self.__container = None
+        # False for containers that someone else removes, see set_container
+        self.__owned = True
+        # result of inspect_container, cached until the next lifecycle transition. see refresh()
+        self.__state = None
+        # drops the cached state on docker events. holds a weak reference so __del__ still runs.
+        self.__listener = _invalidate_on_event(weakref.ref(self))
+        # snapshot name -> image id, see snapshot()
+        self.snapshots = {}
+        # images of snapshots that were taken again, kept as containers may still run them
+        self.superseded_snapshots = []
         self.environment = {}
+        self.labels = {}
         self.port_bindings = None
         self.privileged = None
         self.binds = None
         self.hostname = None
         self.links = []
+        # linked containers that only need to be started (not ready) before this one starts.
+        self.no_wait_links = set()
         # internal containers are created, started, and destryed along with this container.
         self.internal_containers = []
         self.exit_code  = None
         # login is global in docker and should not be implemented here.
         # self.login = False
         self.volumes_from = None
+        self.tmpfs = None
+        # host config resource settings, see set_resources
+        self.resources = {}
+        # number of cpus to pin the container to, and the ones it got. see set_cpus
+        self.cpu_count = None
+        self.cpuset = None
+        self.__cpuset_token = None
         self.insecure_registry = False
+        self.readiness_timeout = DEFAULT_TIMEOUT
+        # seconds it took the container to become ready, set by wait_for_container.
+        self.ready_time = None
+        self.reuse = REUSE if reuse is None else reuse
+        self.reuse_max_age = REUSE_MAX_AGE
+        # True while the container is a running one that was adopted, see adopt()
+        self.reused = False
+
+    def record_phase(self, phase, seconds):
+        self.timings[phase] = seconds
+        get_metrics().observe(self, phase, seconds)
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        record the duration of the with block as phase.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_phase(phase, time.time() - start)
 
     def enable_debug(self):
         ch = logging.StreamHandler()
@@ -55,9 +141,27 @@ class DockerObject(object):
     def wait(self, timeout):
         if self.exit_code is None:
             self.logger.debug('waiting for container to end.')
-            self.exit_code = self.client.wait(self.get_container(), timeout)
+            monitor = get_monitor(self.client)
+            if not monitor.is_connected():
+                self.exit_code = self.client.wait(self.get_container(), timeout)
+                self.invalidate()
+                return self.exit_code
+            waiter = self.exit_waiter()
+            try:
+                if self.refresh()['State']['Running'] and waiter.wait(timeout) is None:
+                    raise RuntimeError('Timeout waiting for container %s to end' % self.get_container())
+            finally:
+                monitor.cancel(self.get_container(), waiter)
+            self.exit_code = self.refresh()['State']['ExitCode']
         return self.exit_code
 
+    def exit_waiter(self):
+        """
+        return an events.Waiter that fires when the container dies. many containers can be
+        waited on together with events.wait_all, without a thread or connection per container.
+        """
+        return get_monitor(self.client).waiter(self.get_container(), ('die',))
+
     def get_exit_code(self):
         return self.exit_code
 
@@ -81,9 +185,11 @@ class DockerObject(object):
     def set_privileged(self, privileged):
         self.privileged = privileged
 
-    def add_link(self, name, container, internal = False):
+    def add_link(self, name, container, internal = False, wait_for_ready = True):
         if isinstance(container, DockerObject):
             self.links.append((container, name))
+            if not wait_for_ready:
+                self.no_wait_links.add(container)
             if internal:
                 self.internal_containers.append(container)
         else:
@@ -92,6 +198,14 @@ class DockerObject(object):
     def add_environment(self, key, value):
         self.environment[key] = value
 
+    def add_label(self, key, value):
+        self.labels[key] = value
+
+    def get_labels(self):
+        labels = {LABEL_SESSION : SESSION_ID, LABEL_OWNER_PID : str(os.getpid()), LABEL_OWNER_HOST : socket.gethostname()}
+        labels.update(self.labels)
+        return labels
+
     def set_port_bindings(self, port_bindings):
         self.port_bindings = port_bindings
 
@@ -113,8 +227,174 @@ class DockerObject(object):
         local = os.path.abspath(local)
         self.binds[local] = {"ro":ro, "bind": container}
 
-    def set_container(self, container):
+    def add_tmpfs(self, path, options = ''):
+        """
+        mount an in memory file system at path in the container. options are mount options, e.g. "size=1g".
+        """
+        if self.tmpfs is None:
+            self.tmpfs = {}
+        self.tmpfs[path] = options
+
+    def set_reuse(self, reuse = True, max_age = REUSE_MAX_AGE):
+        """
+        adopt a running container with the same configuration instead of creating one, and keep
+        the containers this object creates when it is destroyed, so the next process can adopt them.
+        containers older than max_age seconds (None for no limit) or made from an older image are replaced.
+        a container is only kept if the containers it links to are kept too, see reusable.
+        """
+        self.reuse = reuse
+        self.reuse_max_age = max_age
+
+    def fingerprint_config(self):
+        """
+        the configuration that a reused container must have been created with.
+        """
+        return {
+            'image' : self.image,
+            'command' : self.command,
+            'environment' : self.environment,
+            'port_bindings' : dict((str(k), v) for k, v in (self.port_bindings or {}).items()),
+            'binds' : self.binds,
+            # the configuration of the linked objects, not their containers of this process
+            'links' : sorted([name, container.fingerprint()] for container, name in self.links),
+            'privileged' : self.privileged,
+            'volumes_from' : self.volumes_from,
+            'tmpfs' : self.tmpfs,
+            'hostname' : self.hostname,
+            'labels' : self.labels,
+            'resources' : self.resources,
+            'cpus' : self.cpu_count,
+        }
+
+    def fingerprint(self):
+        config = json.dumps(self.fingerprint_config(), sort_keys=True, default=str)
+        return hashlib.sha256(config.encode('utf-8')).hexdigest()
+
+    def reuse_state(self):
+        """
+        what an object adopting the container needs to know, e.g. passwords.
+        """
+        return {}
+
+    def use_reuse_state(self, state):
+        pass
+
+    def base_image_id(self):
+        try:
+            return self.client.inspect_image(self.__repo_image)['Id']
+        except APIError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return None
+
+    def is_stale(self, container):
+        """
+        True if container (from client.containers) is too old or made from an older image to be reused.
+        """
+        if self.reuse_max_age is not None and time.time() - container.get('Created', 0) > self.reuse_max_age:
+            return True
+        return (container.get('Labels') or {}).get(LABEL_IMAGE_ID) != self.base_image_id()
+
+    def reusable(self):
+        """
+        True if the container is reused and outlives the object. a container that links to a
+        container that is not reused is not, it would keep running with a link to a removed container.
+        """
+        return self.reuse and all(container.reusable() for container, name in self.links)
+
+    def links_match(self, container):
+        """
+        True if container (from client.containers) links to the containers this object links to.
+        """
+        linked = set()
+        for link in self.client.inspect_container(container['Id'])['HostConfig'].get('Links') or []:
+            # docker reports links as /name:/parent/alias
+            try:
+                linked.add(self.client.inspect_container(link.split(':')[0].lstrip('/'))['Id'])
+            except APIError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                return False
+        return linked == set(c.get_container() for c, name in self.links)
+
+    def adopt(self):
+        """
+        use a running container that was created with the same configuration. returns True if one was found.
+        """
+        label = '%s=%s' % (LABEL_FINGERPRINT, self.fingerprint())
+        for container in self.client.containers(filters={'label' : label}):
+            if self.is_stale(container) or not self.links_match(container):
+                self.logger.debug('Removing stale container %s', container['Id'])
+                self.client.remove_container(container=container['Id'], force=True)
+                continue
+            self.logger.debug('Reusing container %s', container['Id'])
+            self.use_reuse_state(json.loads(container['Labels'].get(LABEL_STATE) or '{}'))
+            self.set_container(container['Id'], owned=False)
+            return True
+        return False
+
+    def set_resources(self, cpu_quota = None, cpu_period = None, cpu_shares = None, cpuset_cpus = None,
+                      mem_limit = None, memswap_limit = None, blkio_weight = None, shm_size = None, ulimits = None):
+        """
+        limit the resources of the container. limits are as in docker run, e.g. mem_limit="2g",
+        cpuset_cpus="0-3", cpu_quota=200000 with cpu_period=100000 for 2 cpus. ulimits is a dict of
+        name to a limit or a (soft, hard) pair, e.g. {"nofile" : (1024, 4096)}. None leaves a setting as is.
+        """
+        settings = {
+            'cpu_quota' : cpu_quota,
+            'cpu_period' : cpu_period,
+            'cpu_shares' : cpu_shares,
+            'cpuset_cpus' : cpuset_cpus,
+            'mem_limit' : mem_limit,
+            'memswap_limit' : memswap_limit,
+            'blkio_weight' : blkio_weight,
+            'shm_size' : shm_size,
+        }
+        if ulimits is not None:
+            settings['ulimits'] = [Ulimit(name=name, soft=limit, hard=limit) if isinstance(limit, int) else Ulimit(name=name, soft=limit[0], hard=limit[1])
+                                   for name, limit in sorted(ulimits.items())]
+        for key, value in settings.items():
+            if value is not None:
+                self.resources[key] = value
+
+    def set_cpus(self, count):
+        """
+        pin the container to count cpus that other containers of this host are not pinned to,
+        as long as there are such cpus. see cpusets.py.
+        """
+        self.cpu_count = count
+
+    def allocate_cpus(self):
+        from .cpusets import get_cpuset_allocator, format_cpuset
+        self.release_cpus()
+        self.__cpuset_token, cpus = get_cpuset_allocator().allocate(self.cpu_count)
+        self.cpuset = format_cpuset(cpus)
+
+    def release_cpus(self):
+        if self.__cpuset_token is None:
+            return
+        from .cpusets import get_cpuset_allocator
+        token, self.__cpuset_token, self.cpuset = self.__cpuset_token, None, None
+        get_cpuset_allocator().release(token)
+
+    def set_image(self, image):
+        """
+        create the container from image (e.g. a snapshot) instead of repo:tag. image is not pulled.
+        """
+        self.image = image
+
+    def set_container(self, container, owned = True):
+        """
+        use container. unless owned, destroy only detaches from it and leaves it running.
+        """
+        monitor = get_monitor(self.client)
+        if self.__container is not None:
+            monitor.unsubscribe(self.__container, self.__listener)
         self.__container = container
+        self.__owned = owned
+        self.__state = None
+        if container is not None:
+            monitor.subscribe(container, self.__listener)
 
     def get_container(self):
         return self.__container
@@ -132,10 +412,25 @@ class DockerObject(object):
 
         if self.internal_containers:
             self.logger.debug('creating linked containers')
-            for c in self.internal_containers:
-                c.create()
-
-        self.pull_if_needed(repository=self.repo, tag=self.tag, insecure_registry = True)
+            create_graph([self])
+        else:
+            self.create_container()
+
+    def create_container(self):
+        # create this container only, without the internal ones.
+        reuse = self.reusable()
+        if self.reuse and not reuse:
+            self.logger.debug('Not reusing container %s, it links to containers that are not reused', self.repo)
+        self.reused = reuse and self.adopt()
+        if self.reused:
+            return
+        if self.image == self.__repo_image:
+            self.pull_if_needed(repository=self.repo, tag=self.tag, insecure_registry = True)
+        labels = self.get_labels()
+        if reuse:
+            labels[LABEL_FINGERPRINT] = self.fingerprint()
+            labels[LABEL_IMAGE_ID] = self.base_image_id() or ''
+            labels[LABEL_STATE] = json.dumps(self.reuse_state())
         ports = None
         if self.port_bindings:
             ports = [k for k in self.port_bindings]
@@ -143,89 +438,266 @@ class DockerObject(object):
         if self.binds:
             volume_to_mount = [self.binds[k]['bind'] for k in self.binds]
 
-        container = self.client.create_container(image=self.image, hostname=self.hostname, ports=ports, environment=self.environment, volumes=volume_to_mount, command=self.command).get('Id')
-        self.set_container(container)
+        if self.cpu_count:
+            self.allocate_cpus()
+        try:
+            with self.phase('create'):
+                container = self.client.create_container(image=self.image, hostname=self.hostname, ports=ports, environment=self.environment, volumes=volume_to_mount, command=self.command, labels=labels, host_config=self.get_host_config()).get('Id')
+        except Exception:
+            self.release_cpus()
+            raise
+        # a reused container outlives the object
+        self.set_container(container, owned=not reuse)
         self.logger.debug('Container %s created %s', self.repo, container)
 
-    def start_container(self):
-        self.logger.debug('Starting container %s (%s)', self.repo, self.get_container())
+    def get_host_config(self):
+        """
+        the host config the container is created with. linked containers must already exist.
+        """
         links = {}
         for container, name in self.links:
+            if container.get_container() is None:
+                raise RuntimeError("Linked container %s (%s) must be created before %s" % (name, container.repo, self.repo))
             links[container.get_container()] = name
-        self.client.start(container=self.get_container(), links=links, port_bindings=self.port_bindings, privileged=self.privileged, binds=self.binds, volumes_from=self.volumes_from)
+        resources = dict(self.resources)
+        if self.cpuset is not None:
+            resources['cpuset_cpus'] = self.cpuset
+        return create_host_config(version=self.client.api_version, links=links, port_bindings=self.port_bindings, privileged=self.privileged, binds=self.binds, volumes_from=self.volumes_from, tmpfs=self.tmpfs, **resources)
+
+    def start_container(self):
+        if self.reused:
+            # adopted while running
+            return
+        self.logger.debug('Starting container %s (%s)', self.repo, self.get_container())
+        with self.phase('start'):
+            self.client.start(container=self.get_container())
+        self.invalidate()
 
     def pull_if_needed(self, repository, tag = None, insecure_registry = False):
-        images = self.client.images(name=repository)
-        pull = False
-        if len(images) == 0:
-            self.logger.debug('Pulling: no images for %s', repository)
-            pull = True
-        elif tag != None:
-            l = [ x['RepoTags'] for x in images ]
-            tags = [ item for sublist in l for item in sublist ]
-            repo_and_tag = repository + ':' + tag
-            # TODO: check if tags are case sensitive
-            # tags = [x.lower() for x in tags]
-            # repo_and_tag = repo_and_tag.lower()
-            if repo_and_tag not in tags:
-                self.logger.debug('Pullin: %s not in %s', repo_and_tag, tags)
-                pull = True
-        if pull:
-            self.logger.debug('Pulling %s', repository)
-            self.client.pull(repository=repository, tag=tag, insecure_registry=insecure_registry)
+        start = time.time()
+        pulled = get_image_index().pull_if_needed(self.client, repository, tag, insecure_registry, self.logger)
+        self.record_phase('pull' if pulled else 'image_check', time.time() - start)
 
     def should_create(self):
         return self.__container == None
 
-    def destroy(self):
+    def destroy(self, parallel = True):
+        """
+        remove the container and its internal containers. without parallel, they are removed one
+        by one in the calling thread.
+        """
         if self.get_container() == None:
             return
+        # containers that are not owned are detached from, see remove_container
+        if self.internal_containers:
+            self.logger.debug('destroying container %s and linked containers', self.repo)
+            if parallel:
+                destroy_graph([self])
+            else:
+                destroy_graph([self], workers=0)
+        else:
+            self.remove_container()
+        self.remove_snapshots()
+
+    def snapshot(self, name):
+        """
+        commit the container to an image that restore(name) can roll back to.
+        note that docker commit does not include the content of volumes.
+        """
+        image = self.client.commit(container=self.get_container(), repository=SNAPSHOT_REPO, tag='%s-%s' % (self.get_container()[:12], name)).get('Id')
+        self.logger.debug('Snapshot %s of container %s: %s', name, self.get_container(), image)
+        old = self.snapshots.get(name)
+        self.snapshots[name] = image
+        if old is not None and old != image:
+            # the container may have been restored from it, it is removed with the other snapshots
+            self.superseded_snapshots.append(old)
+
+    def restore(self, name):
+        """
+        replace the container with a new one created from snapshot name, and start it.
+        """
+        if name not in self.snapshots:
+            raise KeyError("no snapshot named %s" % name)
+        self.logger.debug('Restoring container %s to snapshot %s', self.get_container(), name)
+        image = self.image
+        self.remove_container()
+        self.set_image(self.snapshots[name])
+        try:
+            self.start()
+        finally:
+            self.set_image(image)
+
+    def remove_snapshots(self):
+        images = list(self.snapshots.values()) + self.superseded_snapshots
+        self.snapshots, self.superseded_snapshots = {}, []
+        for image in images:
+            try:
+                self.client.remove_image(image=image, force=True)
+            except APIError as e:
+                # 404: already removed, 409: a container that is left running uses it
+                if e.response is None or e.response.status_code not in (404, 409):
+                    raise
+                self.logger.debug('Failed to remove snapshot %s: %s', image, e)
+
+    def detach(self):
+        """
+        stop using the container and leave it running.
+        """
+        self.logger.debug('detaching from container %s', self.get_container())
+        self.set_container(None)
+        # the cpus stay allocated to the container (until this process exits), only removal releases them
+        self.__cpuset_token = None
+        self.cpuset = None
+
+    def remove_container(self):
+        # remove this container only, without the internal ones. a container that is not owned is detached from.
+        if self.get_container() == None:
+            return
+        if not self.__owned:
+            self.detach()
+            return
         self.logger.debug('destroying container %s', self.repo)
-        self.client.remove_container(container=self.get_container(), force=True)
+        try:
+            self.client.remove_container(container=self.get_container(), force=True)
+        except APIError as e:
+            # already removed, e.g. by reaper.destroy_all
+            if e.response is None or e.response.status_code != 404:
+                raise
         self.set_container(None)
-        if self.internal_containers:
-            self.logger.debug('destroying linked containers')
-            for c in reversed(self.internal_containers):
-                c.destroy()
+        self.release_cpus()
 
     def start(self, wait = True):
-        if self.should_create():
-            self.create()
-
         if self.internal_containers:
             self.logger.debug('starting linked containers')
-            for c in self.internal_containers:
-                c.start(wait=True)
+            start_graph([self], wait=wait)
+            return
+
+        if self.should_create():
+            self.create()
 
         self.start_container()
         self.exit_code = None
-        if wait:
+        if wait and not self.reused:
             self.wait_for_container()
 
-    def stop(self):
+    def stop(self, timeout = 2):
         # do not stop linked containers. as it is not a must
         self.logger.debug('Stopping container %s', self.repo)
-        self.client.stop(container=self.get_container(), timeout=2)
+        self.client.stop(container=self.get_container(), timeout=timeout)
+        self.reused = False
+        self.invalidate()
+
+    def refresh(self):
+        """
+        reload the cached state (ports, ip, hostname, running) of the container from the daemon.
+        """
+        if self.__container is None:
+            self.__state = None
+        else:
+            self.__state = self.client.inspect_container(container=self.__container)
+        return self.__state
+
+    def invalidate(self):
+        """
+        drop the cached state, the next accessor reloads it.
+        """
+        self.__state = None
+
+    def get_state(self):
+        state = self.__state
+        if state is None:
+            state = self.refresh()
+        return state
 
     def should_start(self):
         if self.should_create():
             return True
-        return not self.client.inspect_container(container=self.__container)['State']['Running']
+        return not self.get_state()['State']['Running']
 
     def get_port(self, port):
-        return self.client.port(container=self.get_container(), private_port=port)
+        ports = self.get_state()['NetworkSettings'].get('Ports')
+        # same lookup as docker.Client.port
+        if ports is None:
+            return None
+        port = str(port)
+        if '/' in port:
+            return ports.get(port)
+        host_ports = ports.get(port + '/tcp')
+        if host_ports is None:
+            host_ports = ports.get(port + '/udp')
+        return host_ports
 
     def attach(self, stdout=True, stderr=True, stream=False, logs=True):
+        """
+        the whole output of the container in one string (unless stream). see iter_logs and tail_logs.
+        """
         return self.client.attach(container=self.get_container(), stdout=stdout, stderr=stderr, stream=stream, logs=logs)
 
+    def iter_logs(self, stdout = True, stderr = True, follow = False, tail = 'all'):
+        """
+        yield (stream, data) chunks of the container output, streams.STDOUT or streams.STDERR.
+        with follow, keeps yielding new output until the container stops.
+        """
+        return iter_logs(self.client, self.get_container(), stdout, stderr, follow, tail)
+
+    def tail_logs(self, limit = LOG_TAIL_LIMIT):
+        """
+        return the last limit bytes of the container output, for error reporting.
+        """
+        return tail_logs(self.iter_logs(), limit)
+
+    def forward_logs(self, level = logging.INFO):
+        """
+        log the container output, line by line as it is written, from a background thread
+        that ends when the container stops. returns the thread.
+        """
+        logger = self.logger.getChild('output')
+        prefix = '[%s] ' % self.get_container()[:12]
+        thread = threading.Thread(target=forward_logs, args=(self.iter_logs(follow=True), logger, level, prefix))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def execute(self, command):
+        """
+        run command in the running container. return (exit code, output)
+        """
+        exec_id = self.client.exec_create(container=self.get_container(), cmd=command)
+        output = self.client.exec_start(exec_id)
+        # the exit code may not be set yet when the output ends
+        return exec_exit_code(self.client, exec_id), output
+
+    def cpu_allowance(self):
+        """
+        return the number of cpus the container may use, based on its cpu quota and cpuset.
+        """
+        host_config = self.inspect()['HostConfig']
+        cpus = None
+        if host_config.get('NanoCpus'):
+            cpus = host_config['NanoCpus'] / 1e9
+        elif host_config.get('CpuQuota', 0) > 0:
+            cpus = float(host_config['CpuQuota']) / (host_config.get('CpuPeriod') or 100000)
+        # nproc respects the cpuset of the container
+        exit_code, output = self.execute(["nproc"])
+        if exit_code == 0:
+            available = int(output.strip())
+            cpus = available if cpus is None else min(cpus, available)
+        return max(1, int(cpus or 1))
+
+    def exec_stream(self, command, stdin = False):
+        """
+        run command in the running container and return a streams.ExecStream attached to it.
+        """
+        return ExecStream(self.client, self.get_container(), command, stdin)
+
     def get_hostname(self):
-        return self.client.inspect_container(container=self.__container)['Config']['Hostname']
+        return self.get_state()['Config']['Hostname']
 
     def get_ip(self):
-        return self.client.inspect_container(container=self.__container)["NetworkSettings"]["IPAddress"]
+        return self.get_state()["NetworkSettings"]["IPAddress"]
 
     def inspect(self):
-        return self.client.inspect_container(container=self.__container)
+        return self.get_state()
 
     def __enter__(self):
         self.create()
@@ -235,7 +707,8 @@ class DockerObject(object):
         self.destroy()
 
     def __del__(self):
-        self.destroy()
+        # no thread pool from a finalizer
+        self.destroy(parallel=False)
 
     def get_host_port(self, port):
         ports = self.get_port(port)
@@ -243,6 +716,18 @@ class DockerObject(object):
         port = int(port)
         return host, port
 
+    def wait_for_ports(self, ports = None, timeout = None):
+        """
+        wait until the ports (all the bound ports by default) accept connections, checking them all at once.
+        """
+        if ports is None:
+            ports = list(self.port_bindings or ())
+        if timeout is None:
+            timeout = self.readiness_timeout
+        with self.phase('readiness'):
+            self.ready_time = max(wait_for_targets([(self, port) for port in ports], timeout) or [0])
+        self.on_ready()
+
     def check_port_open(self, port):
         host, port = self.get_host_port(port)
         import socket
@@ -257,15 +742,52 @@ class DockerObject(object):
         # http://stackoverflow.com/questions/2257441/random-string-generation-with-upper-case-letters-and-digits-in-python
         return ''.join(random.choice(chars) for _ in range(size))
 
-    def wait_for_container(self):
+    def get_readiness_probe(self):
+        """
+        return the probes.Probe that tells when the container is ready.
+        """
         raise NotImplementedError()
 
+    def wait_for_probe(self, probe, timeout = None):
+        if timeout is None:
+            timeout = self.readiness_timeout
+        # fail right away if the container crashes instead of probing a dead port until the timeout
+        monitor = get_monitor(self.client)
+        stopped = monitor.waiter(self.get_container(), ('die', 'oom'))
+        try:
+            with self.phase('readiness'):
+                self.ready_time = wait_until_ready(probe, timeout, stopped=stopped)
+        finally:
+            monitor.cancel(self.get_container(), stopped)
+        self.logger.debug('Container %s ready after %.3f seconds', self.repo, self.ready_time)
+        self.on_ready()
+
+    def on_ready(self):
+        """
+        called once the readiness probe passed.
+        """
+        pass
+
+    def wait_for_log(self, pattern, count = 1, timeout = None):
+        self.wait_for_probe(LogProbe(self, pattern, count), timeout)
+
+    def wait_for_container(self):
+        self.wait_for_probe(self.get_readiness_probe())
+
+def _invalidate_on_event(ref):
+    def listener(event):
+        obj = ref()
+        if obj is not None and event_status(event) in STATE_EVENTS:
+            obj.invalidate()
+    return listener
+
 class RunCommandHelper(DockerObject):
 
     def __init__(self, command, linked=None, binds = None):
         linked_repo = "ubuntu" if linked is None else linked.get_repository()
         linked_tag  = "14.04"  if linked is None else linked.get_tag()
-        super(RunCommandHelper, self).__init__(linked_repo, linked_tag)
+        client      = None     if linked is None else linked.client
+        super(RunCommandHelper, self).__init__(linked_repo, linked_tag, client=client, reuse=False)
         if binds:
             self.set_volumes(binds)
         if linked:
@@ -0,0 +1,288 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Compressed, chunked and checksummed dump archives.
+
+An archive is a directory of fixed size chunks of the compressed dump and a manifest.json with
+the sha256 of every chunk and of the whole uncompressed dump. dumps are compressed while they
+are downloaded, with zstd (on all cores) if the zstandard package is installed or gzip otherwise,
+and the whole archive is verified before it is uploaded.
+
+    >>> p.download_dump('fixture', archive=True)
+    >>> p.upload_dump('fixture')
+
+    python -m dockerobject.dumpio pack dump.sql fixture
+    python -m dockerobject.dumpio unpack fixture dump.sql
+    python -m dockerobject.dumpio verify fixture
+"""
+
+from .locks import read_json, write_json
+from .streams import iter_chunks, write_chunks
+import argparse
+import hashlib
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT = 'dockerobject-dump'
+MANIFEST = 'manifest.json'
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+EXTENSIONS = {'zstd' : 'zst', 'gzip' : 'gz'}
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+def _compressor(codec, level):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd needs the zstandard package")
+        # threads=-1 compresses on all the cores
+        return zstandard.ZstdCompressor(level=level or 3, threads=-1).compressobj()
+    if codec == 'gzip':
+        return zlib.compressobj(level or 6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raise ValueError("unknown codec %s" % codec)
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    raise ValueError("unknown codec %s" % codec)
+
+def is_archive(path):
+    return isinstance(path, str) and os.path.isfile(os.path.join(path, MANIFEST))
+
+class _ChunkWriter(object):
+    """
+    writes compressed data to chunk files of chunk_size bytes.
+    """
+
+    def __init__(self, directory, extension, chunk_size):
+        self.directory = directory
+        self.extension = extension
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.file = None
+
+    def __open(self):
+        name = 'chunk-%06d.%s' % (len(self.chunks), self.extension)
+        self.file = open(os.path.join(self.directory, name), 'wb')
+        self.digest = hashlib.sha256()
+        self.chunks.append({'name' : name, 'size' : 0})
+
+    def __close(self):
+        self.file.close()
+        self.file = None
+        self.chunks[-1]['sha256'] = self.digest.hexdigest()
+
+    def write(self, data):
+        while data:
+            if self.file is None:
+                self.__open()
+            chunk = self.chunks[-1]
+            part = data[:self.chunk_size - chunk['size']]
+            data = data[len(part):]
+            self.file.write(part)
+            self.digest.update(part)
+            chunk['size'] += len(part)
+            if chunk['size'] == self.chunk_size:
+                self.__close()
+
+    def close(self):
+        if self.file is not None:
+            self.__close()
+        return self.chunks
+
+def write_archive(source, directory, codec = None, level = None, chunk_size = DEFAULT_CHUNK_SIZE):
+    """
+    compress source (a path, a file like object or an iterable of bytes) into an archive in directory.
+    returns the manifest.
+    """
+    codec = codec or default_codec()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    compressor = _compressor(codec, level)
+    writer = _ChunkWriter(directory, EXTENSIONS[codec], chunk_size)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in iter_chunks(source):
+            digest.update(chunk)
+            size += len(chunk)
+            writer.write(compressor.compress(chunk))
+        writer.write(compressor.flush())
+    finally:
+        chunks = writer.close()
+    manifest = {
+        'format' : FORMAT,
+        'version' : 1,
+        'codec' : codec,
+        'chunk_size' : chunk_size,
+        'size' : size,
+        'sha256' : digest.hexdigest(),
+        'chunks' : chunks,
+    }
+    write_json(os.path.join(directory, MANIFEST), manifest)
+    # chunks of an archive that was overwritten
+    names = set(c['name'] for c in chunks)
+    for name in os.listdir(directory):
+        if name.startswith('chunk-') and name not in names:
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+def read_manifest(directory):
+    manifest = read_json(os.path.join(directory, MANIFEST), None)
+    if manifest is None or manifest.get('format') != FORMAT:
+        raise RuntimeError("%s is not a dump archive" % directory)
+    return manifest
+
+def _verify_chunk(directory, chunk):
+    digest = hashlib.sha256()
+    size = 0
+    for data in iter_chunks(os.path.join(directory, chunk['name'])):
+        digest.update(data)
+        size += len(data)
+    if size != chunk['size'] or digest.hexdigest() != chunk['sha256']:
+        raise RuntimeError("Corrupt dump archive %s: checksum mismatch in %s" % (directory, chunk['name']))
+
+def read_archive(directory, verify = True):
+    """
+    yield the uncompressed dump of the archive in directory. with verify, every chunk is checked
+    before it is decompressed, and the whole dump once it ends, i.e. after all of it was yielded.
+    use verify_archive first to fail before any of a corrupt dump is used.
+    """
+    manifest = read_manifest(directory)
+    decompressor = _decompressor(manifest['codec'])
+    digest = hashlib.sha256()
+    for chunk in manifest['chunks']:
+        if verify:
+            _verify_chunk(directory, chunk)
+        for data in iter_chunks(os.path.join(directory, chunk['name'])):
+            data = decompressor.decompress(data)
+            if data:
+                digest.update(data)
+                yield data
+    flush = getattr(decompressor, 'flush', None)
+    data = flush() if flush is not None else b''
+    if data:
+        digest.update(data)
+        yield data
+    if verify and digest.hexdigest() != manifest['sha256']:
+        raise RuntimeError("Corrupt dump archive %s: checksum mismatch" % directory)
+
+# mysqldump comments that start a table, a view stub and what comes after the tables
+_TABLE_MARKER = b'-- Table structure for table `'
+_VIEW_MARKERS = (
+    b'-- Temporary view structure for view',
+    b'-- Temporary table structure for view',
+)
+_TRAILER_MARKERS = (
+    b'-- Final view structure for view',
+    b'-- Dumping routines for database',
+    b'-- Dumping events for database',
+    b'/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;',
+)
+
+def _iter_lines(chunks):
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if rest:
+        yield rest
+
+def split_sql_dump(source, directory):
+    """
+    split a mysqldump sql dump into the files of directory: the header (session settings), the
+    view stubs (placeholders that views are created over in the trailer), a file per table (its
+    create statement, data and triggers) and the trailer (views, routines and whatever follows
+    the tables). returns (header path, views path, [(table, path)], trailer path).
+    """
+    header = os.path.join(directory, 'header.sql')
+    views = os.path.join(directory, 'views.sql')
+    trailer = os.path.join(directory, 'trailer.sql')
+    tables = []
+    out = open(header, 'wb')
+    stubs = open(views, 'wb')
+    in_trailer = False
+    try:
+        for line in _iter_lines(iter_chunks(source)):
+            if not in_trailer and line.startswith(_TABLE_MARKER):
+                if out is not stubs:
+                    out.close()
+                name = line[len(_TABLE_MARKER):].rstrip().rstrip(b'`').decode('utf-8')
+                path = os.path.join(directory, 'table-%06d.sql' % len(tables))
+                tables.append((name, path))
+                out = open(path, 'wb')
+            elif not in_trailer and line.startswith(_VIEW_MARKERS):
+                # stubs come between the tables, they are loaded once before them
+                if out is not stubs:
+                    out.close()
+                out = stubs
+            elif not in_trailer and tables and line.startswith(_TRAILER_MARKERS):
+                # anything after the tables runs once they are all loaded, in order
+                if out is not stubs:
+                    out.close()
+                out = open(trailer, 'wb')
+                in_trailer = True
+            out.write(line)
+    finally:
+        if out is not stubs:
+            out.close()
+        stubs.close()
+    if not in_trailer:
+        open(trailer, 'wb').close()
+    return header, views, tables, trailer
+
+def verify_archive(directory):
+    """
+    check the chunks and the uncompressed dump of an archive. raises RuntimeError if it is corrupt.
+    """
+    for data in read_archive(directory):
+        pass
+    return read_manifest(directory)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m dockerobject.dumpio', description='Pack, unpack and verify dump archives.')
+    parser.add_argument('command', choices=['pack', 'unpack', 'verify'])
+    parser.add_argument('source')
+    parser.add_argument('target', nargs='?')
+    parser.add_argument('--codec', choices=sorted(EXTENSIONS))
+    parser.add_argument('--level', type=int)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        manifest = verify_archive(args.source)
+        compressed = sum(c['size'] for c in manifest['chunks'])
+        print('%s: %d chunks, %d bytes, %d compressed (%s)' % (args.source, len(manifest['chunks']), manifest['size'], compressed, manifest['codec']))
+        return
+    if args.target is None:
+        parser.error('%s needs a target' % args.command)
+    if args.command == 'pack':
+        write_archive(args.source, args.target, args.codec, args.level, args.chunk_size)
+    else:
+        write_chunks(args.target, read_archive(args.source))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .metrics import unwrap
+from collections import defaultdict
+import json
+import logging
+import threading
+import time
+
+# container events that change the state cached by DockerObject
+STATE_EVENTS = ('create', 'start', 'restart', 'pause', 'unpause', 'stop', 'kill', 'die', 'oom', 'destroy')
+CONNECT_TIMEOUT = 5
+# seconds until the events stream is reopened, a closed monitor's thread ends by then
+STREAM_WINDOW = 60
+
+def event_status(event):
+    """
+    return the status of an event, e.g. 'die' or 'health_status'.
+    """
+    status = event.get('status') or event.get('Action') or ''
+    return status.split(':')[0]
+
+def event_container(event):
+    return event.get('id') or event.get('Actor', {}).get('ID')
+
+class Waiter(object):
+    """
+    Fires once with the first event (for one container) whose status is in statuses.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.event = None
+        self.__fired = threading.Event()
+        self.__lock = threading.Lock()
+        self.__callbacks = []
+
+    def fire(self, event):
+        with self.__lock:
+            self.event = event
+            self.__fired.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            callback(event)
+
+    def add_callback(self, callback):
+        """
+        call callback(event) from the events thread when the waiter fires (right away if it already did).
+        """
+        with self.__lock:
+            if not self.__fired.is_set():
+                self.__callbacks.append(callback)
+                return
+        callback(self.event)
+
+    def is_set(self):
+        return self.__fired.is_set()
+
+    def wait(self, timeout = None):
+        """
+        return the event, or None on timeout.
+        """
+        self.__fired.wait(timeout)
+        return self.event
+
+class EventMonitor(object):
+    """
+    Single background subscriber to the events stream of one docker daemon.
+    Dispatches container events to the listeners and waiters registered for each container,
+    so any number of containers are watched over one connection.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        from .dockerobject import LOGGER
+        self.logger = logging.getLogger(LOGGER).getChild('events')
+        self.__lock = threading.Lock()
+        self.__listeners = defaultdict(list)
+        self.__waiters = defaultdict(list)
+        self.__connected = threading.Event()
+        self.__closed = threading.Event()
+        self.__thread = None
+        self.__since = None
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is None and not self.__closed.is_set():
+                self.__thread = threading.Thread(target=self.__run, name='dockerobject-events')
+                self.__thread.daemon = True
+                self.__thread.start()
+
+    def is_connected(self, timeout = CONNECT_TIMEOUT):
+        """
+        start the monitor if needed, and return True once it is subscribed to the daemon.
+        """
+        self.start()
+        return self.__connected.wait(timeout) and not self.__closed.is_set()
+
+    def close(self):
+        """
+        stop watching the daemon. the thread ends with the events stream it reads, at the next
+        event or within STREAM_WINDOW seconds.
+        """
+        self.__closed.set()
+
+    def __run(self):
+        # pooled clients hand out a dedicated client for the long lived stream
+        new_client = getattr(self.client, 'new_client', None)
+        if self.__since is None:
+            self.__since = int(time.time())
+        while not self.__closed.is_set():
+            # the daemon ends the stream at until, and the next one starts there
+            until = int(time.time() + STREAM_WINDOW)
+            try:
+                client = new_client() if new_client else self.client
+                events = client.events(since=self.__since, until=until, decode=True)
+                self.__connected.set()
+                for event in events:
+                    if self.__closed.is_set():
+                        return
+                    if not isinstance(event, dict):
+                        event = json.loads(event)
+                    # on reconnect, replay what was missed
+                    self.__since = event.get('time', self.__since)
+                    self.dispatch(event)
+                # or earlier, if the daemon ended it
+                self.__since = max(self.__since, min(until, int(time.time())))
+            except Exception as e:
+                self.logger.debug('Events stream disconnected: %s', e)
+                time.sleep(1)
+
+    def dispatch(self, event):
+        container = event_container(event)
+        if not container:
+            return
+        status = event_status(event)
+        with self.__lock:
+            listeners = list(self.__listeners.get(container, ()))
+            fired = [w for w in self.__waiters.get(container, ()) if status in w.statuses]
+            if fired:
+                self.__waiters[container] = [w for w in self.__waiters[container] if w not in fired]
+        for waiter in fired:
+            waiter.fire(event)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                self.logger.exception('Error in events listener')
+
+    def subscribe(self, container, listener):
+        """
+        call listener(event) for every event of container.
+        """
+        self.start()
+        with self.__lock:
+            self.__listeners[container].append(listener)
+
+    def unsubscribe(self, container, listener):
+        with self.__lock:
+            listeners = self.__listeners.get(container)
+            if listeners and listener in listeners:
+                listeners.remove(listener)
+                if not listeners:
+                    del self.__listeners[container]
+
+    def waiter(self, container, statuses):
+        """
+        return a Waiter that fires on the next event of container with a status in statuses.
+        """
+        waiter = Waiter(statuses)
+        self.start()
+        with self.__lock:
+            self.__waiters[container].append(waiter)
+        return waiter
+
+    def cancel(self, container, waiter):
+        with self.__lock:
+            waiters = self.__waiters.get(container)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self.__waiters.pop(container, None)
+
+_lock = threading.Lock()
+_monitors = {}
+
+def get_monitor(client):
+    """
+    return the process wide EventMonitor of client.
+    """
+    client = unwrap(client)
+    with _lock:
+        key = id(client)
+        if key not in _monitors:
+            _monitors[key] = (client, EventMonitor(client))
+        return _monitors[key][1]
+
+def close_monitor(client):
+    """
+    close the EventMonitor of client, if it has one. get_monitor(client) starts a new one.
+    """
+    client = unwrap(client)
+    with _lock:
+        monitor = _monitors.pop(id(client), (None, None))[1]
+    if monitor is not None:
+        monitor.close()
+
+def wait_all(waiters, timeout = None):
+    """
+    wait for all the waiters. returns their events (None for the ones that timed out).
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    events = []
+    for waiter in waiters:
+        remaining = None if deadline is None else max(0, deadline - time.time())
+        events.append(waiter.wait(remaining))
+    return events
@@ -0,0 +1,127 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import threading
+import time
+
+DEFAULT_TTL = 30
+
+class _DaemonImages(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refreshed = None
+        self.repos = set()
+        self.tags = set()
+
+class _Pull(object):
+    def __init__(self):
+        self.done = threading.Event()
+        # the exception of a failed pull, raised to the threads that waited for it
+        self.error = None
+
+class ImageIndex(object):
+    """
+    Process wide index of the images present on each docker daemon.
+    The index is refreshed when older than ttl seconds or after a pull, and concurrent
+    requests for the same missing image share a single pull.
+    """
+
+    def __init__(self, ttl = DEFAULT_TTL):
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__daemons = {}
+        self.__pulls = {}
+
+    def __daemon(self, client):
+        key = getattr(client, 'base_url', None) or id(client)
+        with self.__lock:
+            if key not in self.__daemons:
+                self.__daemons[key] = _DaemonImages()
+            return key, self.__daemons[key]
+
+    def refresh(self, client, max_age = 0):
+        key, images = self.__daemon(client)
+        requested = time.time()
+        with images.lock:
+            # someone else refreshed while we were waiting for the lock
+            if images.refreshed is not None and images.refreshed >= requested - max_age:
+                return
+            repos = set()
+            tags = set()
+            for image in client.images():
+                for repo_tag in image.get('RepoTags') or []:
+                    if repo_tag == '<none>:<none>':
+                        continue
+                    tags.add(repo_tag)
+                    repos.add(repo_tag.rsplit(':', 1)[0])
+            images.repos = repos
+            images.tags = tags
+            images.refreshed = requested
+
+    def invalidate(self, client):
+        key, images = self.__daemon(client)
+        with images.lock:
+            images.refreshed = None
+
+    def has_image(self, client, repository, tag = None, max_age = None):
+        if max_age is None:
+            max_age = self.ttl
+        key, images = self.__daemon(client)
+        self.refresh(client, max_age)
+        if tag is None:
+            return repository in images.repos
+        # TODO: check if tags are case sensitive
+        return repository + ':' + tag in images.tags
+
+    def pull_if_needed(self, client, repository, tag = None, insecure_registry = False, logger = None):
+        """
+        pull repository:tag unless it is already present. returns True if a pull was made.
+        """
+        if self.has_image(client, repository, tag):
+            return False
+
+        key = (self.__daemon(client)[0], repository, tag)
+        with self.__lock:
+            pull = self.__pulls.get(key)
+            owner = pull is None
+            if owner:
+                pull = self.__pulls[key] = _Pull()
+        if not owner:
+            # another thread is already pulling this image
+            pull.done.wait()
+            if pull.error is not None:
+                raise pull.error
+            return False
+
+        try:
+            # the index may be stale, make sure the image is really missing
+            if self.has_image(client, repository, tag, max_age=0):
+                return False
+            if logger:
+                logger.debug('Pulling %s:%s', repository, tag)
+            client.pull(repository=repository, tag=tag, insecure_registry=insecure_registry)
+            self.invalidate(client)
+            return True
+        except Exception as e:
+            pull.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__pulls[key]
+            pull.done.set()
+
+_index = ImageIndex()
+
+def get_image_index():
+    return _index
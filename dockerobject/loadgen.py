@@ -0,0 +1,237 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+HTTP load generator.
+
+Workers send a weighted mix of requests over keep-alive connections (one session per worker),
+either as fast as they can (closed loop) or at a fixed total rate (open loop). at a fixed rate,
+latency is measured from when a request was due rather than when it was sent, so a stalled
+server is not hidden by requests that were never sent (coordinated omission).
+
+    result = LoadGenerator('http://localhost:8080', [(9, 'GET', '/'), (1, 'POST', '/login', 'user=a')],
+                           concurrency=16, rate=500).run(duration=30)
+    print(result)
+"""
+
+from collections import defaultdict
+import bisect
+import itertools
+import math
+import random
+import threading
+import time
+
+class Histogram(object):
+    """
+    HdrHistogram style latency histogram: values (microseconds) are recorded with digits
+    significant decimal digits in log-linear buckets, so memory is bounded for any range.
+    """
+
+    def __init__(self, digits = 3):
+        self.sub_bucket_bits = int(math.ceil(math.log(2 * 10 ** digits, 2)))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.half = self.sub_bucket_count >> 1
+        self.counts = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def __index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return (shift + 1) * self.half + (value >> shift) - self.half
+
+    def __highest(self, index):
+        # the highest value that falls in the bucket of index
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.half + 1
+        sub = (index - self.sub_bucket_count) % self.half + self.half
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        self.counts[self.__index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, p):
+        """
+        return the value at percentile p (0-100).
+        """
+        if not self.count:
+            return 0
+        target = max(1, int(math.ceil(p / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.__highest(index), self.max)
+        return self.max
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+class LoadResult(object):
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, histogram, statuses, errors, elapsed):
+        self.histogram = histogram
+        # status code -> count
+        self.statuses = statuses
+        # exception class name -> count
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def requests(self):
+        return self.histogram.count
+
+    def failures(self):
+        return sum(self.errors.values()) + sum(c for s, c in self.statuses.items() if s >= 400)
+
+    def throughput(self):
+        return self.requests() / self.elapsed if self.elapsed else 0.0
+
+    def error_rate(self):
+        return float(self.failures()) / self.requests() if self.requests() else 0.0
+
+    def latency(self, p):
+        """
+        latency at percentile p, in seconds.
+        """
+        return self.histogram.percentile(p) / 1e6
+
+    def to_dict(self):
+        return {
+            'requests' : self.requests(),
+            'seconds' : self.elapsed,
+            'throughput' : self.throughput(),
+            'error_rate' : self.error_rate(),
+            'statuses' : dict(self.statuses),
+            'errors' : dict(self.errors),
+            'latency' : dict([('p%g' % p, self.latency(p)) for p in self.PERCENTILES] +
+                             [('mean', self.histogram.mean() / 1e6), ('max', self.histogram.max / 1e6)]),
+        }
+
+    def __str__(self):
+        lines = ['%d requests in %.2fs, %.1f req/s, %.2f%% errors' % (self.requests(), self.elapsed, self.throughput(), self.error_rate() * 100)]
+        lines.append('latency ms: ' + ', '.join('p%g %.2f' % (p, self.latency(p) * 1000) for p in self.PERCENTILES) +
+                     ', max %.2f' % (self.histogram.max / 1e3))
+        return '\n'.join(lines)
+
+class LoadGenerator(object):
+    """
+    requests is a list of (weight, method, path) or (weight, method, path, body) to pick from.
+    concurrency workers (and connections) send them; with rate, at rate requests per second in total.
+    """
+
+    def __init__(self, base_url, requests = None, concurrency = 8, rate = None, timeout = 10, seed = None):
+        self.base_url = base_url.rstrip('/')
+        self.requests = requests or [(1, 'GET', '/')]
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        # cumulative weights, to pick a request by bisecting
+        self.__weights = []
+        total = 0
+        for request in self.requests:
+            total += request[0]
+            self.__weights.append(total)
+
+    def __pick(self, rnd):
+        request = self.requests[bisect.bisect_right(self.__weights, rnd.random() * self.__weights[-1])]
+        body = request[3] if len(request) > 3 else None
+        return request[1], self.base_url + request[2], body
+
+    def run(self, duration = 10, count = None):
+        """
+        send requests for duration seconds (or until count requests were sent) and return a LoadResult.
+        """
+        import requests
+        start = time.time()
+        deadline = start + duration if duration else None
+        counter = itertools.count()
+        lock = threading.Lock()
+        histograms = []
+        statuses = defaultdict(int)
+        errors = defaultdict(int)
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            histogram = Histogram()
+            local_statuses = defaultdict(int)
+            local_errors = defaultdict(int)
+            try:
+                while True:
+                    with lock:
+                        i = next(counter)
+                    if count is not None and i >= count:
+                        break
+                    due = time.time()
+                    if self.rate:
+                        due = start + i / float(self.rate)
+                        delay = due - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                    if deadline is not None and time.time() >= deadline:
+                        break
+                    method, url, body = self.__pick(rnd)
+                    try:
+                        response = session.request(method, url, data=body, timeout=self.timeout)
+                        response.content
+                        local_statuses[response.status_code] += 1
+                    except requests.exceptions.RequestException as e:
+                        local_errors[e.__class__.__name__] += 1
+                    histogram.record((time.time() - due) * 1e6)
+            finally:
+                session.close()
+                with lock:
+                    histograms.append(histogram)
+                    for status, n in local_statuses.items():
+                        statuses[status] += n
+                    for error, n in local_errors.items():
+                        errors[error] += n
+
+        threads = [threading.Thread(target=worker, args=(self.random.random(),)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        histogram = Histogram()
+        for h in histograms:
+            histogram.merge(h)
+        return LoadResult(histogram, statuses, errors, elapsed)
@@ -0,0 +1,87 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import errno
+import fcntl
+import json
+import os
+import threading
+
+# where dockerobject keeps state shared by the processes of this host
+STATE_DIR = os.environ.get('DOCKEROBJECT_STATE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'dockerobject')
+
+def state_path(name):
+    if not os.path.isdir(STATE_DIR):
+        try:
+            os.makedirs(STATE_DIR)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    return os.path.join(STATE_DIR, name)
+
+class FileLock(object):
+    """
+    Exclusive lock shared by the threads of this process and by other processes (flock on path).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__fd = None
+
+    def acquire(self):
+        self.__lock.acquire()
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except Exception:
+            self.__lock.release()
+            raise
+        self.__fd = fd
+
+    def release(self):
+        fd, self.__fd = self.__fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        finally:
+            self.__lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type_, value_, tb):
+        self.release()
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+def read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def write_json(path, data):
+    # written aside and renamed, so readers never see half a file
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp, path)
@@ -0,0 +1,162 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Lifecycle timing and docker api call counts.
+
+Every DockerObject records how long each phase took (image_check, pull, create, start, readiness,
+upload_dump, download_dump) in obj.timings and counts its api calls in obj.api_calls.
+The process wide Metrics aggregates both per class into histograms and counters, calls the
+registered hooks for every phase, and exports Prometheus text or JSON.
+"""
+
+from collections import defaultdict
+import functools
+import json
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Histogram(object):
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {'count' : self.count,
+                'sum' : self.sum,
+                'buckets' : dict(('%g' % b, c) for b, c in zip(self.buckets, self.counts))}
+
+class Metrics(object):
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.__lock = threading.Lock()
+        self.__phases = {}
+        self.__api_calls = defaultdict(int)
+        self.__hooks = []
+
+    def add_hook(self, hook):
+        """
+        call hook(obj, phase, seconds) every time an object finishes a phase.
+        """
+        with self.__lock:
+            self.__hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self.__lock:
+            self.__hooks.remove(hook)
+
+    def observe(self, obj, phase, seconds):
+        key = (obj.__class__.__name__, phase)
+        with self.__lock:
+            if key not in self.__phases:
+                self.__phases[key] = Histogram(self.buckets)
+            self.__phases[key].observe(seconds)
+            hooks = list(self.__hooks)
+        for hook in hooks:
+            hook(obj, phase, seconds)
+
+    def count_api_call(self, owner, method):
+        with self.__lock:
+            self.__api_calls[(owner, method)] += 1
+
+    def reset(self):
+        with self.__lock:
+            self.__phases.clear()
+            self.__api_calls.clear()
+
+    def to_dict(self):
+        with self.__lock:
+            phases = []
+            for (cls, phase), histogram in sorted(self.__phases.items()):
+                item = histogram.to_dict()
+                item.update({'class' : cls, 'phase' : phase})
+                phases.append(item)
+            api_calls = [{'class' : cls, 'method' : method, 'count' : count}
+                         for (cls, method), count in sorted(self.__api_calls.items())]
+        return {'phases' : phases, 'api_calls' : api_calls}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        lines = ['# HELP dockerobject_phase_seconds Duration of container lifecycle phases.',
+                 '# TYPE dockerobject_phase_seconds histogram']
+        data = self.to_dict()
+        for item in data['phases']:
+            labels = 'class="%s",phase="%s"' % (item['class'], item['phase'])
+            buckets = sorted(item['buckets'].items(), key=lambda b: float(b[0]))
+            for bound, count in buckets:
+                lines.append('dockerobject_phase_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('dockerobject_phase_seconds_bucket{%s,le="+Inf"} %d' % (labels, item['count']))
+            lines.append('dockerobject_phase_seconds_sum{%s} %f' % (labels, item['sum']))
+            lines.append('dockerobject_phase_seconds_count{%s} %d' % (labels, item['count']))
+        lines.append('# HELP dockerobject_api_calls_total Docker api calls.')
+        lines.append('# TYPE dockerobject_api_calls_total counter')
+        for item in data['api_calls']:
+            lines.append('dockerobject_api_calls_total{class="%s",method="%s"} %d' % (item['class'], item['method'], item['count']))
+        return '\n'.join(lines) + '\n'
+
+_metrics = Metrics()
+
+def get_metrics():
+    return _metrics
+
+class CountingClient(object):
+    """
+    Forwards to a client and counts the api calls made through it, per owner and per method.
+    """
+
+    def __init__(self, client, owner, counts):
+        self.wrapped_client = client
+        self.owner = owner
+        self.counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped_client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.counts[name] += 1
+            _metrics.count_api_call(self.owner, name)
+            return attr(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+def timed(phase):
+    """
+    decorator that records the duration of a DockerObject method as phase.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.phase(phase):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def unwrap(client):
+    return getattr(client, 'wrapped_client', client)
@@ -0,0 +1,238 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .dockerobject import LOGGER
+import atexit
+import json
+import logging
+import threading
+import time
+
+class Lease(object):
+    """
+    A container leased from a ContainerPool. use as a context manager or call release().
+    """
+
+    def __init__(self, pool, obj):
+        self.pool = pool
+        self.obj = obj
+
+    def release(self):
+        if self.obj is not None:
+            obj, self.obj = self.obj, None
+            self.pool.release(obj)
+
+    def __enter__(self):
+        return self.obj
+
+    def __exit__(self, type_, value_, tb):
+        self.release()
+
+class ContainerPool(object):
+    """
+    Keeps started and ready containers created by factory, and hands them out as leases.
+    Returned containers are reset (if they have a reset method) and reused.
+    Between min_size and max_size containers are kept; idle containers above min_size are
+    destroyed after idle_timeout seconds, and idle containers are health checked every
+    health_interval seconds.
+    """
+
+    def __init__(self, factory, min_size = 1, max_size = 4, idle_timeout = 300, health_interval = 30):
+        if min_size > max_size:
+            raise ValueError("min_size is larger than max_size")
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.logger = logging.getLogger(LOGGER).getChild('pool')
+        self.__cond = threading.Condition()
+        self.__idle = []
+        self.__leased = 0
+        self.__starting = 0
+        self.__closed = False
+        self.__last_health_check = time.time()
+        self.__thread = threading.Thread(target=self.__maintain, name='dockerobject-pool')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def size(self):
+        with self.__cond:
+            return len(self.__idle) + self.__leased + self.__starting
+
+    def __size(self):
+        return len(self.__idle) + self.__leased + self.__starting
+
+    def __new(self):
+        obj = self.factory()
+        try:
+            obj.start()
+        except Exception:
+            obj.destroy()
+            raise
+        return obj
+
+    def lease(self, timeout = None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__cond:
+            while True:
+                if self.__closed:
+                    raise RuntimeError("pool is closed")
+                if self.__idle:
+                    obj, since = self.__idle.pop()
+                    self.__leased += 1
+                    return Lease(self, obj)
+                if self.__size() < self.max_size:
+                    self.__starting += 1
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError("Timeout waiting for a pooled container")
+                self.__cond.wait(remaining)
+
+        try:
+            obj = self.__new()
+        except Exception:
+            with self.__cond:
+                self.__starting -= 1
+                self.__cond.notify_all()
+            raise
+        with self.__cond:
+            self.__starting -= 1
+            self.__leased += 1
+        return Lease(self, obj)
+
+    def release(self, obj):
+        healthy = True
+        reset = getattr(obj, 'reset', None)
+        if reset is not None:
+            try:
+                reset()
+            except Exception:
+                self.logger.exception("Failed to reset pooled container, destroying it")
+                healthy = False
+        with self.__cond:
+            self.__leased -= 1
+            keep = healthy and not self.__closed
+            if keep:
+                self.__idle.append((obj, time.time()))
+            self.__cond.notify_all()
+        if not keep:
+            obj.destroy()
+
+    def __healthy(self, obj):
+        try:
+            if obj.should_start():
+                return False
+            return obj.get_readiness_probe().check()
+        except Exception:
+            return False
+
+    def __add_idle(self, obj, since):
+        """
+        add obj, that the maintenance thread started or checked (None if that failed), to the idle
+        list. if the pool was closed meanwhile, obj is destroyed instead.
+        """
+        with self.__cond:
+            self.__starting -= 1
+            closed = self.__closed
+            if obj is not None and not closed:
+                self.__idle.append((obj, since))
+            self.__cond.notify_all()
+        if obj is not None and closed:
+            obj.destroy()
+
+    def __maintain(self):
+        while True:
+            with self.__cond:
+                if self.__closed:
+                    return
+                now = time.time()
+                expired = []
+                keep = []
+                # idle list is ordered by return time, oldest first
+                for obj, since in self.__idle:
+                    if now - since > self.idle_timeout and self.__size() - len(expired) > self.min_size:
+                        expired.append(obj)
+                    else:
+                        keep.append((obj, since))
+                self.__idle = keep
+                check = []
+                if now - self.__last_health_check >= self.health_interval:
+                    self.__last_health_check = now
+                    check, self.__idle = self.__idle, []
+                    self.__starting += len(check)
+                missing = max(0, self.min_size - self.__size())
+                self.__starting += missing
+
+            for obj in expired:
+                self.logger.debug('Evicting idle container %s', obj.get_container())
+                obj.destroy()
+
+            for obj, since in check:
+                healthy = self.__healthy(obj)
+                if not healthy:
+                    self.logger.debug('Pooled container %s failed health check', obj.get_container())
+                    obj.destroy()
+                self.__add_idle(obj if healthy else None, since)
+
+            for i in range(missing):
+                obj = None
+                try:
+                    obj = self.__new()
+                except Exception:
+                    self.logger.exception("Failed to start pooled container")
+                self.__add_idle(obj, time.time())
+
+            with self.__cond:
+                self.__idle.sort(key=lambda item: item[1])
+                if not self.__closed:
+                    self.__cond.wait(min(self.health_interval, self.idle_timeout, 5))
+
+    def close(self):
+        """
+        destroy the idle containers. leased containers are destroyed when released.
+        """
+        with self.__cond:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.__cond.notify_all()
+        for obj, since in idle:
+            obj.destroy()
+
+    def is_closed(self):
+        return self.__closed
+
+_lock = threading.Lock()
+_pools = {}
+
+def get_pool(cls, min_size = 1, max_size = 4, **kwargs):
+    """
+    return the process wide pool of cls(**kwargs) instances, e.g. get_pool(Postgres, db="test").
+    a pool that was closed is replaced by a new one.
+    """
+    # kwargs may not be hashable, e.g. a dict of settings
+    key = (cls, json.dumps(kwargs, sort_keys=True, default=str))
+    with _lock:
+        if key not in _pools or _pools[key].is_closed():
+            _pools[key] = ContainerPool(lambda: cls(**kwargs), min_size=min_size, max_size=max_size)
+        return _pools[key]
+
+@atexit.register
+def close_pools():
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,176 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import re
+import socket
+import struct
+import time
+
+DEFAULT_TIMEOUT = 60
+INITIAL_DELAY = 0.005
+MAX_DELAY = 0.5
+
+class Probe(object):
+    """
+    Readiness probe. check() returns True once the service is ready.
+    """
+
+    def check(self):
+        raise NotImplementedError()
+
+    def __str__(self):
+        return self.__class__.__name__
+
+class TcpProbe(Probe):
+    """
+    Ready when the port accepts connections. Subclasses implement a protocol handshake by
+    setting payload (sent after connecting) and overriding accept (called with the first bytes received).
+    """
+    payload = None
+    expects_response = False
+
+    def __init__(self, host, port, timeout = 1.0):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+
+    def accept(self, data):
+        return True
+
+    def check(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except socket.error:
+            return False
+        try:
+            if self.payload is not None:
+                sock.sendall(self.payload)
+            data = None
+            if self.expects_response:
+                data = sock.recv(1024)
+                if not data:
+                    return False
+            return self.accept(data)
+        except socket.error:
+            return False
+        finally:
+            sock.close()
+
+    def __str__(self):
+        return '%s(%s:%d)' % (self.__class__.__name__, self.host, self.port)
+
+class PostgresProbe(TcpProbe):
+    """
+    Sends a startup message. the server answers with an authentication request once it accepts
+    connections, and with an error while it is still starting up.
+    """
+    expects_response = True
+
+    def __init__(self, host, port, user, database, timeout = 1.0):
+        super(PostgresProbe, self).__init__(host, port, timeout)
+        params = b''
+        for key, value in (('user', user), ('database', database)):
+            params += key.encode('utf-8') + b'\0' + value.encode('utf-8') + b'\0'
+        params += b'\0'
+        # protocol version 3.0
+        self.payload = struct.pack('!ii', len(params) + 8, 196608) + params
+
+    def accept(self, data):
+        return data[:1] == b'R'
+
+class MySqlProbe(TcpProbe):
+    """
+    Ready when the server sends its initial handshake packet (protocol version 10).
+    """
+    expects_response = True
+
+    def accept(self, data):
+        return len(data) > 4 and data[4:5] == b'\x0a'
+
+class HttpProbe(Probe):
+    """
+    Ready when a GET of url returns status. reuses one keep-alive session across checks.
+    """
+
+    def __init__(self, url, status = 200, timeout = 1.0, session = None):
+        import requests
+        self.url = url
+        self.status = status
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def check(self):
+        import requests
+        try:
+            return self.session.get(self.url, timeout=self.timeout).status_code == self.status
+        except requests.exceptions.RequestException:
+            return False
+
+    def __str__(self):
+        return 'HttpProbe(%s)' % self.url
+
+class LogProbe(Probe):
+    """
+    Ready when pattern appeared at least count times in the container output.
+    """
+
+    def __init__(self, obj, pattern, count = 1):
+        self.obj = obj
+        self.pattern = re.compile(pattern)
+        self.count = count
+
+    def check(self):
+        # matched line by line as the output streams in, stops reading once count is reached
+        found = 0
+        partial = {}
+        chunks = self.obj.iter_logs()
+        try:
+            for stream, data in chunks:
+                lines = (partial.pop(stream, b'') + data).split(b'\n')
+                partial[stream] = lines.pop()
+                for line in lines:
+                    found += len(self.pattern.findall(line.decode('utf-8', 'replace')))
+                if found >= self.count:
+                    return True
+        finally:
+            chunks.close()
+        for line in partial.values():
+            found += len(self.pattern.findall(line.decode('utf-8', 'replace')))
+        return found >= self.count
+
+    def __str__(self):
+        return 'LogProbe(%s)' % self.pattern.pattern
+
+def wait_until_ready(probe, timeout = DEFAULT_TIMEOUT, initial_delay = INITIAL_DELAY, max_delay = MAX_DELAY, stopped = None):
+    """
+    check probe with exponential backoff until it is ready or timeout seconds passed.
+    stopped is an optional events.Waiter (or threading.Event) that is set if the container stops.
+    returns the number of seconds it took, raises RuntimeError on timeout or when stopped.
+    """
+    start = time.time()
+    deadline = start + timeout
+    delay = initial_delay
+    while True:
+        if probe.check():
+            return time.time() - start
+        if stopped is not None and stopped.is_set():
+            raise RuntimeError('Container stopped while waiting for %s' % probe)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise RuntimeError('Timeout waiting for %s' % probe)
+        if stopped is not None:
+            stopped.wait(min(delay, remaining))
+        else:
+            time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
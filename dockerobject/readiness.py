@@ -0,0 +1,202 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Readiness checks of any number of tcp endpoints on one thread.
+
+Every target is probed with a non-blocking connect (and the probe's handshake, if any) and
+retried with its own exponential backoff, all multiplexed on one selector. waiting for N
+containers takes about as long as the slowest one.
+"""
+
+from .probes import TcpProbe, DEFAULT_TIMEOUT, INITIAL_DELAY, MAX_DELAY
+from multiprocessing.pool import ThreadPool
+import errno
+import selectors
+import socket
+import time
+
+# how long a single connect (or handshake) may take before it is retried
+ATTEMPT_TIMEOUT = 1.0
+
+_IN_PROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+def _parse(target, timeout):
+    """
+    return (probe, timeout) of target.
+    """
+    if isinstance(target, TcpProbe):
+        return target, timeout
+    if isinstance(target[0], TcpProbe):
+        return target[0], target[1]
+    host, port = target[:2]
+    if not isinstance(host, str):
+        # a DockerObject and one of its container ports
+        host, port = host.get_host_port(port)
+    return TcpProbe(host, port), target[2] if len(target) > 2 else timeout
+
+class _Check(object):
+
+    def __init__(self, target, timeout, start):
+        self.target = target
+        self.probe, timeout = _parse(target, timeout)
+        self.deadline = start + timeout
+        self.delay = INITIAL_DELAY
+        self.next_attempt = start
+        self.attempt_deadline = None
+        self.attempts = 0
+        self.sock = None
+        self.connected = False
+        self.addresses = [info[4] for info in socket.getaddrinfo(self.probe.host, self.probe.port, 0, socket.SOCK_STREAM)]
+
+class Multiplexer(object):
+
+    def __init__(self, targets, timeout = DEFAULT_TIMEOUT):
+        self.start = time.time()
+        self.checks = [_Check(t, timeout, self.start) for t in targets]
+        self.selector = selectors.DefaultSelector()
+
+    def __connect(self, check, now):
+        address = check.addresses[check.attempts % len(check.addresses)]
+        family = socket.AF_INET6 if len(address) > 2 else socket.AF_INET
+        check.attempts += 1
+        check.sock = socket.socket(family, socket.SOCK_STREAM)
+        check.sock.setblocking(False)
+        check.connected = False
+        check.attempt_deadline = now + min(ATTEMPT_TIMEOUT, check.probe.timeout)
+        if check.sock.connect_ex(address) not in _IN_PROGRESS:
+            return self.__retry(check, now)
+        self.selector.register(check.sock, selectors.EVENT_WRITE, check)
+
+    def __close(self, check):
+        if check.sock is None:
+            return
+        try:
+            self.selector.unregister(check.sock)
+        except (KeyError, ValueError):
+            pass
+        check.sock.close()
+        check.sock = None
+
+    def __retry(self, check, now):
+        self.__close(check)
+        check.next_attempt = now + check.delay
+        check.delay = min(check.delay * 2, MAX_DELAY)
+
+    def __handle(self, check, now):
+        """
+        return True once the target is ready.
+        """
+        try:
+            if not check.connected:
+                if check.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                    return self.__retry(check, now)
+                check.connected = True
+                if check.probe.payload is not None:
+                    check.sock.send(check.probe.payload)
+                if check.probe.expects_response:
+                    self.selector.modify(check.sock, selectors.EVENT_READ, check)
+                    return False
+                data = None
+            else:
+                data = check.sock.recv(1024)
+                if not data:
+                    return self.__retry(check, now)
+            if check.probe.accept(data):
+                self.__close(check)
+                return True
+        except socket.error:
+            pass
+        return self.__retry(check, now)
+
+    def __iter__(self):
+        """
+        yield (target, seconds it took) for every target as soon as it is ready.
+        """
+        pending = list(self.checks)
+        try:
+            while pending:
+                now = time.time()
+                wakeup = now + MAX_DELAY
+                for check in pending:
+                    if check.sock is None and check.next_attempt <= now:
+                        self.__connect(check, now)
+                    elif check.sock is not None and check.attempt_deadline <= now:
+                        self.__retry(check, now)
+                    if check.deadline <= now:
+                        raise RuntimeError('Timeout waiting for %s' % check.probe)
+                    wakeup = min(wakeup, check.deadline, check.attempt_deadline if check.sock else check.next_attempt)
+
+                events = self.selector.select(max(0, wakeup - time.time())) if self.selector.get_map() else []
+                if not events:
+                    time.sleep(max(0, wakeup - time.time()))
+                now = time.time()
+                for key, mask in events:
+                    check = key.data
+                    if self.__handle(check, now):
+                        pending.remove(check)
+                        yield check.target, now - self.start
+        finally:
+            for check in self.checks:
+                self.__close(check)
+            self.selector.close()
+
+def iter_ready(targets, timeout = DEFAULT_TIMEOUT):
+    """
+    check all the targets at once and yield (target, seconds) for each one as it becomes ready.
+    a target is a probes.TcpProbe (e.g. a PostgresProbe, whose handshake is done as well) or a
+    (DockerObject, container port) or (host, port) tuple. (probe, timeout) and
+    (DockerObject or host, port, timeout) give the target its own timeout.
+    raises RuntimeError when a target is not ready in time.
+    """
+    return iter(Multiplexer(targets, timeout))
+
+def wait_for_targets(targets, timeout = DEFAULT_TIMEOUT):
+    """
+    wait until all the targets are ready. returns the seconds each one took, in order.
+    """
+    targets = list(targets)
+    seconds = {}
+    for target, took in iter_ready(targets, timeout):
+        seconds[id(target)] = took
+    return [seconds[id(t)] for t in targets]
+
+def wait_for_containers(objs, timeout = None, workers = 16):
+    """
+    wait for the readiness probes of all the objects. tcp probes are multiplexed on this thread,
+    others (e.g. http or log probes) run obj.wait_for_container on a thread each.
+    """
+    probes = []
+    others = []
+    for obj in objs:
+        probe = obj.get_readiness_probe()
+        if isinstance(probe, TcpProbe):
+            probes.append((obj, (probe, timeout or obj.readiness_timeout)))
+        else:
+            others.append(obj)
+
+    pool = ThreadPool(min(workers, len(others))) if others else None
+    try:
+        results = pool.map_async(lambda obj: obj.wait_for_container(), others) if pool else None
+        targets = [target for obj, target in probes]
+        for (obj, target), seconds in zip(probes, wait_for_targets(targets)):
+            obj.ready_time = seconds
+            obj.record_phase('readiness', seconds)
+            obj.on_ready()
+        if results is not None:
+            results.get()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -0,0 +1,175 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Bulk removal of labelled containers, and a reaper for containers whose owner process is gone.
+
+    python -m dockerobject.reaper              # remove orphaned containers once
+    python -m dockerobject.reaper --interval 60
+    python -m dockerobject.reaper --session <id>
+    python -m dockerobject.reaper --reused      # remove the containers kept for reuse
+"""
+
+from .client import get_client
+from .dockerobject import LOGGER, SESSION_ID, LABEL_SESSION, LABEL_OWNER_PID, LABEL_OWNER_HOST, LABEL_FINGERPRINT
+from .locks import pid_alive
+from .shared import LABEL_SHARED, in_use
+from docker.errors import APIError
+from multiprocessing.pool import ThreadPool
+import argparse
+import logging
+import socket
+import threading
+import time
+
+DEFAULT_WORKERS = 16
+DEFAULT_INTERVAL = 60
+
+logger = logging.getLogger(LOGGER).getChild('reaper')
+
+def labelled_containers(client = None, session = None):
+    """
+    return all the containers (running or not) created by dockerobject, or only by session.
+    """
+    client = client or get_client()
+    label = LABEL_SESSION if session is None else '%s=%s' % (LABEL_SESSION, session)
+    return client.containers(all=True, filters={'label' : label})
+
+def remove_containers(containers, client = None, workers = DEFAULT_WORKERS):
+    """
+    force remove containers (ids or dicts from client.containers) in parallel. returns the removed ids.
+    """
+    client = client or get_client()
+    ids = [c['Id'] if isinstance(c, dict) else c for c in containers]
+    if not ids:
+        return []
+
+    def remove(container):
+        try:
+            client.remove_container(container=container, force=True)
+            return container
+        except APIError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            logger.warning('Failed to remove container %s: %s', container, e)
+            return None
+
+    pool = ThreadPool(min(workers, len(ids)))
+    try:
+        removed = pool.map(remove, ids)
+    finally:
+        pool.close()
+        pool.join()
+    return [c for c in removed if c is not None]
+
+def reused_containers(client = None):
+    """
+    return the containers kept for reuse, see DockerObject.set_reuse.
+    """
+    client = client or get_client()
+    return client.containers(all=True, filters={'label' : LABEL_FINGERPRINT})
+
+def destroy_all(session = SESSION_ID, client = None, workers = DEFAULT_WORKERS):
+    """
+    remove all the containers of session (this process by default) in parallel.
+    """
+    return remove_containers(labelled_containers(client, session), client, workers)
+
+def is_orphan(container, hostname = None):
+    """
+    True if the container was created on this host by a process that is no longer running.
+    containers of other hosts are never orphans, as their owner can't be checked. reused
+    containers are kept for the next process, and shared servers (see shared.py) are orphans
+    only once no live process leases them.
+    """
+    labels = container.get('Labels') or {}
+    if labels.get(LABEL_OWNER_HOST) != (hostname or socket.gethostname()):
+        return False
+    if LABEL_FINGERPRINT in labels:
+        return False
+    if LABEL_SHARED in labels:
+        return not in_use(labels[LABEL_SHARED])
+    try:
+        pid = int(labels[LABEL_OWNER_PID])
+    except (KeyError, ValueError):
+        return False
+    return not pid_alive(pid)
+
+def reap(client = None, workers = DEFAULT_WORKERS):
+    """
+    remove the orphaned containers. returns the removed ids.
+    """
+    hostname = socket.gethostname()
+    orphans = [c for c in labelled_containers(client) if is_orphan(c, hostname)]
+    if orphans:
+        logger.debug('Reaping %d orphaned containers', len(orphans))
+    return remove_containers(orphans, client, workers)
+
+class Reaper(object):
+    """
+    Background thread that reaps orphaned containers every interval seconds.
+    """
+
+    def __init__(self, client = None, interval = DEFAULT_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name='dockerobject-reaper')
+        self.__thread.daemon = True
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stop.set()
+        self.__thread.join()
+
+    def __run(self):
+        while not self.__stop.is_set():
+            try:
+                reap(self.client)
+            except Exception:
+                logger.exception('Failed to reap containers')
+            self.__stop.wait(self.interval)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m dockerobject.reaper', description='Remove containers left behind by dockerobject.')
+    parser.add_argument('--session', help='remove all the containers of this session instead of the orphaned ones')
+    parser.add_argument('--interval', type=float, help='keep running and reap every INTERVAL seconds')
+    parser.add_argument('--reused', action='store_true', help='remove the containers kept for reuse')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG)
+
+    if args.session:
+        removed = destroy_all(args.session)
+        print('removed %d containers' % len(removed))
+        return
+    if args.reused:
+        removed = remove_containers(reused_containers())
+        print('removed %d containers' % len(removed))
+        return
+    if args.interval:
+        reaper = Reaper(interval=args.interval).start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            reaper.stop()
+        return
+    removed = reap()
+    print('removed %d containers' % len(removed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+import threading
+
+DEFAULT_WORKERS = 16
+
+def run_tasks(tasks, workers = DEFAULT_WORKERS):
+    """
+    tasks is a dict of key -> (callable, [keys of tasks it depends on]).
+    every task runs once all of its dependencies are done; independent tasks run in parallel.
+    the first error stops scheduling new tasks and is raised once the running ones are done.
+    with workers 0, the tasks run one by one in the calling thread (e.g. from a finalizer).
+    """
+    if not tasks:
+        return
+    waiting = {}
+    dependents = defaultdict(list)
+    for key, (_, deps) in tasks.items():
+        waiting[key] = set(d for d in deps if d in tasks)
+        for d in waiting[key]:
+            dependents[d].append(key)
+
+    cond = threading.Condition()
+    state = {'running' : 0, 'error' : None}
+    pool = ThreadPool(min(workers, len(tasks))) if workers > 0 else None
+    # the tasks to run in the calling thread, without a pool
+    serial = []
+
+    def run(key):
+        # anything, e.g. a KeyboardInterrupt, is raised once the other workers are done
+        try:
+            tasks[key][0]()
+            return key, None
+        except BaseException as e:
+            return key, e
+
+    def submit(key):
+        del waiting[key]
+        state['running'] += 1
+        if pool is None:
+            serial.append(key)
+        else:
+            pool.apply_async(run, (key,), callback=done)
+
+    def done(result):
+        key, error = result
+        with cond:
+            state['running'] -= 1
+            if error is not None and state['error'] is None:
+                state['error'] = error
+            if state['error'] is None:
+                for d in dependents[key]:
+                    waiting[d].discard(key)
+                    if not waiting[d]:
+                        submit(d)
+            cond.notify_all()
+
+    try:
+        with cond:
+            for key in [k for k, deps in waiting.items() if not deps]:
+                submit(key)
+            while serial:
+                done(run(serial.pop(0)))
+            while state['running']:
+                cond.wait()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if state['error'] is not None:
+        raise state['error']
+    if waiting:
+        raise RuntimeError("dependency cycle between containers")
+
+def collect(roots):
+    """
+    return the roots and all their internal containers (recursively), in discovery order.
+    """
+    nodes = []
+    seen = set()
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        nodes.append(node)
+        stack.extend(reversed(node.internal_containers))
+    return nodes
+
+def dependencies(node, nodes):
+    """
+    return [(linked node, needs readiness)] for the links of node that are part of nodes.
+    """
+    ids = set(id(n) for n in nodes)
+    return [(c, c not in node.no_wait_links) for c, name in node.links if id(c) in ids]
+
+def needs_readiness(nodes, wait):
+    """
+    return the ids of the nodes whose readiness is waited for: all of them if wait,
+    otherwise only those that a link needs ready.
+    """
+    needs_ready = set()
+    if wait:
+        needs_ready.update(id(n) for n in nodes)
+    for node in nodes:
+        for dep, ready in dependencies(node, nodes):
+            if ready:
+                needs_ready.add(id(dep))
+    return needs_ready
+
+def create_graph(roots, workers = DEFAULT_WORKERS):
+    """
+    pull and create all the containers in the graph, in parallel where links allow.
+    """
+    nodes = collect(roots)
+
+    def create(node):
+        if node.should_create():
+            node.create_container()
+
+    tasks = {}
+    for node in nodes:
+        # links are set at create time, so linked containers are created first
+        deps = [('create', id(dep)) for dep, ready in dependencies(node, nodes)]
+        tasks[('create', id(node))] = (lambda node=node: create(node), deps)
+    run_tasks(tasks, workers)
+
+def start_graph(roots, wait = True, workers = DEFAULT_WORKERS):
+    """
+    create and start all the containers in the graph. a container is started as soon as the
+    containers it links to are started (or ready, if the link needs it).
+    """
+    nodes = collect(roots)
+    needs_ready = needs_readiness(nodes, wait)
+
+    def create(node):
+        if node.should_create():
+            node.create_container()
+
+    def start(node):
+        node.start_container()
+        node.exit_code = None
+
+    def ready(node):
+        # an adopted container is already ready
+        if not node.reused:
+            node.wait_for_container()
+
+    tasks = {}
+    for node in nodes:
+        key = id(node)
+        create_deps = []
+        deps = [('create', key)]
+        for dep, needs in dependencies(node, nodes):
+            create_deps.append(('create', id(dep)))
+            deps.append(('ready' if needs else 'start', id(dep)))
+        tasks[('create', key)] = (lambda node=node: create(node), create_deps)
+        tasks[('start', key)] = (lambda node=node: start(node), deps)
+        if key in needs_ready:
+            tasks[('ready', key)] = (lambda node=node: ready(node), [('start', key)])
+    run_tasks(tasks, workers)
+
+def destroy_graph(roots, workers = DEFAULT_WORKERS):
+    """
+    remove all the containers in the graph, in parallel and in reverse dependency order.
+    containers that are not owned (e.g. reused ones) are only detached from.
+    """
+    nodes = collect(roots)
+    tasks = {}
+    for node in nodes:
+        tasks[id(node)] = (node.remove_container, [])
+    for node in nodes:
+        for dep, ready in dependencies(node, nodes):
+            # dep is removed only after everything that links to it
+            tasks[id(dep)][1].append(id(node))
+    run_tasks(tasks, workers)
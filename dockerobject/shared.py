@@ -0,0 +1,205 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+One database server shared by the processes of this host, with a database and user per lease.
+
+The first process to lease starts the server and records it in a registry file (guarded by a
+file lock); later processes attach to the running container. every lease gets its own database
+and user, created on the shared server. the server is removed when the last lease of the last
+process is released. processes that died without releasing are dropped from the registry.
+
+    >>> from dockerobject.shared import get_shared_server
+    >>> with get_shared_server(Postgres).lease() as p:
+    ...     p.get_connection_params()
+"""
+
+from .client import get_client
+from .dockerobject import LOGGER
+from .locks import FileLock, state_path, read_json, write_json, pid_alive
+from .metrics import unwrap
+from .pool import Lease
+from docker.errors import APIError
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import string
+import threading
+
+# the label of a shared container, the key of its registry
+LABEL_SHARED = 'dockerobject.shared'
+
+logger = logging.getLogger(LOGGER).getChild('shared')
+
+def registry_path(key):
+    return state_path('shared-%s.json' % key[:32])
+
+def _live_users(entry):
+    return dict((pid, dbs) for pid, dbs in entry.get('users', {}).items() if pid_alive(int(pid)))
+
+def in_use(key):
+    """
+    True while a live process holds a lease of the shared server of key. see reaper.is_orphan.
+    """
+    return bool(_live_users(read_json(registry_path(key), {})))
+
+class SharedServer(object):
+    """
+    The server of cls(**kwargs) shared by the processes of this host. lease() returns a
+    pool.Lease of a cls instance attached to the shared container, using its own database.
+    """
+
+    def __init__(self, cls, client = None, **kwargs):
+        self.cls = cls
+        self.client = client
+        self.kwargs = kwargs
+        daemon = getattr(unwrap(client or get_client()), 'base_url', None) or 'default'
+        config = {'class' : '%s.%s' % (cls.__module__, cls.__name__), 'kwargs' : repr(sorted(kwargs.items())), 'daemon' : daemon}
+        self.key = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+        self.path = registry_path(self.key)
+        self.lock = FileLock(self.path + '.lock')
+        self.__leased = set()
+        self.__leased_lock = threading.Lock()
+
+    def __running(self, obj, container):
+        try:
+            return obj.client.inspect_container(container)['State']['Running']
+        except APIError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return False
+
+    def __attach(self, obj, entry):
+        """
+        attach obj to the container of entry. returns False if the server is gone.
+        """
+        if not entry.get('container') or not self.__running(obj, entry['container']):
+            return False
+        obj.use_dataset_state(entry.get('state', {}))
+        obj.set_container(entry['container'], owned=False)
+        # databases of processes that died without releasing
+        for pid, dbs in entry['users'].items():
+            if not pid_alive(int(pid)):
+                for db in dbs:
+                    self.__drop(obj, db)
+        entry['users'] = _live_users(entry)
+        return True
+
+    def __start(self, obj, entry):
+        if entry.get('container'):
+            self.__remove(obj, entry['container'])
+        obj.add_label(LABEL_SHARED, self.key)
+        try:
+            obj.start()
+        except Exception:
+            obj.destroy()
+            raise
+        logger.debug('Started shared server %s', obj.get_container())
+        # removed by the last release, not by the object
+        obj.set_container(obj.get_container(), owned=False)
+        entry.clear()
+        entry.update({'container' : obj.get_container(), 'state' : obj.dataset_state(), 'users' : {}})
+
+    def __drop(self, obj, db):
+        try:
+            obj.drop_database(db, db)
+        except Exception:
+            logger.warning('Failed to drop shared database %s', db, exc_info=True)
+
+    def __remove(self, obj, container):
+        try:
+            obj.client.remove_container(container=container, force=True)
+        except APIError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+
+    def lease(self):
+        obj = self.cls(client=self.client, **self.kwargs)
+        # database and user names are the same, unique per lease
+        name = 'w%d_%s' % (os.getpid(), ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(8)))
+        with self.lock:
+            entry = read_json(self.path, {})
+            if not self.__attach(obj, entry):
+                self.__start(obj, entry)
+            obj.add_database(name, name, obj.random_password(16))
+            entry['users'].setdefault(str(os.getpid()), []).append(name)
+            write_json(self.path, entry)
+        with self.__leased_lock:
+            self.__leased.add(obj)
+        with _lock:
+            _leasing.add(self)
+        return Lease(self, obj)
+
+    def release(self, obj):
+        with self.__leased_lock:
+            self.__leased.discard(obj)
+        name = obj.get_db()
+        with self.lock:
+            entry = read_json(self.path, {})
+            if entry.get('container'):
+                pid = str(os.getpid())
+                dbs = entry['users'].get(pid, [])
+                if name in dbs:
+                    dbs.remove(name)
+                if not dbs:
+                    entry['users'].pop(pid, None)
+                entry['users'] = _live_users(entry)
+                if entry['users']:
+                    if obj.get_container() is not None:
+                        self.__drop(obj, name)
+                    write_json(self.path, entry)
+                else:
+                    logger.debug('Removing shared server %s', entry['container'])
+                    self.__remove(obj, entry['container'])
+                    os.remove(self.path)
+        obj.destroy()
+
+    def close(self):
+        """
+        release the leases of this process.
+        """
+        with self.__leased_lock:
+            leased = list(self.__leased)
+        for obj in leased:
+            self.release(obj)
+
+_lock = threading.Lock()
+_servers = {}
+# servers that leased in this process, released at exit
+_leasing = set()
+
+def get_shared_server(cls, client = None, **kwargs):
+    """
+    return the process wide SharedServer of cls(**kwargs), e.g. get_shared_server(MySql, ephemeral=True).
+    """
+    # kwargs may not be hashable, e.g. a dict of settings
+    key = (cls, client, json.dumps(kwargs, sort_keys=True, default=str))
+    with _lock:
+        if key not in _servers:
+            _servers[key] = SharedServer(cls, client=client, **kwargs)
+        return _servers[key]
+
+@atexit.register
+def close_servers():
+    with _lock:
+        servers = list(_leasing)
+        _leasing.clear()
+    for server in servers:
+        try:
+            server.close()
+        except Exception:
+            logger.exception('Failed to release shared server leases')
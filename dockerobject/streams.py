@@ -0,0 +1,299 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import deque
+from docker.errors import APIError
+import logging
+import os
+import socket
+import struct
+import tarfile
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+STDIN, STDOUT, STDERR = 0, 1, 2
+# how much of stderr is kept for error reporting
+STDERR_LIMIT = 64 * 1024
+# how long an exec may still run after its output ended
+EXIT_TIMEOUT = 30
+
+def iter_chunks(source, chunk_size = CHUNK_SIZE):
+    """
+    yield byte chunks from a path, a file like object or an iterable of bytes.
+    """
+    if isinstance(source, (str, bytes)) and not hasattr(source, 'read'):
+        with open(source, 'rb') as f:
+            for chunk in iter_chunks(f, chunk_size):
+                yield chunk
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+def peek(chunks, size):
+    """
+    return (first size bytes, iterator over all the chunks).
+    """
+    head = b''
+    buffered = []
+    for chunk in chunks:
+        buffered.append(chunk)
+        head += chunk
+        if len(head) >= size:
+            break
+
+    def replay():
+        for chunk in buffered:
+            yield chunk
+        for chunk in chunks:
+            yield chunk
+    return head[:size], replay()
+
+def raw_socket(sock):
+    # docker-py returns a SocketIO wrapper on python 3
+    return getattr(sock, '_sock', sock)
+
+def _read_exactly(read, size):
+    data = b''
+    while len(data) < size:
+        chunk = read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def demux(sock, read = None):
+    """
+    yield (stream, data) for the multiplexed frames read from an attached socket,
+    or with read(size) if given.
+    """
+    read = read or sock.recv
+    while True:
+        header = _read_exactly(read, 8)
+        if header is None:
+            return
+        stream, size = struct.unpack('>BxxxL', header)
+        while size:
+            data = read(min(size, CHUNK_SIZE))
+            if not data:
+                return
+            size -= len(data)
+            yield stream, data
+
+def _get_logs(client, container, params):
+    # docker.Client.logs drops the stream of every frame, so the endpoint is read directly.
+    # this is the only use of the client's private _url, keep it that way.
+    return client.get(client._url('/containers/{0}/logs', container), params=params, stream=True, timeout=None)
+
+def iter_logs(client, container, stdout = True, stderr = True, follow = False, tail = 'all'):
+    """
+    yield (stream, data) for the output of container as it arrives from the logs api, instead of
+    reading the whole history into memory. with follow, keeps yielding until the container stops.
+    """
+    params = {'stdout' : int(stdout), 'stderr' : int(stderr), 'follow' : int(follow), 'timestamps' : 0, 'tail' : tail}
+    response = _get_logs(client, container, params)
+    try:
+        if response.status_code >= 400:
+            raise APIError(response.reason, response, response.text)
+        for stream, data in demux(None, response.raw.read):
+            yield stream, data
+    finally:
+        response.close()
+
+def tail_logs(chunks, limit = STDERR_LIMIT):
+    """
+    return the last limit bytes of (stream, data) chunks, keeping no more than that in memory.
+    """
+    tail = deque()
+    size = 0
+    for stream, data in chunks:
+        tail.append(data)
+        size += len(data)
+        while size - len(tail[0]) >= limit:
+            size -= len(tail.popleft())
+    return b''.join(tail)[-limit:]
+
+def forward_logs(chunks, logger, level = logging.INFO, prefix = ''):
+    """
+    log every line of (stream, data) chunks as it arrives.
+    """
+    partial = {}
+    for stream, data in chunks:
+        lines = (partial.pop(stream, b'') + data).split(b'\n')
+        if lines[-1]:
+            partial[stream] = lines[-1]
+        for line in lines[:-1]:
+            logger.log(level, '%s%s', prefix, line.decode('utf-8', 'replace'))
+    for stream, line in sorted(partial.items()):
+        logger.log(level, '%s%s', prefix, line.decode('utf-8', 'replace'))
+
+class ExecStream(object):
+    """
+    Runs command in a container with stdout/stderr (and optionally stdin) attached, through
+    the exec api. nothing touches the local or the daemon's file system, so it works with
+    remote daemons as well.
+    """
+
+    def __init__(self, client, container, command, stdin = False):
+        self.client = client
+        self.exec_id = client.exec_create(container=container, cmd=command, stdin=stdin, stdout=True, stderr=True)
+        self.sock = client.exec_start(self.exec_id, socket=True)
+        self.raw = raw_socket(self.sock)
+        self.raw.settimeout(None)
+        self.stderr = b''
+        self.__writer = None
+        self.__write_error = None
+
+    def feed(self, source):
+        """
+        write source (anything iter_chunks accepts) to the command's stdin in the background.
+        """
+        def write():
+            try:
+                for chunk in iter_chunks(source):
+                    self.raw.sendall(chunk)
+            except Exception as e:
+                self.__write_error = e
+            finally:
+                try:
+                    self.raw.shutdown(socket.SHUT_WR)
+                except socket.error:
+                    pass
+        self.__writer = threading.Thread(target=write)
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def stdout(self):
+        """
+        yield stdout chunks, keeping the tail of stderr in self.stderr.
+        """
+        try:
+            for stream, data in demux(self.raw):
+                if stream == STDERR:
+                    self.stderr = (self.stderr + data)[-STDERR_LIMIT:]
+                else:
+                    yield data
+        finally:
+            self.close()
+
+    def close(self):
+        self.raw.close()
+        self.sock.close()
+        if self.__writer is not None:
+            self.__writer.join()
+
+    def wait(self):
+        """
+        consume the output and return the exit code.
+        """
+        for chunk in self.stdout():
+            pass
+        return self.exit_code()
+
+    def exit_code(self, timeout = EXIT_TIMEOUT):
+        exit_code = exec_exit_code(self.client, self.exec_id, timeout)
+        if exit_code == 0 and self.__write_error is not None:
+            raise self.__write_error
+        return exit_code
+
+def exec_exit_code(client, exec_id, timeout = EXIT_TIMEOUT):
+    """
+    the exit code of an exec. the exec can still be running for a moment after its socket
+    closed, with no exit code yet, so it is polled until it ends.
+    """
+    deadline = time.time() + timeout
+    delay = 0.01
+    while True:
+        result = client.exec_inspect(exec_id)
+        if not result.get('Running'):
+            return result['ExitCode']
+        if time.time() >= deadline:
+            raise RuntimeError("Timeout waiting for exec %s to end" % exec_id)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+def write_chunks(target, chunks):
+    """
+    write byte chunks to a path or to a file like object.
+    """
+    if hasattr(target, 'write'):
+        for chunk in chunks:
+            target.write(chunk)
+        return
+    with open(target, 'wb') as f:
+        write_chunks(f, chunks)
+
+class ChunkReader(object):
+    """
+    File like object that reads from an iterable of byte chunks.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size = -1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def tar_stream(directory):
+    """
+    return a file like object reading a tar of the content of directory, produced in the background.
+    """
+    r, w = os.pipe()
+    reader = os.fdopen(r, 'rb')
+    writer = os.fdopen(w, 'wb')
+
+    def produce():
+        try:
+            tar = tarfile.open(fileobj=writer, mode='w|')
+            for name in sorted(os.listdir(directory)):
+                tar.add(os.path.join(directory, name), arcname=name)
+            tar.close()
+        finally:
+            writer.close()
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    return reader
+
+def extract_tar(chunks, directory):
+    """
+    extract a tar, given as byte chunks, into directory.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tar = tarfile.open(fileobj=ChunkReader(chunks), mode='r|')
+    try:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(directory, filter='data')
+        else:
+            tar.extractall(directory)
+    finally:
+        tar.close()
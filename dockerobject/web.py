@@ -14,8 +14,8 @@
 #   limitations under the License.
 
 from dockerobject import DockerObject
-import time
-import requests
+from .probes import HttpProbe
+from .loadgen import LoadGenerator
 
 class WebObject(DockerObject):
     def __init__(self, port, *args, **kwargs):
@@ -31,24 +31,32 @@ class WebObject(DockerObject):
         host, port = 'localhost', ports[0]['HostPort']
         return "http://%s:%d" % (host, int(port))
 
-    def wait_for_sever(self, timeout = 60):
-        url = self.get_url()
-        self.logger.debug('Waiting for web service to start')
-        timeout_time = time.time() + timeout
-        while time.time() < timeout_time:
-            try:
-                while 200 != requests.get(url).status_code:
-                    time.sleep(1)
-                return
-            except requests.exceptions.ConnectionError:
-                time.sleep(1)
+    def get_readiness_probe(self):
+        return HttpProbe(self.get_url())
 
-        raise RuntimeError('Timeout waiting for web service')
+    def wait_for_sever(self, timeout = None):
+        """
+        wait until the web service answers, for timeout seconds (readiness_timeout by default).
+        """
+        self.logger.debug('Waiting for web service to start')
+        self.wait_for_probe(self.get_readiness_probe(), timeout)
 
     def wait_for_container(self):
         self.wait_for_sever()
 
+    def load_test(self, requests = None, concurrency = 8, rate = None, duration = 10, count = None, timeout = 10):
+        """
+        send a mix of requests (see loadgen.LoadGenerator) to the mapped port and return a loadgen.LoadResult.
+        """
+        if self.should_start():
+            self.start()
+        generator = LoadGenerator(self.get_url(), requests, concurrency=concurrency, rate=rate, timeout=timeout)
+        self.logger.debug('Load testing %s with %d workers', generator.base_url, concurrency)
+        result = generator.run(duration=duration, count=count)
+        self.logger.debug('Load test done: %s', result)
+        return result
+
 class Nginx(WebObject):
-    def __init__(self):
-        super(Nginx, self).__init__(port = 80, repo="nginx")
+    def __init__(self, client=None, reuse=None):
+        super(Nginx, self).__init__(port = 80, repo="nginx", client=client, reuse=reuse)
         self.logger = self.logger.getChild('nignx')
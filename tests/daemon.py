@@ -0,0 +1,35 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from benchmarks.fakedaemon import FakeDaemon
+from dockerobject import PooledClient, set_client
+import unittest
+
+class DaemonTestCase(unittest.TestCase):
+    """
+    Runs every test against a fresh fake docker daemon, used by the process wide client.
+    """
+    daemon_options = {}
+
+    def setUp(self):
+        self.daemon = FakeDaemon(**self.daemon_options).start()
+        set_client(PooledClient(base_url=self.daemon.base_url))
+
+    def tearDown(self):
+        set_client(None)
+        self.daemon.stop()
+
+    def running(self, container):
+        container = self.daemon.find_container(container)
+        return container is not None and container.running
@@ -0,0 +1,43 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.aio import AsyncNginx
+import asyncio
+import unittest
+
+class AsyncStartTest(DaemonTestCase):
+
+    daemon_options = {'ready_delay' : 0.05}
+
+    def test_start_linked_graph(self):
+        parent = AsyncNginx()
+        child = AsyncNginx()
+        parent.add_link('child', child.obj, internal=True)
+
+        async def run():
+            await parent.start()
+            try:
+                return parent.should_start(), child.should_start()
+            finally:
+                await parent.destroy()
+
+        self.assertEqual(asyncio.run(run()), (False, False))
+        # readiness is timed like in the sync start
+        self.assertGreater(parent.timings['readiness'], 0)
+        self.assertGreater(child.timings['readiness'], 0)
+        self.assertIsNotNone(parent.ready_time)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject import PooledClient
+from dockerobject.events import close_monitor
+from dockerobject.streams import iter_logs
+from dockerobject.web import Nginx
+import unittest
+
+class PooledClientTest(DaemonTestCase):
+
+    def setUp(self):
+        super(PooledClientTest, self).setUp()
+        self.client = PooledClient(base_url=self.daemon.base_url, pool_size=1)
+        self.dedicated = []
+        new_client = self.client.new_client
+
+        def counting(version = None):
+            client = new_client(version)
+            self.dedicated.append(client)
+            return client
+        self.client.new_client = counting
+
+    def tearDown(self):
+        close_monitor(self.client)
+        super(PooledClientTest, self).tearDown()
+
+    def test_streams_get_a_client_of_their_own(self):
+        obj = Nginx(client=self.client)
+        obj.start()
+        try:
+            # the events monitor has its own as well
+            before = len(self.dedicated)
+            self.client.version()
+            self.client.inspect_container(obj.get_container())
+            self.assertEqual(len(self.dedicated), before)
+            logs = iter_logs(self.client, obj.get_container())
+            self.assertEqual(next(logs)[1], b'fake output of nginx\n')
+            stream = self.client.exec_start(self.client.exec_create(obj.get_container(), ['true']), socket=True)
+            # the pooled client is free while both streams are open
+            self.assertEqual(self.client.inspect_container(obj.get_container())['Id'], obj.get_container())
+            self.assertEqual(len(self.dedicated), before + 2)
+            logs.close()
+            stream.close()
+        finally:
+            obj.destroy()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject import cpusets
+from dockerobject.cpusets import CpusetAllocator
+from dockerobject.web import Nginx
+import shutil
+import tempfile
+import unittest
+
+class CpusetTest(DaemonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.allocator = CpusetAllocator(path=self.directory + '/cpusets.json', cpus=[0, 1, 2, 3])
+        self.saved, cpusets._allocator = cpusets._allocator, self.allocator
+        super(CpusetTest, self).setUp()
+
+    def tearDown(self):
+        super(CpusetTest, self).tearDown()
+        cpusets._allocator = self.saved
+        shutil.rmtree(self.directory)
+
+    def test_allocate_disjoint(self):
+        first = self.allocator.allocate(2)
+        second = self.allocator.allocate(2)
+        self.assertEqual(set(first[1]) & set(second[1]), set())
+        self.allocator.release(first[0])
+        self.assertEqual(list(self.allocator.allocations()), [second[0]])
+
+    def test_remove_releases(self):
+        obj = Nginx()
+        obj.set_cpus(2)
+        obj.start()
+        self.assertEqual(len(self.allocator.allocations()), 1)
+        self.assertEqual(self.daemon.find_container(obj.get_container()).host_config['CpuSetCpus'], obj.cpuset)
+        obj.destroy()
+        self.assertEqual(self.allocator.allocations(), {})
+
+    def test_detach_keeps_allocation(self):
+        obj = Nginx(reuse=True)
+        obj.set_cpus(2)
+        obj.start()
+        allocations = self.allocator.allocations()
+        obj.destroy()
+        # the container is left running on its cpus
+        self.assertEqual(self.allocator.allocations(), allocations)
+        self.assertIsNone(obj.cpuset)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject import datasets
+from dockerobject.datasets import DatasetCache, DATASET_REPO
+from dockerobject.db import Postgres
+from dockerobject.locks import write_json
+from dockerobject.web import Nginx
+import os
+import shutil
+import tempfile
+import unittest
+
+DUMP = b'CREATE TABLE t (id int);\nINSERT INTO t VALUES (1);\n'
+
+class DatasetCacheTest(DaemonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DatasetCache(index_path=os.path.join(self.directory, 'datasets.json'), max_size=25)
+        self.saved, datasets._cache = datasets._cache, self.cache
+        self.dump = self.write('dump.sql', DUMP)
+        super(DatasetCacheTest, self).setUp()
+
+    def tearDown(self):
+        super(DatasetCacheTest, self).tearDown()
+        datasets._cache = self.saved
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_key(self):
+        obj = Postgres()
+        obj.pull_if_needed(obj.repo, obj.tag)
+        key = self.cache.key(obj, self.cache.dump_hash(self.dump))
+        self.assertEqual(self.cache.key(Postgres(), self.cache.dump_hash(self.dump)), key)
+        # the content counts, not the path
+        same = self.write('same.sql', DUMP)
+        self.assertEqual(self.cache.key(obj, self.cache.dump_hash(same)), key)
+        other = self.write('other.sql', DUMP + b'INSERT INTO t VALUES (2);\n')
+        self.assertNotEqual(self.cache.key(obj, self.cache.dump_hash(other)), key)
+        # and so does the configuration of the server
+        self.assertNotEqual(self.cache.key(Postgres(password='other'), self.cache.dump_hash(self.dump)), key)
+        self.assertNotEqual(self.cache.key(Postgres(settings={'fsync' : 'off'}), self.cache.dump_hash(self.dump)), key)
+
+    def test_dump_hash_follows_changes(self):
+        digest = self.cache.dump_hash(self.dump)
+        self.write('dump.sql', DUMP + b'-- changed\n')
+        os.utime(self.dump, (0, 0))
+        self.assertNotEqual(self.cache.dump_hash(self.dump), digest)
+
+    def test_load_once(self):
+        first = Postgres(dataset=self.dump)
+        first.start()
+        try:
+            self.assertEqual(self.daemon.find_container(first.get_container()).database, DUMP)
+        finally:
+            first.destroy()
+        entry, = self.cache.entries()
+        second = Postgres(dataset=self.dump)
+        second.start()
+        try:
+            # created from the cached image, without loading the dump again
+            self.assertEqual(second.image, entry['image'])
+            self.assertEqual(self.daemon.find_container(second.get_container()).database, DUMP)
+        finally:
+            second.destroy()
+
+    def test_lru_eviction(self):
+        obj = Nginx()
+        obj.start()
+        images = {}
+        for key in ('a', 'b', 'c'):
+            images[key] = obj.client.commit(container=obj.get_container(), repository=DATASET_REPO, tag=key).get('Id')
+        obj.destroy()
+        entries = dict((key, {'image' : images[key], 'size' : 10, 'state' : {}, 'last_used' : used})
+                       for key, used in (('a', 1), ('b', 2), ('c', 3)))
+        write_json(self.cache.index_path, {'daemons' : {self.daemon.base_url : entries}, 'hashes' : {}})
+        # a lookup makes a the most recently used
+        self.assertEqual(self.cache.lookup(obj.client, 'a')['image'], images['a'])
+        self.assertEqual(self.cache.evict(obj.client), ['b'])
+        self.assertEqual(sorted(e['key'] for e in self.cache.entries(obj.client)), ['a', 'c'])
+        self.assertIsNone(self.daemon.find_image(images['b'])[1])
+        # an image removed behind the cache's back is dropped on lookup
+        obj.client.remove_image(image=images['c'], force=True)
+        self.assertIsNone(self.cache.lookup(obj.client, 'c'))
+        self.assertEqual([e['key'] for e in self.cache.entries(obj.client)], ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.db import MySql
+from dockerobject.dumpio import split_sql_dump, write_archive, read_archive, verify_archive, read_manifest, MANIFEST
+from dockerobject.locks import write_json
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+DUMP = b"""-- MySQL dump 10.13
+/*!40101 SET NAMES utf8mb4 */;
+/*!40103 SET TIME_ZONE='+00:00' */;
+
+--
+-- Current Database: `test`
+--
+
+USE `test`;
+
+--
+-- Table structure for table `a`
+--
+
+CREATE TABLE `a` (`id` int);
+INSERT INTO `a` VALUES (1);
+
+--
+-- Temporary view structure for view `a_view`
+--
+
+/*!50001 CREATE VIEW `a_view` AS SELECT 1 AS `id`*/;
+
+--
+-- Table structure for table `b`
+--
+
+CREATE TABLE `b` (`id` int);
+INSERT INTO `b` VALUES (2);
+
+--
+-- Final view structure for view `a_view`
+--
+
+/*!50001 DROP VIEW IF EXISTS `a_view`*/;
+/*!50001 CREATE VIEW `a_view` AS select `id` from `a` */;
+/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
+"""
+
+# a table with triggers, a view over two tables and a routine
+TRIGGERS_DUMP = b"""-- MySQL dump 10.13
+/*!40101 SET NAMES utf8mb4 */;
+
+--
+-- Table structure for table `orders`
+--
+
+CREATE TABLE `orders` (`id` int, `total` int);
+
+--
+-- Dumping data for table `orders`
+--
+
+INSERT INTO `orders` VALUES (1,10),(2,20);
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`%`*/ /*!50003 TRIGGER `orders_total` BEFORE INSERT ON `orders` FOR EACH ROW BEGIN
+  SET NEW.total = NEW.total + 1;
+END */;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+
+--
+-- Temporary table structure for view `totals`
+--
+
+SET @saved_cs_client     = @@character_set_client;
+/*!50001 CREATE VIEW `totals` AS SELECT 1 AS `id`, 1 AS `total`*/;
+SET character_set_client = @saved_cs_client;
+
+--
+-- Table structure for table `users`
+--
+
+CREATE TABLE `users` (`id` int);
+INSERT INTO `users` VALUES (1);
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50003 TRIGGER `users_check` BEFORE DELETE ON `users` FOR EACH ROW BEGIN
+  DELETE FROM `orders` WHERE `id` = OLD.id;
+END */;;
+DELIMITER ;
+
+--
+-- Dumping routines for database 'test'
+--
+
+DELIMITER ;;
+CREATE PROCEDURE `cleanup`()
+BEGIN
+  DELETE FROM `orders`;
+END ;;
+DELIMITER ;
+
+--
+-- Final view structure for view `totals`
+--
+
+/*!50001 DROP VIEW IF EXISTS `totals`*/;
+/*!50001 CREATE VIEW `totals` AS select `o`.`id`, `o`.`total` from `orders` `o` join `users` `u` on `u`.`id` = `o`.`id` */;
+"""
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+class SplitSqlDumpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_split(self):
+        header, views, tables, trailer = split_sql_dump(io.BytesIO(DUMP), self.directory)
+        self.assertEqual([name for name, path in tables], ['a', 'b'])
+        self.assertIn(b'SET NAMES', read(header))
+        self.assertIn(b'USE `test`', read(header))
+        self.assertIn(b'INSERT INTO `a`', read(tables[0][1]))
+        self.assertIn(b'INSERT INTO `b`', read(tables[1][1]))
+        # the stub is loaded before the tables, not with the table it follows
+        self.assertIn(b'SELECT 1 AS', read(views))
+        self.assertNotIn(b'VIEW', read(tables[0][1]))
+        self.assertIn(b'select `id` from `a`', read(trailer))
+        self.assertNotIn(b'INSERT', read(trailer))
+        # nothing is lost or duplicated
+        parts = [header, views] + [path for name, path in tables] + [trailer]
+        self.assertEqual(sorted(b''.join(read(p) for p in parts).split(b'\n')), sorted(DUMP.split(b'\n')))
+
+    def test_triggers_views_and_routines(self):
+        header, views, tables, trailer = split_sql_dump(io.BytesIO(TRIGGERS_DUMP), self.directory)
+        self.assertEqual([name for name, path in tables], ['orders', 'users'])
+        orders, users = read(tables[0][1]), read(tables[1][1])
+        # a trigger is loaded with its table, delimiter blocks intact
+        self.assertIn(b'INSERT INTO `orders`', orders)
+        self.assertIn(b'TRIGGER `orders_total`', orders)
+        self.assertEqual(orders.count(b'DELIMITER ;;'), orders.count(b'DELIMITER ;\n'))
+        self.assertIn(b'TRIGGER `users_check`', users)
+        self.assertEqual(users.count(b'DELIMITER ;;'), users.count(b'DELIMITER ;\n'))
+        # the stub that follows orders is not part of it
+        self.assertNotIn(b'VIEW', orders + users)
+        self.assertIn(b'SELECT 1 AS `id`, 1 AS `total`', read(views))
+        self.assertIn(b'@saved_cs_client', read(views))
+        # the routine and the view over both tables only run after all tables are loaded
+        self.assertIn(b'CREATE PROCEDURE `cleanup`', read(trailer))
+        self.assertIn(b'join `users`', read(trailer))
+        self.assertNotIn(b'PROCEDURE', users)
+        parts = [header, views] + [path for name, path in tables] + [trailer]
+        self.assertEqual(sorted(b''.join(read(p) for p in parts).split(b'\n')), sorted(TRIGGERS_DUMP.split(b'\n')))
+
+    def test_no_tables(self):
+        header, views, tables, trailer = split_sql_dump(io.BytesIO(b'SET NAMES utf8;\n'), self.directory)
+        self.assertEqual(tables, [])
+        self.assertEqual(read(header), b'SET NAMES utf8;\n')
+        self.assertEqual(read(views), b'')
+        self.assertEqual(read(trailer), b'')
+
+class SplitLoadTest(DaemonTestCase):
+
+    def test_parallel_load(self):
+        obj = MySql()
+        obj.start()
+        try:
+            obj.upload_dump(io.BytesIO(TRIGGERS_DUMP), jobs=2)
+            database = self.daemon.find_container(obj.get_container()).database
+        finally:
+            obj.destroy()
+        # every table once, after the view stubs and before what needs all of them
+        stubs = database.index(b'SELECT 1 AS `id`')
+        trailer = database.index(b'CREATE PROCEDURE')
+        for statement in (b'TRIGGER `orders_total`', b'TRIGGER `users_check`'):
+            self.assertEqual(database.count(statement), 1)
+            self.assertTrue(stubs < database.index(statement) < trailer)
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = os.path.join(self.directory, 'archive')
+        self.data = b''.join(b'INSERT INTO `t` VALUES (%d);\n' % i for i in range(5000))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        manifest = write_archive(io.BytesIO(self.data), self.archive, codec='gzip', chunk_size=1024)
+        self.assertGreater(len(manifest['chunks']), 1)
+        self.assertEqual(manifest['size'], len(self.data))
+        self.assertEqual(b''.join(read_archive(self.archive)), self.data)
+        self.assertEqual(verify_archive(self.archive), manifest)
+
+    def test_overwrite_removes_old_chunks(self):
+        write_archive(io.BytesIO(self.data), self.archive, codec='gzip', chunk_size=1024)
+        manifest = write_archive(io.BytesIO(b'x'), self.archive, codec='gzip', chunk_size=1024)
+        self.assertEqual(sorted(os.listdir(self.archive)), sorted([MANIFEST] + [c['name'] for c in manifest['chunks']]))
+        self.assertEqual(b''.join(read_archive(self.archive)), b'x')
+
+    def test_corrupt_chunk(self):
+        manifest = write_archive(io.BytesIO(self.data), self.archive, codec='gzip', chunk_size=1024)
+        path = os.path.join(self.archive, manifest['chunks'][1]['name'])
+        with open(path, 'r+b') as f:
+            f.write(b'\0')
+        self.assertRaises(RuntimeError, verify_archive, self.archive)
+        # nothing of the corrupt chunk is yielded
+        data = []
+        with self.assertRaises(RuntimeError):
+            for chunk in read_archive(self.archive):
+                data.append(chunk)
+        self.assertTrue(self.data.startswith(b''.join(data)))
+
+    def test_corrupt_dump(self):
+        write_archive(io.BytesIO(self.data), self.archive, codec='gzip', chunk_size=1024)
+        manifest = read_manifest(self.archive)
+        manifest['sha256'] = '0' * 64
+        write_json(os.path.join(self.archive, MANIFEST), manifest)
+        self.assertRaises(RuntimeError, verify_archive, self.archive)
+
+    def test_not_an_archive(self):
+        self.assertRaises(RuntimeError, read_manifest, self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
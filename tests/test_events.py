@@ -0,0 +1,60 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject import events, get_client, set_client, PooledClient
+from dockerobject.web import Nginx
+import threading
+import time
+import unittest
+
+def monitor_threads():
+    return [t for t in threading.enumerate() if t.name == 'dockerobject-events']
+
+class EventMonitorTest(DaemonTestCase):
+
+    def setUp(self):
+        self.window = events.STREAM_WINDOW
+        events.STREAM_WINDOW = 1
+        super(EventMonitorTest, self).setUp()
+
+    def tearDown(self):
+        super(EventMonitorTest, self).tearDown()
+        events.STREAM_WINDOW = self.window
+
+    def test_events_across_windows(self):
+        obj = Nginx()
+        obj.start()
+        try:
+            waiter = obj.exit_waiter()
+            # the stream was reopened since the waiter was registered
+            time.sleep(2.5)
+            obj.client.kill(obj.get_container())
+            self.assertIsNotNone(waiter.wait(5))
+        finally:
+            obj.destroy()
+
+    def test_set_client_closes_monitor(self):
+        before = set(monitor_threads())
+        monitor = events.get_monitor(get_client())
+        self.assertTrue(monitor.is_connected())
+        thread, = set(monitor_threads()) - before
+        set_client(PooledClient(base_url=self.daemon.base_url))
+        self.assertFalse(monitor.is_connected(0))
+        self.assertIsNot(events.get_monitor(get_client()), monitor)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from dockerobject.images import ImageIndex
+import threading
+import time
+import unittest
+
+class FakeImageClient(object):
+    """
+    images api of a daemon without images, whose pulls take a moment and may fail.
+    """
+
+    base_url = 'fake'
+
+    def __init__(self, error = None):
+        self.error = error
+        self.pulls = 0
+        self.pulled = []
+
+    def images(self):
+        return [{'RepoTags' : ['%s:%s' % image]} for image in self.pulled]
+
+    def pull(self, repository, tag, insecure_registry):
+        self.pulls += 1
+        time.sleep(0.1)
+        if self.error is not None:
+            raise self.error
+        self.pulled.append((repository, tag))
+
+def pull_concurrently(index, client, count = 4):
+    results = []
+
+    def pull():
+        try:
+            results.append(index.pull_if_needed(client, 'nginx', 'latest'))
+        except Exception as e:
+            results.append(e)
+    threads = [threading.Thread(target=pull) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+class ImageIndexTest(unittest.TestCase):
+
+    def test_single_pull(self):
+        client = FakeImageClient()
+        results = pull_concurrently(ImageIndex(), client)
+        self.assertEqual(client.pulls, 1)
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+    def test_failed_pull_raises_in_waiters(self):
+        error = RuntimeError('pull failed')
+        client = FakeImageClient(error)
+        results = pull_concurrently(ImageIndex(), client)
+        self.assertEqual(client.pulls, 1)
+        self.assertEqual(results, [error] * 4)
+
+    def test_present(self):
+        client = FakeImageClient()
+        client.pulled.append(('nginx', 'latest'))
+        index = ImageIndex()
+        self.assertFalse(index.pull_if_needed(client, 'nginx', 'latest'))
+        self.assertTrue(index.has_image(client, 'nginx'))
+        self.assertEqual(client.pulls, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from dockerobject.loadgen import Histogram
+import math
+import random
+import unittest
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertEqual(histogram.mean(), 0.0)
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(50), 500)
+        self.assertEqual(histogram.percentile(99), 990)
+        self.assertEqual(histogram.percentile(100), 1000)
+        self.assertEqual(histogram.min, 1)
+        self.assertEqual(histogram.mean(), 500.5)
+
+    def test_precision(self):
+        rnd = random.Random(1)
+        values = sorted(int(rnd.expovariate(1.0 / 50000)) for _ in range(20000))
+        histogram = Histogram(digits=3)
+        for value in values:
+            histogram.record(value)
+        for p in (50, 90, 99, 99.9):
+            exact = values[int(math.ceil(p / 100.0 * len(values))) - 1]
+            self.assertLessEqual(abs(histogram.percentile(p) - exact), exact / 1000.0 + 1)
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+    def test_large_values(self):
+        histogram = Histogram()
+        histogram.record(10 ** 9)
+        histogram.record(-5)
+        self.assertEqual(histogram.percentile(100), 10 ** 9)
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertLess(len(histogram.counts), 3)
+
+    def test_merge(self):
+        first = Histogram()
+        second = Histogram()
+        for value in range(100):
+            first.record(value)
+            second.record(value + 100)
+        first.merge(second)
+        self.assertEqual(first.count, 200)
+        self.assertEqual(first.min, 0)
+        self.assertEqual(first.max, 199)
+        self.assertEqual(first.percentile(50), 99)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from benchmarks.lifecycle import percentile
+from dockerobject.metrics import Histogram, Metrics, get_metrics
+from dockerobject.web import Nginx
+import json
+import unittest
+
+class Owner(object):
+    pass
+
+class HistogramTest(unittest.TestCase):
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram(buckets=(1, 0.1, 10))
+        for value in (0.05, 0.5, 0.5, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 3, 4])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 56.05)
+        self.assertEqual(histogram.to_dict()['buckets'], {'0.1' : 1, '1' : 3, '10' : 4})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile(list(reversed(values)), 0), 1)
+        self.assertEqual(percentile([], 50), 0.0)
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.1, 1))
+        self.metrics.observe(Owner(), 'start', 0.05)
+        self.metrics.observe(Owner(), 'start', 0.5)
+        self.metrics.count_api_call('Owner', 'start')
+
+    def test_json(self):
+        data = json.loads(self.metrics.to_json())
+        self.assertEqual(data['phases'], [{'class' : 'Owner', 'phase' : 'start', 'count' : 2, 'sum' : 0.55,
+                                           'buckets' : {'0.1' : 1, '1' : 2}}])
+        self.assertEqual(data['api_calls'], [{'class' : 'Owner', 'method' : 'start', 'count' : 1}])
+
+    def test_prometheus(self):
+        lines = self.metrics.to_prometheus().splitlines()
+        self.assertIn('# TYPE dockerobject_phase_seconds histogram', lines)
+        self.assertIn('dockerobject_phase_seconds_bucket{class="Owner",phase="start",le="0.1"} 1', lines)
+        self.assertIn('dockerobject_phase_seconds_bucket{class="Owner",phase="start",le="1"} 2', lines)
+        self.assertIn('dockerobject_phase_seconds_bucket{class="Owner",phase="start",le="+Inf"} 2', lines)
+        self.assertIn('dockerobject_phase_seconds_sum{class="Owner",phase="start"} 0.550000', lines)
+        self.assertIn('dockerobject_phase_seconds_count{class="Owner",phase="start"} 2', lines)
+        self.assertIn('dockerobject_api_calls_total{class="Owner",method="start"} 1', lines)
+
+    def test_hooks(self):
+        calls = []
+        hook = lambda obj, phase, seconds: calls.append((phase, seconds))
+        self.metrics.add_hook(hook)
+        self.metrics.observe(Owner(), 'create', 0.2)
+        self.metrics.remove_hook(hook)
+        self.metrics.observe(Owner(), 'create', 0.3)
+        self.assertEqual(calls, [('create', 0.2)])
+
+    def test_reset(self):
+        self.metrics.reset()
+        self.assertEqual(self.metrics.to_dict(), {'phases' : [], 'api_calls' : []})
+
+class ObjectMetricsTest(DaemonTestCase):
+
+    def test_phases_and_api_calls(self):
+        get_metrics().reset()
+        obj = Nginx()
+        obj.start()
+        obj.destroy()
+        self.assertTrue(set(['create', 'start', 'readiness']) <= set(obj.timings))
+        self.assertEqual(obj.api_calls['create_container'], 1)
+        self.assertEqual(obj.api_calls['start'], 1)
+        phases = set(item['phase'] for item in get_metrics().to_dict()['phases'] if item['class'] == 'Nginx')
+        self.assertTrue(set(obj.timings) <= phases)
+        counted = dict((item['method'], item['count']) for item in get_metrics().to_dict()['api_calls'] if item['class'] == 'Nginx')
+        self.assertEqual(counted, dict(obj.api_calls))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from dockerobject.pool import ContainerPool, get_pool
+import threading
+import time
+import unittest
+
+class FakeObject(object):
+
+    def __init__(self, started = None, **kwargs):
+        self.kwargs = kwargs
+        self.started = started
+        self.destroyed = False
+
+    def start(self):
+        if self.started is not None:
+            self.started.wait(10)
+
+    def should_start(self):
+        return False
+
+    def wait_for_container(self):
+        pass
+
+    def get_container(self):
+        return None
+
+    def destroy(self):
+        self.destroyed = True
+
+class PoolTest(unittest.TestCase):
+
+    def test_lease_reuses_released(self):
+        pool = ContainerPool(FakeObject, min_size=0, max_size=1)
+        try:
+            with pool.lease() as obj:
+                pass
+            with pool.lease(timeout=1) as again:
+                self.assertIs(again, obj)
+        finally:
+            pool.close()
+        self.assertTrue(obj.destroyed)
+
+    def test_close_while_starting(self):
+        started = threading.Event()
+        created = []
+
+        def factory():
+            created.append(FakeObject(started))
+            return created[-1]
+
+        pool = ContainerPool(factory, min_size=1, max_size=1)
+        while not created:
+            started.wait(0.01)
+        pool.close()
+        started.set()
+        for i in range(100):
+            if created[0].destroyed:
+                break
+            time.sleep(0.01)
+        self.assertTrue(created[0].destroyed)
+        self.assertEqual(pool.size(), 0)
+
+    def test_get_pool_unhashable_kwargs(self):
+        pool = get_pool(FakeObject, min_size=0, settings={'a' : 1}, command=['true'])
+        other = get_pool(FakeObject, min_size=0, settings={'a' : 2}, command=['true'])
+        try:
+            self.assertIs(get_pool(FakeObject, min_size=0, command=['true'], settings={'a' : 1}), pool)
+            self.assertIsNot(other, pool)
+        finally:
+            pool.close()
+            other.close()
+
+    def test_get_pool_replaces_closed(self):
+        pool = get_pool(FakeObject, min_size=0, name='closed')
+        pool.close()
+        other = get_pool(FakeObject, min_size=0, name='closed')
+        try:
+            self.assertIsNot(other, pool)
+            self.assertFalse(other.is_closed())
+            with other.lease(timeout=1) as obj:
+                self.assertEqual(obj.kwargs, {'name' : 'closed'})
+        finally:
+            other.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from dockerobject.probes import TcpProbe
+from dockerobject.readiness import iter_ready, wait_for_targets
+import socket
+import threading
+import time
+import unittest
+
+class Server(object):
+    """
+    a localhost port that starts listening after delay seconds and answers every connection.
+    """
+
+    def __init__(self, delay = 0, response = None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.response = response
+        self.closed = False
+        self.thread = threading.Thread(target=self.__run, args=(delay,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __run(self, delay):
+        time.sleep(delay)
+        self.sock.listen(16)
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except socket.error:
+                return
+            if self.response is not None:
+                conn.recv(1024)
+                conn.sendall(self.response)
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+class PingProbe(TcpProbe):
+    payload = b'ping'
+    expects_response = True
+
+    def accept(self, data):
+        return data == b'pong'
+
+class MultiplexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def server(self, delay = 0, response = None):
+        self.servers.append(Server(delay, response))
+        return self.servers[-1]
+
+    def test_ready_in_order_of_readiness(self):
+        slow = self.server(delay=0.3)
+        fast = self.server()
+        targets = [('127.0.0.1', slow.port), ('127.0.0.1', fast.port)]
+        ready = list(iter_ready(targets, timeout=5))
+        self.assertEqual([target for target, seconds in ready], [targets[1], targets[0]])
+        self.assertGreaterEqual(ready[1][1], 0.3)
+
+    def test_handshake(self):
+        good = self.server(response=b'pong')
+        seconds = wait_for_targets([PingProbe('127.0.0.1', good.port)], timeout=5)
+        self.assertEqual(len(seconds), 1)
+
+    def test_wrong_handshake_times_out(self):
+        bad = self.server(response=b'nope')
+        self.assertRaises(RuntimeError, wait_for_targets, [PingProbe('127.0.0.1', bad.port)], 0.5)
+
+    def test_timeout(self):
+        # bound but never listening, connections are refused
+        closed = self.server(delay=60)
+        start = time.time()
+        self.assertRaises(RuntimeError, wait_for_targets, [('127.0.0.1', closed.port)], 0.3)
+        self.assertLess(time.time() - start, 2)
+
+    def test_own_timeout(self):
+        closed = self.server(delay=60)
+        fast = self.server()
+        targets = [('127.0.0.1', fast.port, 5), ('127.0.0.1', closed.port, 0.3)]
+        self.assertRaises(RuntimeError, wait_for_targets, targets, 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.dockerobject import LABEL_SESSION, LABEL_OWNER_PID, LABEL_OWNER_HOST, LABEL_FINGERPRINT
+from dockerobject.reaper import is_orphan, reap, destroy_all, Reaper
+from dockerobject.web import Nginx
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+class IsOrphanTest(unittest.TestCase):
+
+    def labels(self, **labels):
+        container = {LABEL_SESSION : 'session', LABEL_OWNER_PID : str(os.getpid()), LABEL_OWNER_HOST : 'host'}
+        container.update(labels)
+        return {'Labels' : container}
+
+    def test_dead_owner(self):
+        self.assertTrue(is_orphan(self.labels(**{LABEL_OWNER_PID : str(dead_pid())}), 'host'))
+
+    def test_live_owner(self):
+        self.assertFalse(is_orphan(self.labels(), 'host'))
+
+    def test_other_host(self):
+        self.assertFalse(is_orphan(self.labels(**{LABEL_OWNER_PID : str(dead_pid())}), 'other'))
+
+    def test_reused(self):
+        self.assertFalse(is_orphan(self.labels(**{LABEL_OWNER_PID : str(dead_pid()), LABEL_FINGERPRINT : 'x'}), 'host'))
+
+    def test_no_owner(self):
+        self.assertFalse(is_orphan(self.labels(**{LABEL_OWNER_PID : 'unknown'}), 'host'))
+
+class ReapTest(DaemonTestCase):
+
+    def start(self, **labels):
+        obj = Nginx()
+        obj.labels.update(labels)
+        obj.start()
+        self.objects.append(obj)
+        return obj.get_container()
+
+    def setUp(self):
+        super(ReapTest, self).setUp()
+        self.objects = []
+
+    def tearDown(self):
+        for obj in self.objects:
+            obj.destroy()
+        super(ReapTest, self).tearDown()
+
+    def test_reap_dead_sessions(self):
+        live = self.start()
+        dead = self.start(**{LABEL_OWNER_PID : str(dead_pid())})
+        remote = self.start(**{LABEL_OWNER_PID : str(dead_pid()), LABEL_OWNER_HOST : socket.gethostname() + '-other'})
+        self.assertEqual(reap(), [dead])
+        self.assertIsNone(self.daemon.find_container(dead))
+        self.assertTrue(self.running(live))
+        self.assertTrue(self.running(remote))
+
+    def test_destroy_session(self):
+        mine = self.start()
+        other = self.start(**{LABEL_SESSION : 'other-session'})
+        self.assertEqual(destroy_all('other-session'), [other])
+        self.assertTrue(self.running(mine))
+        self.assertEqual(destroy_all(), [mine])
+        self.assertIsNone(self.daemon.find_container(mine))
+
+    def test_reaper_thread(self):
+        dead = self.start(**{LABEL_OWNER_PID : str(dead_pid())})
+        reaper = Reaper(interval=0.05).start()
+        try:
+            deadline = time.time() + 5
+            while self.daemon.find_container(dead) is not None and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            reaper.stop()
+        self.assertIsNone(self.daemon.find_container(dead))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.web import Nginx
+import unittest
+
+class ReuseTest(DaemonTestCase):
+
+    def test_fingerprint_ignores_container_ids(self):
+        parent = Nginx(reuse=True)
+        parent.add_link('child', Nginx(), internal=True)
+        fingerprint = parent.fingerprint()
+        parent.start()
+        try:
+            self.assertEqual(parent.fingerprint(), fingerprint)
+        finally:
+            parent.destroy()
+
+    def test_adopt(self):
+        first = Nginx(reuse=True)
+        first.start()
+        container = first.get_container()
+        first.destroy()
+        self.assertTrue(self.running(container))
+
+        second = Nginx(reuse=True)
+        second.start()
+        self.assertTrue(second.reused)
+        self.assertEqual(second.get_container(), container)
+        second.destroy()
+        self.assertTrue(self.running(container))
+
+    def test_root_with_owned_links_is_not_kept(self):
+        child = Nginx()
+        parent = Nginx(reuse=True)
+        parent.add_link('child', child, internal=True)
+        parent.start()
+        self.assertFalse(parent.reusable())
+        containers = parent.get_container(), child.get_container()
+        parent.destroy()
+        self.assertIsNone(parent.get_container())
+        self.assertIsNone(child.get_container())
+        # the parent would link to a removed child
+        self.assertFalse(self.running(containers[0]))
+        self.assertFalse(self.running(containers[1]))
+
+    def test_adopt_checks_links(self):
+        def start():
+            parent = Nginx(reuse=True)
+            parent.add_link('child', Nginx(reuse=True), internal=True)
+            parent.start()
+            return parent
+        first = start()
+        containers = first.get_container(), first.internal_containers[0].get_container()
+        first.destroy()
+        self.assertTrue(self.running(containers[0]))
+        # the child is gone, a parent that links to it is not adopted
+        first.client.remove_container(container=containers[1], force=True)
+        second = start()
+        try:
+            self.assertFalse(second.reused)
+            self.assertNotEqual(second.get_container(), containers[0])
+            self.assertIsNone(self.daemon.find_container(containers[0]))
+            kept = second.get_container()
+        finally:
+            second.destroy()
+        # the whole graph is adopted when it is intact
+        third = start()
+        try:
+            self.assertTrue(third.reused)
+            self.assertTrue(third.internal_containers[0].reused)
+            self.assertEqual(third.get_container(), kept)
+        finally:
+            third.destroy()
+
+    def test_destroy_graph_detaches_unowned_links(self):
+        child = Nginx(reuse=True)
+        parent = Nginx()
+        parent.add_link('child', child, internal=True)
+        parent.start()
+        containers = parent.get_container(), child.get_container()
+        parent.destroy()
+        self.assertFalse(self.running(containers[0]))
+        self.assertTrue(self.running(containers[1]))
+
+if __name__ == '__main__':
+    unittest.main()
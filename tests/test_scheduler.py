@@ -0,0 +1,145 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.scheduler import run_tasks
+from dockerobject.web import Nginx
+import gc
+import threading
+import time
+import unittest
+
+class RunTasksTest(unittest.TestCase):
+
+    def test_order(self):
+        done = []
+        lock = threading.Lock()
+
+        def task(key):
+            def run():
+                time.sleep(0.01)
+                with lock:
+                    done.append(key)
+            return run
+        deps = {'a' : [], 'b' : ['a'], 'c' : ['a'], 'd' : ['b', 'c'], 'e' : []}
+        run_tasks(dict((key, (task(key), d)) for key, d in deps.items()), workers=4)
+        self.assertEqual(sorted(done), sorted(deps))
+        for key, d in deps.items():
+            for dep in d:
+                self.assertLess(done.index(dep), done.index(key))
+
+    def test_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+        tasks = dict((key, (barrier.wait, [])) for key in 'abc')
+        # deadlocks (and the barrier times out) unless they run at once
+        run_tasks(tasks, workers=3)
+
+    def test_unknown_dependencies_are_ignored(self):
+        done = []
+        run_tasks({'a' : (lambda: done.append('a'), ['missing'])})
+        self.assertEqual(done, ['a'])
+
+    def test_cycle(self):
+        done = []
+        tasks = {
+            'a' : (lambda: done.append('a'), []),
+            'b' : (lambda: done.append('b'), ['c', 'a']),
+            'c' : (lambda: done.append('c'), ['b']),
+        }
+        self.assertRaises(RuntimeError, run_tasks, tasks)
+        self.assertEqual(done, ['a'])
+
+    def test_error(self):
+        done = []
+
+        def fail():
+            raise ValueError('failed')
+        tasks = {
+            'a' : (fail, []),
+            'b' : (lambda: done.append('b'), ['a']),
+        }
+        self.assertRaises(ValueError, run_tasks, tasks)
+        self.assertEqual(done, [])
+
+    def test_base_exception_waits_for_running(self):
+        done = []
+        started = threading.Event()
+
+        def interrupt():
+            started.wait(5)
+            raise KeyboardInterrupt()
+
+        def slow():
+            started.set()
+            time.sleep(0.1)
+            done.append('slow')
+        tasks = {
+            'a' : (interrupt, []),
+            'b' : (slow, []),
+            'c' : (lambda: done.append('c'), ['a']),
+        }
+        self.assertRaises(KeyboardInterrupt, run_tasks, tasks, workers=2)
+        self.assertEqual(done, ['slow'])
+
+    def test_serial(self):
+        done = []
+
+        def task(key):
+            def run():
+                done.append((key, threading.current_thread()))
+            return run
+        deps = {'a' : [], 'b' : ['a'], 'c' : ['b'], 'd' : []}
+        run_tasks(dict((key, (task(key), d)) for key, d in deps.items()), workers=0)
+        order = [key for key, thread in done]
+        self.assertEqual(sorted(order), sorted(deps))
+        self.assertLess(order.index('a'), order.index('b'))
+        self.assertLess(order.index('b'), order.index('c'))
+        self.assertEqual(set(thread for key, thread in done), set([threading.current_thread()]))
+
+class LinkedGraphTest(DaemonTestCase):
+
+    def test_start_linked_graph(self):
+        child = Nginx()
+        parent = Nginx()
+        parent.add_link('child', child, internal=True)
+        parent.start()
+        try:
+            self.assertIsNotNone(child.get_container())
+            self.assertFalse(parent.should_start())
+            links = self.daemon.find_container(parent.get_container()).host_config['Links']
+            self.assertEqual(len(links), 1)
+        finally:
+            parent.destroy()
+        self.assertIsNone(child.get_container())
+        self.assertIsNone(parent.get_container())
+
+    def test_finalizer_removes_linked_graph(self):
+        child = Nginx()
+        parent = Nginx()
+        parent.add_link('child', child, internal=True)
+        parent.start()
+        containers = parent.get_container(), child.get_container()
+        del parent, child
+        gc.collect()
+        self.assertFalse(self.running(containers[0]))
+        self.assertFalse(self.running(containers[1]))
+
+    def test_link_not_created(self):
+        parent = Nginx()
+        parent.add_link('other', Nginx())
+        self.assertRaises(RuntimeError, parent.start)
+        self.assertIsNone(parent.get_container())
+
+if __name__ == '__main__':
+    unittest.main()
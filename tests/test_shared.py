@@ -0,0 +1,87 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from .test_reaper import dead_pid
+from dockerobject import locks
+from dockerobject.db import Postgres
+from dockerobject.locks import read_json, write_json
+from dockerobject.shared import SharedServer, in_use
+import os
+import shutil
+import tempfile
+import unittest
+
+class SharedServerTest(DaemonTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved, locks.STATE_DIR = locks.STATE_DIR, self.directory
+        super(SharedServerTest, self).setUp()
+        self.server = SharedServer(Postgres)
+
+    def tearDown(self):
+        self.server.close()
+        super(SharedServerTest, self).tearDown()
+        locks.STATE_DIR = self.saved
+        shutil.rmtree(self.directory)
+
+    def users(self):
+        return read_json(self.server.path, {}).get('users', {})
+
+    def test_last_release_removes_server(self):
+        first = self.server.lease()
+        second = self.server.lease()
+        container = first.obj.get_container()
+        self.assertEqual(second.obj.get_container(), container)
+        self.assertNotEqual(first.obj.get_db(), second.obj.get_db())
+        self.assertEqual(sorted(self.users()[str(os.getpid())]), sorted([first.obj.get_db(), second.obj.get_db()]))
+        self.assertTrue(in_use(self.server.key))
+
+        first.release()
+        self.assertTrue(self.running(container))
+        self.assertEqual(self.users()[str(os.getpid())], [second.obj.get_db()])
+
+        second.release()
+        self.assertIsNone(self.daemon.find_container(container))
+        self.assertFalse(os.path.exists(self.server.path))
+        self.assertFalse(in_use(self.server.key))
+
+    def test_dead_users_are_dropped(self):
+        lease = self.server.lease()
+        container = lease.obj.get_container()
+        entry = read_json(self.server.path, {})
+        entry['users'][str(dead_pid())] = ['w1_dead']
+        write_json(self.server.path, entry)
+
+        other = self.server.lease()
+        self.assertEqual(list(self.users()), [str(os.getpid())])
+        lease.release()
+        other.release()
+        # the dead process does not keep the server alive
+        self.assertIsNone(self.daemon.find_container(container))
+
+    def test_gone_server_is_replaced(self):
+        lease = self.server.lease()
+        container = lease.obj.get_container()
+        lease.obj.client.remove_container(container=container, force=True)
+        other = self.server.lease()
+        self.assertNotEqual(other.obj.get_container(), container)
+        self.assertEqual(len(self.users()[str(os.getpid())]), 1)
+        other.release()
+        lease.release()
+        self.assertFalse(os.path.exists(self.server.path))
+
+if __name__ == '__main__':
+    unittest.main()
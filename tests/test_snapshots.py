@@ -0,0 +1,48 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.web import Nginx
+from docker.errors import APIError
+import unittest
+
+class SnapshotTest(DaemonTestCase):
+
+    def test_in_use_image_conflict(self):
+        obj = Nginx()
+        obj.start()
+        try:
+            with self.assertRaises(APIError) as e:
+                obj.client.remove_image(image='nginx', force=True)
+            self.assertEqual(e.exception.response.status_code, 409)
+        finally:
+            obj.destroy()
+
+    def test_snapshot_again_after_restore(self):
+        obj = Nginx()
+        obj.start()
+        obj.snapshot('clean')
+        first = obj.snapshots['clean']
+        obj.restore('clean')
+        # the container runs the first snapshot, which must not be removed
+        obj.snapshot('clean')
+        self.assertNotEqual(obj.snapshots['clean'], first)
+        self.assertIsNotNone(self.daemon.find_image(first)[1])
+        obj.restore('clean')
+        obj.destroy()
+        self.assertIsNone(self.daemon.find_image(first)[1])
+        self.assertEqual(obj.snapshots, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.streams import ExecStream, demux, tail_logs, STDOUT, STDERR
+from dockerobject.web import Nginx
+import io
+import socket
+import struct
+import unittest
+
+def frame(stream, data):
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+class FakeExecClient(object):
+    """
+    exec api of a command that writes output and is still running for a few inspects after it closed it.
+    """
+
+    def __init__(self, output, exit_code, running = 2):
+        self.sock, self.peer = socket.socketpair()
+        self.peer.sendall(output)
+        self.peer.close()
+        self.result = exit_code
+        self.running = running
+        self.inspects = 0
+
+    def exec_create(self, container, cmd, stdin, stdout, stderr):
+        return 'exec'
+
+    def exec_start(self, exec_id, socket):
+        return self.sock
+
+    def exec_inspect(self, exec_id):
+        self.inspects += 1
+        if self.inspects <= self.running:
+            return {'Running' : True, 'ExitCode' : None}
+        return {'Running' : False, 'ExitCode' : self.result}
+
+class ExecStreamTest(unittest.TestCase):
+
+    def test_wait_polls_exit_code(self):
+        client = FakeExecClient(frame(STDOUT, b'out') + frame(STDERR, b'err'), 3)
+        stream = ExecStream(client, 'container', ['true'])
+        self.assertEqual(b''.join(stream.stdout()), b'out')
+        self.assertEqual(stream.stderr, b'err')
+        self.assertEqual(stream.exit_code(), 3)
+        self.assertEqual(client.inspects, 3)
+
+    def test_exit_code_timeout(self):
+        client = FakeExecClient(b'', 0, running=1000)
+        stream = ExecStream(client, 'container', ['true'])
+        self.assertRaises(RuntimeError, stream.exit_code, 0.05)
+        stream.close()
+
+class DemuxTest(unittest.TestCase):
+
+    def test_frames(self):
+        data = frame(STDOUT, b'a' * 10) + frame(STDERR, b'b')
+        chunks = list(demux(None, io.BytesIO(data).read))
+        self.assertEqual(chunks, [(STDOUT, b'a' * 10), (STDERR, b'b')])
+
+    def test_tail_logs(self):
+        chunks = [(STDOUT, b'%d' % i) for i in range(10)]
+        self.assertEqual(tail_logs(chunks, limit=3), b'789')
+
+def emulate(container, command, stdin):
+    # a few commands on top of the ones the fake daemon knows
+    if command[0] == 'cat':
+        return 0, stdin, b''
+    if command[0] == 'output':
+        return int(command[1]), b'o' * int(command[2]), b'e' * int(command[3])
+    return None
+
+class DaemonExecTest(DaemonTestCase):
+    daemon_options = {'exec_handler' : emulate}
+
+    def setUp(self):
+        super(DaemonExecTest, self).setUp()
+        self.obj = Nginx()
+        self.obj.start()
+
+    def tearDown(self):
+        self.obj.destroy()
+        super(DaemonExecTest, self).tearDown()
+
+    def test_demux_frames(self):
+        stream = self.obj.exec_stream(['output', '0', '200000', '10'])
+        self.assertEqual(b''.join(stream.stdout()), b'o' * 200000)
+        self.assertEqual(stream.stderr, b'e' * 10)
+
+    def test_feed_stdin(self):
+        stream = self.obj.exec_stream(['cat'], stdin=True)
+        stream.feed([b'a' * 100000, b'b'])
+        self.assertEqual(b''.join(stream.stdout()), b'a' * 100000 + b'b')
+        self.assertEqual(stream.exit_code(), 0)
+
+    def test_feed_error(self):
+        def source():
+            yield b'partial'
+            raise IOError('source failed')
+        stream = self.obj.exec_stream(['cat'], stdin=True)
+        stream.feed(source())
+        # the command saw a short input and succeeded, the error of the source is what failed
+        self.assertRaises(IOError, stream.wait)
+
+    def test_exit_code(self):
+        # the fake daemon reports the exit code a moment after the output ended
+        self.assertEqual(self.obj.exec_stream(['output', '3', '1', '0']).wait(), 3)
+        self.assertEqual(self.obj.execute(['output', '4', '2', '0']), (4, b'oo'))
+        self.assertEqual(self.obj.execute(['missing'])[0], 127)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#   Copyright 2015 Intigua
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from .daemon import DaemonTestCase
+from dockerobject.aio import AsyncNginx
+from dockerobject.web import Nginx
+import asyncio
+import time
+import unittest
+
+class WaitForServerTest(DaemonTestCase):
+
+    daemon_options = {'ready_delay' : 30}
+
+    def test_readiness_timeout(self):
+        obj = Nginx()
+        obj.readiness_timeout = 0.2
+        obj.start(wait=False)
+        try:
+            start = time.time()
+            self.assertRaises(RuntimeError, obj.wait_for_sever)
+            self.assertLess(time.time() - start, 5)
+        finally:
+            obj.destroy()
+
+    def test_async_readiness_timeout(self):
+        obj = AsyncNginx()
+        obj.obj.readiness_timeout = 0.2
+
+        async def run():
+            await obj.start(wait=False)
+            try:
+                start = time.time()
+                with self.assertRaises(RuntimeError):
+                    await obj.wait_for_sever()
+                return time.time() - start
+            finally:
+                await obj.destroy()
+
+        self.assertLess(asyncio.run(run()), 5)
+
+if __name__ == '__main__':
+    unittest.main()